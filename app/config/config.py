@@ -30,6 +30,101 @@ class Config:
     RAG_CHUNK_SIZE = int(os.environ.get("RAG_CHUNK_SIZE", 10000))
     RAG_CHUNK_OVERLAP = int(os.environ.get("RAG_CHUNK_OVERLAP", 1000))
 
+    # Troceado por caracteres (por defecto) o por presupuesto de tokens de tiktoken
+    RAG_CHUNKING_MODE = os.environ.get("RAG_CHUNKING_MODE", "characters")
+    RAG_CHUNK_TOKENS = int(os.environ.get("RAG_CHUNK_TOKENS", 1024))
+    RAG_CHUNK_OVERLAP_TOKENS = int(os.environ.get("RAG_CHUNK_OVERLAP_TOKENS", 128))
+
+    # Embeddings por lotes: tamaño de lote, workers concurrentes y reintentos ante 429
+    RAG_EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", 32))
+    RAG_EMBED_MAX_WORKERS = int(os.environ.get("RAG_EMBED_MAX_WORKERS", 4))
+    RAG_EMBED_MAX_RETRIES = int(os.environ.get("RAG_EMBED_MAX_RETRIES", 5))
+
+    # Caché persistente de embeddings (clave: modelo + SHA-256 del chunk)
+    RAG_EMBEDDING_CACHE_ENABLED = (
+        os.environ.get("RAG_EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    )
+    RAG_EMBEDDING_CACHE_PATH = os.environ.get("RAG_EMBEDDING_CACHE_PATH") or None
+    RAG_EMBEDDING_CACHE_MAX_ENTRIES = int(
+        os.environ.get("RAG_EMBEDDING_CACHE_MAX_ENTRIES", 100000)
+    )
+
+    # Extracción de texto multiproceso (0 = un proceso por núcleo)
+    RAG_EXTRACTION_WORKERS = int(os.environ.get("RAG_EXTRACTION_WORKERS", 0))
+    RAG_PDF_PAGES_PER_TASK = int(os.environ.get("RAG_PDF_PAGES_PER_TASK", 16))
+
+    # Ingesta en streaming: chunks pendientes de embeber que se retienen en memoria
+    RAG_INGEST_WINDOW_CHUNKS = int(os.environ.get("RAG_INGEST_WINDOW_CHUNKS", 256))
+
+    # Ingesta en segundo plano: POST /ingest devuelve un job_id (wait=true para esperar)
+    RAG_INGEST_ASYNC = os.environ.get("RAG_INGEST_ASYNC", "True").lower() == "true"
+    RAG_INGEST_JOB_WORKERS = int(os.environ.get("RAG_INGEST_JOB_WORKERS", 1))
+    RAG_INGEST_JOB_QUEUE_SIZE = int(os.environ.get("RAG_INGEST_JOB_QUEUE_SIZE", 32))
+
+    # Persistencia por segmentos: confirmaciones en el log antes de compactar
+    RAG_COMPACTION_LOG_ENTRIES = int(os.environ.get("RAG_COMPACTION_LOG_ENTRIES", 16))
+
+    # Índice del checkpoint base: flat (exacto), ivf, hnsw o ivfpq (aproximados)
+    RAG_INDEX_TYPE = os.environ.get("RAG_INDEX_TYPE", "flat")
+    RAG_IVF_NLIST = int(os.environ.get("RAG_IVF_NLIST", 0))  # 0 = automático
+    RAG_IVF_NPROBE = int(os.environ.get("RAG_IVF_NPROBE", 8))
+    RAG_HNSW_M = int(os.environ.get("RAG_HNSW_M", 32))
+    RAG_HNSW_EF_CONSTRUCTION = int(os.environ.get("RAG_HNSW_EF_CONSTRUCTION", 200))
+    RAG_HNSW_EF_SEARCH = int(os.environ.get("RAG_HNSW_EF_SEARCH", 64))
+    RAG_PQ_M = int(os.environ.get("RAG_PQ_M", 16))
+    RAG_PQ_BITS = int(os.environ.get("RAG_PQ_BITS", 8))
+
+    # Recuperación: vector (embeddings), lexical (BM25) o hybrid (fusión RRF)
+    RAG_SEARCH_MODE = os.environ.get("RAG_SEARCH_MODE", "vector")
+    RAG_RRF_K = int(os.environ.get("RAG_RRF_K", 60))
+
+    # Cachés en memoria de consultas (tamaño 0 = desactivada; TTL en segundos)
+    RAG_QUERY_CACHE_SIZE = int(os.environ.get("RAG_QUERY_CACHE_SIZE", 1024))
+    RAG_QUERY_CACHE_TTL = float(os.environ.get("RAG_QUERY_CACHE_TTL", 3600))
+    RAG_RESULT_CACHE_SIZE = int(os.environ.get("RAG_RESULT_CACHE_SIZE", 1024))
+    RAG_RESULT_CACHE_TTL = float(os.environ.get("RAG_RESULT_CACHE_TTL", 300))
+
+    # Caché semántica de respuestas: misma selección de chunks y similitud coseno >= umbral
+    RAG_ANSWER_CACHE_SIZE = int(os.environ.get("RAG_ANSWER_CACHE_SIZE", 512))
+    RAG_ANSWER_CACHE_TTL = float(os.environ.get("RAG_ANSWER_CACHE_TTL", 3600))
+    RAG_ANSWER_CACHE_THRESHOLD = float(os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", 0.92))
+
+    # Tokens máximos de contexto enviados al LLM (0 = chunks completos)
+    RAG_CONTEXT_TOKEN_BUDGET = int(os.environ.get("RAG_CONTEXT_TOKEN_BUDGET", 4000))
+
+    # Re-ranking entre FAISS y el LLM: none, lexical (BM25) o cross-encoder (CPU)
+    RAG_RERANK_METHOD = os.environ.get("RAG_RERANK_METHOD", "none")
+    RAG_RERANK_MODEL = os.environ.get(
+        "RAG_RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2"
+    )
+    RAG_RERANK_FETCH_FACTOR = int(os.environ.get("RAG_RERANK_FETCH_FACTOR", 3))
+    RAG_RERANK_MAX_CANDIDATES = int(os.environ.get("RAG_RERANK_MAX_CANDIDATES", 30))
+    RAG_RERANK_TIMEOUT_MS = float(os.environ.get("RAG_RERANK_TIMEOUT_MS", 300))
+
+    # Consultas máximas por petición a /search/batch
+    RAG_SEARCH_BATCH_MAX_QUERIES = int(os.environ.get("RAG_SEARCH_BATCH_MAX_QUERIES", 256))
+
+    # Enriquecimiento de riesgo (Paso 2): consultas de recuperación en paralelo
+    RISK_ENRICH_MAX_WORKERS = int(os.environ.get("RISK_ENRICH_MAX_WORKERS", 8))
+    RISK_ENRICH_QUERY_TIMEOUT = float(os.environ.get("RISK_ENRICH_QUERY_TIMEOUT", 10))
+    # Una sola búsqueda multi-consulta si el cliente vectorial ofrece search_batch
+    RISK_ENRICH_BATCH_RETRIEVAL = (
+        os.environ.get("RISK_ENRICH_BATCH_RETRIEVAL", "True").lower() == "true"
+    )
+    # Caché persistente por químico (clave: químico/CAS + país + versión del corpus)
+    RISK_ENRICH_CACHE_ENABLED = (
+        os.environ.get("RISK_ENRICH_CACHE_ENABLED", "True").lower() == "true"
+    )
+    RISK_ENRICH_CACHE_PATH = os.environ.get(
+        "RISK_ENRICH_CACHE_PATH", "risk_enrichment_cache.sqlite3"
+    )
+    RISK_ENRICH_CACHE_MAX_ENTRIES = int(os.environ.get("RISK_ENRICH_CACHE_MAX_ENTRIES", 5000))
+    RISK_ENRICH_CACHE_TTL = float(os.environ.get("RISK_ENRICH_CACHE_TTL", 86400))
+    # Síntesis: por_quimico (llamadas concurrentes, una por químico + legal) | unica
+    RISK_ENRICH_SYNTHESIS_MODE = os.environ.get("RISK_ENRICH_SYNTHESIS_MODE", "por_quimico")
+    RISK_ENRICH_SYNTHESIS_WORKERS = int(os.environ.get("RISK_ENRICH_SYNTHESIS_WORKERS", 8))
+    RISK_ENRICH_SYNTHESIS_RETRIES = int(os.environ.get("RISK_ENRICH_SYNTHESIS_RETRIES", 1))
+
     # Configuración de archivos
     MAX_CONTENT_LENGTH = int(
         os.environ.get("MAX_CONTENT_LENGTH", 16 * 1024 * 1024)
@@ -104,6 +104,8 @@ def evaluate_risk_complete():
                     "quimicos_procesados": enrichment_result.get("quimicos_procesados", []),
                     "objetivos_fds_buscados": len(risk_enricher.OBJETIVOS_DATOS_FDS),
                     "objetivos_legales_buscados": len(risk_enricher.OBJETIVOS_DATOS_LEGALES),
+                    "metricas_recuperacion": enrichment_result.get("metricas_recuperacion"),
+                    "metricas_sintesis": enrichment_result.get("metricas_sintesis"),
                     "datos_enriquecidos": enrichment_result["datos_enriquecidos"]
                 },
                 "paso_3_calculo": calculation_result,
@@ -1,10 +1,14 @@
 import os
+import json
 import tempfile
+import time
 import logging
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, jsonify, request, stream_with_context, url_for
 from werkzeug.utils import secure_filename
 
+from app.config.config import Config
 from app.models.rag_faiss_model import rag_faiss_model
+from app.services.ingestion_jobs import IngestionJobQueue, QueueFullError
 
 
 logger = logging.getLogger(__name__)
@@ -16,12 +20,32 @@ rag_faiss_bp = Blueprint("rag_faiss", __name__)
 ALLOWED_EXTENSIONS = {"pdf", "docx", "txt", "md"}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB
 
+# Cola de ingestas en segundo plano (concurrencia acotada para no frenar las consultas)
+ingestion_jobs = IngestionJobQueue(
+    max_workers=Config.RAG_INGEST_JOB_WORKERS,
+    max_pending=Config.RAG_INGEST_JOB_QUEUE_SIZE,
+)
+
 
 def allowed_file(filename):
     """Verificar si el archivo tiene una extensión permitida"""
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
+def parse_bool(value, default: bool = True) -> bool:
+    """Interpretar un flag booleano recibido por formulario o JSON"""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "si", "sí")
+
+
+def format_sse(event: str, data) -> str:
+    """Serializar un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
 def validate_file_size(file):
     """Validar el tamaño del archivo"""
     if hasattr(file, "content_length") and file.content_length:
@@ -29,6 +53,69 @@ def validate_file_size(file):
     return True
 
 
+# Campos de metadatos aceptados en los formularios de ingesta
+FORM_METADATA_FIELDS = [
+    "title",
+    "author",
+    "category",
+    "document_type",
+    "language",
+    "version",
+    "creation_date",
+    "expiry_date",
+    "department",
+    "classification",
+    "chemical_names",
+    "safety_level",
+    "regulatory_compliance",
+    "facility",
+    "process_area",
+    "country",
+]
+
+
+def extract_form_metadata():
+    """Extraer los metadatos del documento enviados en el formulario"""
+    metadata = {}
+    for field in FORM_METADATA_FIELDS:
+        if request.form.get(field):
+            metadata[field] = request.form.get(field)
+    return metadata
+
+
+def format_search_results(docs):
+    """Formatear los chunks recuperados para la respuesta JSON"""
+    return [
+        {
+            "content": doc.page_content,
+            "metadata": doc.metadata,
+            "source": doc.metadata.get("source", "Desconocido"),
+            "document_id": doc.metadata.get("document_id", ""),
+            "chunk_index": doc.metadata.get("chunk_index", 0),
+        }
+        for doc in docs
+    ]
+
+
+def save_temp_file(file):
+    """Guardar un archivo subido en un directorio temporal"""
+    filename = secure_filename(file.filename)
+    temp_dir = tempfile.mkdtemp()
+    temp_path = os.path.join(temp_dir, filename)
+    file.save(temp_path)
+    return temp_path, temp_dir
+
+
+def cleanup_temp_files(temp_files):
+    """Eliminar archivos temporales y sus directorios"""
+    for temp_path, temp_dir in temp_files:
+        try:
+            os.remove(temp_path)
+            os.rmdir(temp_dir)
+        except OSError:
+            pass
+
+
 @rag_faiss_bp.route("/")
 def rag_faiss_home():
     """Información de los endpoints RAG FAISS disponibles"""
@@ -38,9 +125,15 @@ def rag_faiss_home():
             "version": "1.0.0",
             "engine": "FAISS + LangChain + Google Generative AI",
             "endpoints": [
-                "POST /api/rag-faiss/ingest - Ingestar documentos",
-                "POST /api/rag-faiss/query - Consulta con RAG",
-                "POST /api/rag-faiss/search - Búsqueda de documentos",
+                "POST /api/rag-faiss/ingest - Ingestar documentos (devuelve job_id)",
+                "GET  /api/rag-faiss/jobs - Trabajos de ingesta recientes",
+                "GET  /api/rag-faiss/jobs/<id> - Estado y etapas de un trabajo",
+                "POST /api/rag-faiss/query - Consulta con RAG (filters opcional)",
+                "POST /api/rag-faiss/query/stream - Consulta con RAG en streaming (SSE)",
+                "POST /api/rag-faiss/search - Búsqueda de documentos (filters opcional)",
+                "POST /api/rag-faiss/search/batch - Varias búsquedas en una petición",
+                "PUT  /api/rag-faiss/documents/<id> - Reemplazar un documento",
+                "DELETE /api/rag-faiss/documents/<id> - Eliminar un documento",
                 "GET  /api/rag-faiss/stats - Estadísticas del sistema",
                 "GET  /api/rag-faiss/health - Estado del sistema",
             ],
@@ -72,34 +165,12 @@ def ingest_documents():
             )
 
         # Metadatos adicionales
-        metadata = {}
-
-        # Metadatos básicos
-        form_metadata_fields = [
-            "title",
-            "author",
-            "category",
-            "document_type",
-            "language",
-            "version",
-            "creation_date",
-            "expiry_date",
-            "department",
-            "classification",
-            "chemical_names",
-            "safety_level",
-            "regulatory_compliance",
-            "facility",
-            "process_area",
-        ]
-
-        for field in form_metadata_fields:
-            if request.form.get(field):
-                metadata[field] = request.form.get(field)
+        metadata = extract_form_metadata()
 
         # Procesar archivos
         temp_files = []
         file_paths = []
+        handed_off = False
 
         try:
             for file in files:
@@ -131,11 +202,7 @@ def ingest_documents():
                     )
 
                 # Guardar archivo temporal
-                filename = secure_filename(file.filename)
-                temp_dir = tempfile.mkdtemp()
-                temp_path = os.path.join(temp_dir, filename)
-
-                file.save(temp_path)
+                temp_path, temp_dir = save_temp_file(file)
                 temp_files.append((temp_path, temp_dir))
                 file_paths.append(temp_path)
 
@@ -151,24 +218,77 @@ def ingest_documents():
                 )
 
             # Procesar documentos con el modelo FAISS
-            result = rag_faiss_model.process_documents(file_paths, metadata)
+            use_cache = parse_bool(request.form.get("use_cache"))
+            force = parse_bool(request.form.get("force"), default=False)
+            wait = parse_bool(request.form.get("wait"), default=not Config.RAG_INGEST_ASYNC)
 
-            return jsonify(result)
+            if wait:
+                result = rag_faiss_model.process_documents(
+                    file_paths, metadata, use_cache=use_cache, force=force
+                )
+                return jsonify(result)
+
+            # Ingesta en segundo plano: los temporales se borran al terminar el trabajo
+            job = ingestion_jobs.submit(
+                lambda job: rag_faiss_model.process_documents(
+                    file_paths, metadata, use_cache=use_cache, force=force, tracker=job
+                ),
+                description={
+                    "files": [os.path.basename(path) for path in file_paths],
+                    "force": force,
+                },
+                on_finish=lambda: cleanup_temp_files(temp_files),
+            )
+            handed_off = True
+
+            return (
+                jsonify(
+                    {
+                        "status": "accepted",
+                        "job_id": job.job_id,
+                        "status_url": url_for("rag_faiss.get_job", job_id=job.job_id),
+                    }
+                ),
+                202,
+            )
+
+        except QueueFullError as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
 
         finally:
-            # Limpiar archivos temporales
-            for temp_path, temp_dir in temp_files:
-                try:
-                    os.remove(temp_path)
-                    os.rmdir(temp_dir)
-                except OSError:
-                    pass
+            # Limpiar archivos temporales (salvo que los use un trabajo encolado)
+            if not handed_off:
+                cleanup_temp_files(temp_files)
 
     except Exception as e:
         logger.error(f"Error en ingestión de documentos: {str(e)}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@rag_faiss_bp.route("/jobs", methods=["GET"])
+def list_jobs():
+    """Listar los trabajos de ingesta recientes"""
+    return jsonify(
+        {
+            "status": "success",
+            "queue": ingestion_jobs.get_stats(),
+            "jobs": ingestion_jobs.list_jobs(),
+        }
+    )
+
+
+@rag_faiss_bp.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Estado, progreso y tiempos por etapa de un trabajo de ingesta"""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        return (
+            jsonify({"status": "error", "message": f"Trabajo no encontrado: {job_id}"}),
+            404,
+        )
+    return jsonify({"status": "success", "job": job.to_dict()})
+
+
 @rag_faiss_bp.route("/query", methods=["POST"])
 def query_documents():
     """Realizar consulta RAG"""
@@ -190,8 +310,14 @@ def query_documents():
             )
 
         k = request_data.get("k", 4)  # Número de documentos a recuperar
-
-        result = rag_faiss_model.answer_question(question, k=k)
+        filters = request_data.get("filters")
+        mode = request_data.get("mode")  # vector | lexical | hybrid
+        use_cache = parse_bool(request_data.get("use_cache"))
+        rerank = request_data.get("rerank")  # none | lexical | cross-encoder | bool
+
+        result = rag_faiss_model.answer_question(
+            question, k=k, filters=filters, mode=mode, use_cache=use_cache, rerank=rerank
+        )
         return jsonify(result)
 
     except Exception as e:
@@ -199,6 +325,50 @@ def query_documents():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@rag_faiss_bp.route("/query/stream", methods=["POST"])
+def stream_query():
+    """Consulta RAG en streaming: fuentes, fragmentos de la respuesta y resumen (SSE)"""
+    request_started = time.perf_counter()
+    request_data = request.get_json(silent=True)
+    if not request_data:
+        return (
+            jsonify({"status": "error", "message": "No se proporcionaron datos"}),
+            400,
+        )
+
+    question = request_data.get("question", "")
+    if not question:
+        return (
+            jsonify({"status": "error", "message": "La pregunta no puede estar vacía"}),
+            400,
+        )
+
+    events = rag_faiss_model.stream_answer(
+        question,
+        k=request_data.get("k", 4),
+        filters=request_data.get("filters"),
+        mode=request_data.get("mode"),
+        use_cache=parse_bool(request_data.get("use_cache")),
+        rerank=request_data.get("rerank"),
+    )
+
+    def generate():
+        ttfb_ms = None
+        for event, data in events:
+            if ttfb_ms is None:
+                # Primer evento enviado: tiempo hasta el primer byte del cuerpo
+                ttfb_ms = round((time.perf_counter() - request_started) * 1000, 2)
+            if event == "done":
+                data["timings"]["ttfb_ms"] = ttfb_ms
+            yield format_sse(event, data)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @rag_faiss_bp.route("/search", methods=["POST"])
 def search_documents():
     """Buscar documentos similares"""
@@ -220,29 +390,26 @@ def search_documents():
             )
 
         k = request_data.get("k", 4)
+        use_cache = parse_bool(request_data.get("use_cache"))
+        filters = request_data.get("filters")
+        mode = request_data.get("mode") or rag_faiss_model.search_mode
 
         try:
-            docs = rag_faiss_model.search_documents(query, k=k)
-
-            # Formatear resultados
-            results = []
-            for doc in docs:
-                result_item = {
-                    "content": doc.page_content,
-                    "metadata": doc.metadata,
-                    "source": doc.metadata.get("source", "Desconocido"),
-                    "document_id": doc.metadata.get("document_id", ""),
-                    "chunk_index": doc.metadata.get("chunk_index", 0),
-                }
-                results.append(result_item)
+            docs = rag_faiss_model.search_documents(
+                query, k=k, use_cache=use_cache, filters=filters, mode=mode
+            )
+
+            results = format_search_results(docs)
 
             return jsonify(
                 {
                     "status": "success",
                     "query": query,
+                    "filters": filters or {},
+                    "mode": mode,
                     "results": results,
                     "total_results": len(results),
-                    "searched_at": rag_faiss_model.documents_metadata,
+                    "searched_at": rag_faiss_model.public_documents_metadata(),
                 }
             )
 
@@ -254,11 +421,161 @@ def search_documents():
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+@rag_faiss_bp.route("/search/batch", methods=["POST"])
+def search_documents_batch():
+    """Buscar varias consultas con un único embedding por lotes y una búsqueda vectorizada"""
+    try:
+        request_data = request.get_json()
+        if not request_data:
+            return (
+                jsonify({"status": "error", "message": "No se proporcionaron datos"}),
+                400,
+            )
+
+        queries = request_data.get("queries")
+        if (
+            not isinstance(queries, list)
+            or not queries
+            or not all(isinstance(query, str) and query.strip() for query in queries)
+        ):
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": "queries debe ser una lista de consultas no vacías",
+                    }
+                ),
+                400,
+            )
+        if len(queries) > Config.RAG_SEARCH_BATCH_MAX_QUERIES:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"Máximo {Config.RAG_SEARCH_BATCH_MAX_QUERIES} consultas por lote",
+                    }
+                ),
+                400,
+            )
+
+        k = request_data.get("k", 4)
+        use_cache = parse_bool(request_data.get("use_cache"))
+        filters = request_data.get("filters")
+        mode = request_data.get("mode") or rag_faiss_model.search_mode
+
+        try:
+            batches = rag_faiss_model.search_batch(
+                queries, k=k, filters=filters, mode=mode, use_cache=use_cache
+            )
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        return jsonify(
+            {
+                "status": "success",
+                "filters": filters or {},
+                "mode": mode,
+                "results": [
+                    {
+                        "query": query,
+                        "results": format_search_results(docs),
+                        "total_results": len(docs),
+                    }
+                    for query, docs in zip(queries, batches)
+                ],
+                "total_queries": len(queries),
+            }
+        )
+
+    except Exception as e:
+        logger.error(f"Error en búsqueda por lotes: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@rag_faiss_bp.route("/documents/<document_id>", methods=["DELETE"])
+def delete_document(document_id):
+    """Eliminar un documento y sus vectores del índice"""
+    try:
+        if document_id not in rag_faiss_model.documents_metadata:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"Documento no encontrado: {document_id}",
+                    }
+                ),
+                404,
+            )
+
+        result = rag_faiss_model.delete_document(document_id)
+        return jsonify(result)
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except Exception as e:
+        logger.error(f"Error eliminando documento: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
+@rag_faiss_bp.route("/documents/<document_id>", methods=["PUT"])
+def replace_document(document_id):
+    """Reemplazar un documento por una nueva versión del archivo"""
+    try:
+        if document_id not in rag_faiss_model.documents_metadata:
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"Documento no encontrado: {document_id}",
+                    }
+                ),
+                404,
+            )
+
+        file = request.files.get("file") or request.files.get("files")
+        if file is None or file.filename == "":
+            return (
+                jsonify({"status": "error", "message": "No se proporcionó archivo"}),
+                400,
+            )
+
+        if not allowed_file(file.filename):
+            return (
+                jsonify(
+                    {
+                        "status": "error",
+                        "message": f"Tipo de archivo no permitido: {file.filename}. Formatos soportados: {', '.join(ALLOWED_EXTENSIONS)}",
+                    }
+                ),
+                400,
+            )
+
+        # Sin metadatos en el formulario se conservan los del documento original
+        metadata = extract_form_metadata() or None
+        use_cache = parse_bool(request.form.get("use_cache"))
+
+        temp_files = [save_temp_file(file)]
+        try:
+            result = rag_faiss_model.replace_document(
+                document_id, temp_files[0][0], metadata, use_cache=use_cache
+            )
+            return jsonify(result)
+        finally:
+            cleanup_temp_files(temp_files)
+
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error reemplazando documento: {str(e)}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+
 @rag_faiss_bp.route("/stats", methods=["GET"])
 def get_stats():
     """Obtener estadísticas del sistema RAG FAISS"""
     try:
         stats = rag_faiss_model.get_stats()
+        stats["ingestion_jobs"] = ingestion_jobs.get_stats()
         return jsonify(stats)
     except Exception as e:
         logger.error(f"Error obteniendo estadísticas: {str(e)}")
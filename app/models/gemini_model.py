@@ -26,8 +26,9 @@ class GeminiModel:
         
         self.chat_sessions = {}  # Almacenar sesiones de chat
     
-    def generate_text(self, prompt: str, system_instruction: Optional[str] = None) -> Dict[str, Any]:
-        """Generar texto usando Gemini"""
+    def generate_text(self, prompt: str, system_instruction: Optional[str] = None,
+                      temperature: Optional[float] = None) -> Dict[str, Any]:
+        """Generar texto usando Gemini (temperature sustituye a la configurada)"""
         if not self.client:
             return {
                 "status": "error",
@@ -38,7 +39,7 @@ class GeminiModel:
         try:
             config = types.GenerateContentConfig(
                 max_output_tokens=self.max_tokens,
-                temperature=self.temperature
+                temperature=temperature if temperature is not None else self.temperature
             )
             
             if system_instruction:
@@ -58,7 +59,7 @@ class GeminiModel:
                 "timestamp": datetime.now().isoformat(),
                 "model": self.model_name,
                 "config": {
-                    "temperature": self.temperature,
+                    "temperature": config.temperature,
                     "max_tokens": self.max_tokens
                 }
             }
@@ -1,21 +1,22 @@
 import os
+import shutil
 import tempfile
+import threading
+import time
 import logging
-from typing import List, Dict, Any, Optional, Union
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Union
 from datetime import datetime
 import hashlib
+import sqlite3
 
 # LangChain
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_community.vectorstores import FAISS
-from langchain.chains.question_answering import load_qa_chain
-from langchain.prompts import PromptTemplate
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
 
 # Document Processing
-from PyPDF2 import PdfReader
-from docx import Document as DocxDocument
 import tiktoken
 
 # Google Generative AI
@@ -25,11 +26,62 @@ from dotenv import load_dotenv
 # Utilities
 import json
 
+from app.config.config import Config
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.context_packer import ContextPacker
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_pipeline import (
+    EmbeddingPipeline,
+    ProgressCallback,
+    embed_queries,
+)
+from app.services.incremental_faiss import IncrementalFAISS
+from app.services.ingestion_jobs import StageTracker
+from app.services.lexical_index import LexicalIndex, fuse_rankings
+from app.services.metadata_index import MetadataIndex, parse_filters
+from app.services.qa_chain import QAChainProvider
+from app.services.reranker import DEFAULT_CROSS_ENCODER, Reranker
+from app.services.query_cache import TTLCache
+from app.services.segment_store import SegmentStore
+from app.services.streaming_chunker import StreamingChunker, peak_rss_mb
+from app.services.token_splitter import TokenTextSplitter
+from app.services.text_extraction import (
+    SUPPORTED_EXTENSIONS,
+    ParallelTextExtractor,
+    extract_docx,
+    extract_pdf_pages,
+    extract_txt,
+    hash_file,
+)
+
 # Load environment variables
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Metadatos de documentos confirmados junto al índice FAISS
+METADATA_FILE_NAME = "documents_metadata.json"
+# Campos de documents_metadata de uso interno que no se exponen en la API
+INTERNAL_DOCUMENT_FIELDS = ("chunk_ids",)
+
+# "characters": chunk_size en caracteres; "tokens": presupuesto en tokens de tiktoken
+CHUNKING_MODES = ("characters", "tokens")
+
+# "vector": embeddings; "lexical": BM25 sin llamada de embeddings; "hybrid": fusión RRF
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+# En modo híbrido cada lado aporta hasta k * este factor candidatos a la fusión
+HYBRID_FETCH_FACTOR = 4
+# Máximo de textos por petición de embeddings por lotes de la API de Gemini
+QUERY_EMBED_BATCH_SIZE = 100
+
+# (vector store, metadatos de documentos) publicados juntos para las búsquedas
+IndexState = Tuple[Optional[IncrementalFAISS], Dict[str, Any]]
+
+NO_DOCUMENTS_MESSAGE = (
+    "No hay documentos procesados. Por favor, sube y procesa archivos primero."
+)
+NO_RESULTS_MESSAGE = "No se encontraron documentos relevantes para la consulta."
+
 
 class RAGFAISSModel:
     """Modelo RAG usando FAISS y LangChain con Google Generative AI"""
@@ -42,6 +94,38 @@ class RAGFAISSModel:
         chunk_size: int = 10000,
         chunk_overlap: int = 1000,
         temperature: float = 0.3,
+        embeddings: Optional[Embeddings] = None,
+        embed_batch_size: int = 32,
+        embed_max_workers: int = 4,
+        embed_max_retries: int = 5,
+        use_embedding_cache: bool = True,
+        embedding_cache_path: Optional[str] = None,
+        embedding_cache_max_entries: int = 100000,
+        extraction_workers: Optional[int] = None,
+        pdf_pages_per_task: int = 16,
+        ingest_window_chunks: int = 256,
+        chunking_mode: str = "characters",
+        chunk_tokens: int = 1024,
+        chunk_overlap_tokens: int = 128,
+        compaction_log_entries: int = 16,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+        search_mode: str = "vector",
+        rrf_k: int = 60,
+        lexical_index_path: Optional[str] = None,
+        query_cache_size: int = 1024,
+        query_cache_ttl: float = 3600.0,
+        result_cache_size: int = 1024,
+        result_cache_ttl: float = 300.0,
+        answer_cache_size: int = 512,
+        answer_cache_ttl: float = 3600.0,
+        answer_cache_threshold: float = 0.92,
+        context_token_budget: int = 4000,
+        rerank_method: str = "none",
+        rerank_model: str = DEFAULT_CROSS_ENCODER,
+        rerank_fetch_factor: int = 3,
+        rerank_max_candidates: int = 30,
+        rerank_timeout_ms: float = 300.0,
     ):
         # Configurar Google Generative AI
         api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
@@ -58,198 +142,743 @@ class RAGFAISSModel:
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.temperature = temperature
+        self.ingest_window_chunks = max(1, ingest_window_chunks)
+
+        # Cadena QA y cliente de chat: se construyen una vez y se comparten entre peticiones
+        self.qa_chains = QAChainProvider(api_key)
 
-        # Inicializar componentes
-        self.embeddings = GoogleGenerativeAIEmbeddings(
+        # Inicializar componentes (se admite un embedder local para benchmarks)
+        self.embeddings = embeddings or GoogleGenerativeAIEmbeddings(
             model=embedding_model, google_api_key=api_key
         )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+
+        # Caché de embeddings en disco, direccionada por (modelo, SHA-256 del chunk)
+        self.embedding_cache = None
+        if use_embedding_cache:
+            self.embedding_cache = EmbeddingCache(
+                embedding_cache_path or f"{index_path}_embedding_cache.sqlite3",
+                max_entries=embedding_cache_max_entries,
+            )
+
+        self.embedding_pipeline = EmbeddingPipeline(
+            self.embeddings,
+            batch_size=embed_batch_size,
+            max_workers=embed_max_workers,
+            max_retries=embed_max_retries,
+            cache=self.embedding_cache,
+            model_name=embedding_model,
         )
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        if chunking_mode not in CHUNKING_MODES:
+            raise ValueError(
+                f"chunking_mode debe ser uno de {CHUNKING_MODES}: {chunking_mode}"
+            )
+        self.chunking_mode = chunking_mode
+        if chunking_mode == "tokens":
+            # chunk_size y chunk_overlap medidos en tokens del mismo tokenizer
+            self.text_splitter = TokenTextSplitter(
+                self.tokenizer,
+                chunk_size=chunk_tokens,
+                chunk_overlap=chunk_overlap_tokens,
+            )
+        else:
+            self.text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size, chunk_overlap=chunk_overlap
+            )
+        # Contexto del prompt: frases relevantes de los chunks hasta el presupuesto de tokens
+        self.context_packer = ContextPacker(
+            context_token_budget,
+            count_tokens=lambda texts: [
+                len(tokens) for tokens in self.tokenizer.encode_batch(texts)
+            ],
+        )
+        # Re-ranking opcional entre la recuperación y el LLM
+        self.reranker = Reranker(
+            rerank_method,
+            model_name=rerank_model,
+            fetch_factor=rerank_fetch_factor,
+            max_candidates=rerank_max_candidates,
+            timeout_ms=rerank_timeout_ms,
+        )
+        self.text_extractor = ParallelTextExtractor(
+            max_workers=extraction_workers, pages_per_task=pdf_pages_per_task
+        )
 
-        # Vector store (se carga cuando existe)
-        self.vector_store = None
-        self._load_vector_store()
+        # Serializa las escrituras sobre el índice y los metadatos
+        self._write_lock = threading.RLock()
 
-        # Metadatos de documentos
+        # Metadatos de documentos del formato legado (solo lectura, para migrar)
         self.metadata_file = f"{index_path}_metadata.json"
-        self.documents_metadata = self._load_metadata()
+
+        # Persistencia incremental: segmentos + log con manifiesto atómico
+        self.segment_store = SegmentStore(
+            index_path,
+            compaction_log_entries=compaction_log_entries,
+            index_type=index_type,
+            index_params=index_params,
+        )
+        self._compaction_lock = threading.Lock()
+
+        # Índice BM25 de los chunks (SQLite FTS5), sincronizado con cada confirmación
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"search_mode debe ser uno de {SEARCH_MODES}: {search_mode}")
+        self.search_mode = search_mode
+        self.rrf_k = rrf_k
+        try:
+            self.lexical_index = LexicalIndex(
+                lexical_index_path or f"{index_path}_lexical.sqlite3"
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Índice léxico no disponible (¿SQLite sin FTS5?): {str(e)}")
+            self.lexical_index = None
+
+        # Cachés en memoria: embeddings de consulta y resultados top-k. La clave de
+        # los resultados incluye la versión del índice, que sube con cada cambio
+        self.query_embedding_cache = TTLCache(query_cache_size, query_cache_ttl)
+        self.result_cache = TTLCache(result_cache_size, result_cache_ttl)
+        self._index_version = 0
+        # Respuestas del LLM reutilizables entre preguntas parecidas con el mismo contexto
+        self.answer_cache = SemanticAnswerCache(
+            answer_cache_size, answer_cache_ttl, answer_cache_threshold
+        )
+
+        # Vector store y metadatos (se cargan cuando existen), publicados juntos
+        # en una tupla que nunca se modifica: las búsquedas la leen una vez sin
+        # lock y las escrituras trabajan sobre una copia (ver _write_transaction)
+        self._state: IndexState = (None, {})
+        # (hilo escritor, copia de trabajo) mientras dura una escritura
+        self._working: Optional[Tuple[int, IndexState]] = None
+        self._load_vector_store()
+        self._rebuild_hash_indexes()
 
         logger.info(f"RAG FAISS Model inicializado con embedding: {embedding_model}")
 
+    def _current_state(self) -> IndexState:
+        """Copia de trabajo para el hilo que está escribiendo; el estado publicado para el resto"""
+        working = self._working
+        if working is not None and working[0] == threading.get_ident():
+            return working[1]
+        return self._state
+
+    @property
+    def vector_store(self) -> Optional[IncrementalFAISS]:
+        return self._current_state()[0]
+
+    @vector_store.setter
+    def vector_store(self, value: Optional[IncrementalFAISS]):
+        self._set_working((value, self.documents_metadata))
+
+    @property
+    def documents_metadata(self) -> Dict[str, Any]:
+        return self._current_state()[1]
+
+    def _set_working(self, state: IndexState):
+        if self._working is None or self._working[0] != threading.get_ident():
+            raise RuntimeError("El estado del índice solo se modifica dentro de _write_transaction")
+        self._working = (self._working[0], state)
+
+    @contextmanager
+    def _write_transaction(self):
+        """
+        Escritura copy-on-write del índice y los metadatos.
+
+        Bajo el lock de escritura se copian el vector store (fork) y el dict de
+        metadatos; el hilo escritor los modifica a través de vector_store y
+        documents_metadata, y al salir sin error se publican con una sola
+        asignación de _state. Las búsquedas siguen sobre el par anterior, que
+        no cambia; si hay una excepción la copia se descarta.
+        """
+        with self._write_lock:
+            vector_store, documents_metadata = self._state
+            working = (
+                vector_store.fork() if vector_store is not None else None,
+                dict(documents_metadata),
+            )
+            self._working = (threading.get_ident(), working)
+            try:
+                yield
+                self._state = self._working[1]
+            finally:
+                self._working = None
+
     def _load_vector_store(self):
-        """Cargar el vector store si existe"""
+        """Cargar el vector store y sus metadatos si existen"""
+        self._dirty_documents = set()
         try:
-            if os.path.exists(self.index_path):
-                self.vector_store = FAISS.load_local(
-                    self.index_path,
-                    self.embeddings,
-                    allow_dangerous_deserialization=True,
-                )
+            # Volver al último estado confirmado antes de leer nada
+            self._recover_interrupted_swap()
+            self.segment_store.recover()
+            if self.segment_store.exists():
+                self._state = self.segment_store.load(self.embeddings)
                 logger.info(f"Vector store cargado desde {self.index_path}")
+            elif os.path.exists(os.path.join(self.index_path, "index.faiss")):
+                self._state = self._migrate_legacy_index()
             else:
+                self._state = (None, self._load_metadata())
                 logger.info("No existe vector store previo")
+            self._sync_lexical_index()
         except Exception as e:
             logger.error(f"Error cargando vector store: {str(e)}")
-            self.vector_store = None
+            self._state = (None, self._load_metadata())
+        self._invalidate_results()
+        self.answer_cache.clear()
+
+    def _invalidate_results(self):
+        """Nueva versión del índice: los resultados cacheados dejan de valer"""
+        self._index_version += 1
+        self.result_cache.clear()
+
+    def _migrate_legacy_index(self) -> IndexState:
+        """Convertir un índice guardado con save_local al formato de segmentos"""
+        vector_store = IncrementalFAISS.load_local(
+            self.index_path,
+            self.embeddings,
+            allow_dangerous_deserialization=True,
+        )
+        vector_store.drain_changes()
+        with self._write_lock:
+            self.segment_store.checkpoint(vector_store, self._load_metadata())
+            state = self.segment_store.load(self.embeddings)
+        logger.info(f"Índice legado migrado al formato de segmentos en {self.index_path}")
+        return state
+
+    def _lexical_rows(self, chunk_ids: List[str]):
+        """(chunk_id, document_id, texto) de los chunks indicados, para el índice léxico"""
+        for chunk_id in chunk_ids:
+            doc = self.vector_store.docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                yield chunk_id, doc.metadata.get("document_id"), doc.page_content
+
+    def _sync_lexical_index(self):
+        """Reconstruir el índice léxico si no refleja la última confirmación"""
+        if self.lexical_index is None or self.lexical_index.seq == self.segment_store.seq:
+            return
+        chunk_ids = (
+            list(self.vector_store.index_to_docstore_id.values()) if self.vector_store else []
+        )
+        self.lexical_index.rebuild(self._lexical_rows(chunk_ids), self.segment_store.seq)
 
     def _load_metadata(self) -> Dict[str, Any]:
-        """Cargar metadatos de documentos"""
+        """Cargar metadatos de documentos del formato legado"""
         try:
-            if os.path.exists(self.metadata_file):
-                with open(self.metadata_file, "r", encoding="utf-8") as f:
-                    return json.load(f)
+            # Preferir la copia confirmada junto al índice; el archivo suelto es legado
+            committed_file = os.path.join(self.index_path, METADATA_FILE_NAME)
+            for path in (committed_file, self.metadata_file):
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as f:
+                        return json.load(f)
             return {}
         except Exception as e:
             logger.error(f"Error cargando metadatos: {str(e)}")
             return {}
 
-    def _save_metadata(self):
-        """Guardar metadatos de documentos"""
+    def _recover_interrupted_swap(self):
+        """Restaurar el último índice legado si un guardado con save_local se interrumpió"""
+        backup_path = f"{self.index_path}.bak"
+        if not os.path.exists(self.index_path) and os.path.exists(backup_path):
+            os.rename(backup_path, self.index_path)
+            logger.warning("Índice restaurado desde la copia del último guardado")
+        elif os.path.exists(backup_path):
+            shutil.rmtree(backup_path, ignore_errors=True)
+        shutil.rmtree(f"{self.index_path}.tmp", ignore_errors=True)
+
+    def _persist(self):
+        """
+        Confirmar en disco solo los cambios desde el último guardado: un segmento
+        con los vectores nuevos, los IDs borrados y los metadatos modificados.
+        """
+        added_ids, deleted_ids = self.vector_store.drain_changes()
+        documents = {
+            doc_id: self.documents_metadata.get(doc_id) for doc_id in self._dirty_documents
+        }
+        seq = self.segment_store.commit(self.vector_store, added_ids, deleted_ids, documents)
+        self.answer_cache.invalidate_documents(self._dirty_documents)
+        self._dirty_documents = set()
+        if self.lexical_index is not None:
+            self.lexical_index.apply(list(self._lexical_rows(added_ids)), deleted_ids, seq)
+        self._invalidate_results()
+
+        # Los borrados sobre la base mapeada solo se recuperan con un checkpoint
+        ntotal = self.vector_store.index.ntotal
+        tombstone_ratio = self.vector_store.tombstone_count / ntotal if ntotal else 0.0
+        if (
+            self.segment_store.needs_compaction()
+            or tombstone_ratio > IncrementalFAISS.COMPACTION_RATIO
+        ):
+            self._schedule_compaction()
+
+    def _schedule_compaction(self):
+        """Compactar el log de segmentos en segundo plano si no hay otra en curso"""
+        if not self._compaction_lock.acquire(blocking=False):
+            return
+        threading.Thread(
+            target=self._compact_storage, name="rag-compaction", daemon=True
+        ).start()
+
+    def _compact_storage(self):
+        """
+        Escribir un checkpoint en segundo plano y reabrir el índice sobre él.
+
+        Bajo el lock de escritura solo se toman el estado publicado y la
+        posición del log. El checkpoint (reescritura de la base y, si aplica,
+        el índice aproximado) se construye fuera del lock a partir de ese
+        estado, que nadie modifica, de modo que la ingesta sigue confirmando
+        mientras tanto. Después se vuelve a tomar el lock para instalarlo y
+        reabrir el índice, lo que reproduce encima las confirmaciones hechas
+        durante la compactación.
+        """
         try:
-            with open(self.metadata_file, "w", encoding="utf-8") as f:
-                json.dump(self.documents_metadata, f, indent=2, ensure_ascii=False)
+            with self._write_lock:
+                vector_store, documents_metadata = self._state
+                seq = self.segment_store.seq
+            if vector_store is None:
+                return
+            ids = [
+                docstore_id
+                for _, docstore_id in sorted(vector_store.index_to_docstore_id.items())
+            ]
+            base = self.segment_store.write_checkpoint(
+                seq,
+                ids,
+                vector_store.get_vectors,
+                vector_store.docstore.search,
+                documents_metadata,
+                vector_store.index.d,
+            )
+            with self._write_lock:
+                self.segment_store.install_checkpoint(base)
+                # Se descartan los tombstones y el delta de la base anterior
+                self._state = self.segment_store.load(self.embeddings)
+            logger.info(f"Log de segmentos compactado en el checkpoint {base['seq']}")
         except Exception as e:
-            logger.error(f"Error guardando metadatos: {str(e)}")
+            logger.error(f"Error compactando el almacén de segmentos: {str(e)}")
+        finally:
+            self._compaction_lock.release()
+
+    def _build_content_hash_index(self) -> Tuple[Dict[str, str], Dict[str, str]]:
+        """
+        Mapear hash de contenido -> document_id de los documentos indexados.
+
+        Devuelve el índice por SHA-256 completo y, aparte, el de los documentos
+        legados sin content_hash, de los que solo se conocen los 16 primeros
+        caracteres (el final de su ID).
+        """
+        index = {}
+        legacy_index = {}
+        for doc_id, info in self.documents_metadata.items():
+            if info.get("content_hash"):
+                index[info["content_hash"]] = doc_id
+            else:
+                legacy_index[doc_id.rsplit("_", 1)[-1]] = doc_id
+        return index, legacy_index
+
+    def _rebuild_hash_indexes(self):
+        """Reconstruir los índices de hash de contenido y de archivo y el de metadatos"""
+        self._content_hash_index, self._legacy_hash_index = self._build_content_hash_index()
+        # Documentos legados sin file_hash solo se detectan tras extraer el texto
+        self._file_hash_index = {
+            info["file_hash"]: doc_id
+            for doc_id, info in self.documents_metadata.items()
+            if info.get("file_hash")
+        }
+        self._metadata_index = MetadataIndex.from_documents(self.documents_metadata)
+
+    def _find_document_by_hash(self, content_hash: str) -> Optional[str]:
+        """Buscar un documento ya indexado con el mismo contenido (SHA-256 completo)"""
+        doc_id = self._content_hash_index.get(content_hash)
+        if doc_id is None:
+            # Documentos legados: solo se guardó el prefijo en el ID
+            doc_id = self._legacy_hash_index.get(content_hash[:16])
+        if doc_id in self.documents_metadata:
+            return doc_id
+        return None
+
+    def public_documents_metadata(
+        self, documents_metadata: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Metadatos de documentos para la API, sin los campos internos"""
+        if documents_metadata is None:
+            documents_metadata = self._state[1]
+        return {
+            doc_id: {
+                key: value
+                for key, value in info.items()
+                if key not in INTERNAL_DOCUMENT_FIELDS
+            }
+            for doc_id, info in documents_metadata.items()
+        }
+
+    def _get_chunk_ids(self, doc_id: str, state: Optional[IndexState] = None) -> List[str]:
+        """IDs de docstore de los chunks de un documento (en state, o en el estado actual)"""
+        vector_store, documents_metadata = state or self._current_state()
+        if doc_id not in documents_metadata or vector_store is None:
+            return []
+        chunk_ids = documents_metadata[doc_id].get("chunk_ids")
+        if chunk_ids is not None:
+            return chunk_ids
+        # Documentos legados sin chunk_ids: recorrer el docstore
+        return [
+            docstore_id
+            for docstore_id in vector_store.index_to_docstore_id.values()
+            if getattr(vector_store.docstore.search(docstore_id), "metadata", {}).get(
+                "document_id"
+            )
+            == doc_id
+        ]
+
+    def _remove_document_vectors(self, doc_id: str):
+        """Eliminar del índice los chunks de un documento"""
+        if self.vector_store is not None:
+            chunk_ids = [
+                chunk_id
+                for chunk_id in self._get_chunk_ids(doc_id)
+                if self.vector_store.contains(chunk_id)
+            ]
+            if chunk_ids:
+                self.vector_store.delete(chunk_ids)
+        self.documents_metadata.pop(doc_id, None)
+        self._dirty_documents.add(doc_id)
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """Extraer texto de un archivo PDF"""
-        text = ""
         try:
-            with open(pdf_path, "rb") as file:
-                pdf_reader = PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text()
+            return extract_pdf_pages(pdf_path)[0]
         except Exception as e:
             logger.error(f"Error extrayendo texto de PDF {pdf_path}: {str(e)}")
             raise
-        return text
 
     def extract_text_from_docx(self, docx_path: str) -> str:
         """Extraer texto de un archivo DOCX"""
-        text = ""
         try:
-            doc = DocxDocument(docx_path)
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
+            return extract_docx(docx_path)[0]
         except Exception as e:
             logger.error(f"Error extrayendo texto de DOCX {docx_path}: {str(e)}")
             raise
-        return text
 
     def extract_text_from_txt(self, txt_path: str) -> str:
         """Extraer texto de un archivo de texto"""
         try:
-            with open(txt_path, "r", encoding="utf-8") as file:
-                return file.read()
+            return extract_txt(txt_path)[0]
         except Exception as e:
             logger.error(f"Error leyendo archivo de texto {txt_path}: {str(e)}")
             raise
 
     def process_documents(
-        self, file_paths: List[str], metadata: Optional[Dict[str, Any]] = None
+        self,
+        file_paths: List[str],
+        metadata: Optional[Dict[str, Any]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        use_cache: bool = True,
+        force: bool = False,
+        replace_document_id: Optional[str] = None,
+        tracker: Optional[StageTracker] = None,
     ) -> Dict[str, Any]:
-        """Procesar múltiples documentos y crear/actualizar el vector store"""
+        """
+        Procesar múltiples documentos y crear/actualizar el vector store.
+
+        La ingesta es idempotente: un documento cuyo contenido ya está indexado
+        se omite, salvo que force=True, en cuyo caso se reemplazan sus vectores.
+        Con replace_document_id, el documento indicado se elimina en la misma
+        confirmación en la que se indexa el nuevo.
+
+        El texto se procesa en streaming: cada rango de páginas extraído se
+        trocea con solapamiento arrastrado, y los chunks se embeben en ventanas
+        de ingest_window_chunks y se añaden a un índice de preparación. La
+        memoria retenida queda acotada por la ventana, no por el tamaño de los
+        archivos; el índice principal solo cambia al confirmar.
+
+        El tracker recibe el progreso y el tiempo de cada etapa (extracción,
+        troceado, embeddings, confirmación); los trabajos en segundo plano
+        pasan el suyo para exponerlo en GET /jobs/<id>.
+        """
+        tracker = tracker or StageTracker()
         try:
-            all_texts = []
-            processed_docs = []
+            staged_documents = {}
+            skipped = []
+            failed = []
+            seen_hashes = set()
+            seen_file_hashes = set()
 
+            extractable = []
             for file_path in file_paths:
+                file_ext = os.path.splitext(file_path)[1].lower()
                 if not os.path.exists(file_path):
                     logger.warning(f"Archivo no encontrado: {file_path}")
                     continue
+                if file_ext not in SUPPORTED_EXTENSIONS:
+                    logger.warning(f"Tipo de archivo no soportado: {file_ext}")
+                    continue
 
-                # Extraer texto según el tipo de archivo
-                file_ext = os.path.splitext(file_path)[1].lower()
-
-                if file_ext == ".pdf":
-                    text = self.extract_text_from_pdf(file_path)
-                elif file_ext == ".docx":
-                    text = self.extract_text_from_docx(file_path)
-                elif file_ext in [".txt", ".md"]:
-                    text = self.extract_text_from_txt(file_path)
+                # Omitir sin extraer los archivos idénticos a uno ya indexado
+                with tracker.track("extraction"):
+                    file_hash = hash_file(file_path)
+                existing_id = self._file_hash_index.get(file_hash)
+                if file_hash in seen_file_hashes or (existing_id and not force):
+                    skipped.append(
+                        {
+                            "file_name": os.path.basename(file_path),
+                            "document_id": existing_id,
+                            "reason": "already_indexed",
+                        }
+                    )
+                    logger.info(f"Omitido (archivo ya indexado): {file_path}")
+                    continue
+                seen_file_hashes.add(file_hash)
+                extractable.append((file_path, file_hash))
+
+            staging = None
+            window: List[Any] = []
+            embedding_stats: Optional[Dict[str, Any]] = None
+            memory = {
+                "window_chunks": self.ingest_window_chunks,
+                "high_water_chunks": 0,
+                "high_water_characters": 0,
+                "peak_rss_mb_before": peak_rss_mb(),
+            }
+            counters = {"seen": 0, "embedded": 0}
+            file_reports = {}
+
+            def flush_window():
+                """Embeber la ventana actual y añadirla al índice de preparación"""
+                nonlocal staging, window, embedding_stats
+                if not window:
+                    return
+                embedded_before = counters["embedded"]
+
+                def callback(done, _total):
+                    tracker.progress("embedding", embedded_before + done, counters["seen"])
+                    if progress_callback:
+                        progress_callback(embedded_before + done, counters["seen"])
+
+                with tracker.track("embedding"):
+                    embedding_result = self.embedding_pipeline.embed_texts(
+                        [doc.page_content for _, _, doc in window],
+                        progress_callback=callback,
+                        use_cache=use_cache,
+                    )
+                text_embeddings = [
+                    (doc.page_content, vector)
+                    for (_, _, doc), vector in zip(window, embedding_result["vectors"])
+                ]
+                metadatas = [doc.metadata for _, _, doc in window]
+                ids = [staging_id for _, staging_id, _ in window]
+                if staging is None:
+                    staging = IncrementalFAISS.from_embeddings(
+                        text_embeddings, self.embeddings, metadatas=metadatas, ids=ids
+                    )
                 else:
-                    logger.warning(f"Tipo de archivo no soportado: {file_ext}")
+                    staging.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+                counters["embedded"] += len(window)
+                embedding_stats = self._merge_embedding_stats(
+                    embedding_stats, embedding_result["stats"]
+                )
+                window = []
+
+            def discard_file(state):
+                """Descartar los chunks ya preparados de un archivo"""
+                nonlocal window
+                window = [item for item in window if item[0] != state["ordinal"]]
+                flushed = [
+                    staging_id
+                    for staging_id in state["staging_ids"]
+                    if staging is not None and staging.contains(staging_id)
+                ]
+                if flushed:
+                    staging.delete(flushed)
+
+            def add_chunks(state, chunks):
+                # Cada chunk se tokeniza una sola vez (por lotes) y el recuento se reutiliza
+                with tracker.track("chunking"):
+                    counted = self._count_tokens(chunks)
+                for chunk, chunk_tokens in counted:
+                    add_chunk(state, chunk, chunk_tokens)
+
+            def add_chunk(state, chunk, chunk_tokens):
+                chunk_index = len(state["staging_ids"])
+                doc_metadata = {
+                    "source": state["file_path"],
+                    "chunk_index": chunk_index,
+                    "file_type": state["file_ext"],
+                    "processed_at": datetime.now().isoformat(),
+                    "chunk_tokens": chunk_tokens,
+                }
+                if metadata:
+                    doc_metadata.update(metadata)
+
+                staging_id = f"{state['ordinal']}:{chunk_index}"
+                state["staging_ids"].append(staging_id)
+                state["total_tokens"] += chunk_tokens
+                window.append(
+                    (state["ordinal"], staging_id, Document(page_content=chunk, metadata=doc_metadata))
+                )
+                counters["seen"] += 1
+                tracker.progress("chunking", counters["seen"])
+                if len(window) >= self.ingest_window_chunks:
+                    flush_window()
+
+            # Extracción en paralelo (pool de procesos) consumida como flujo de segmentos
+            stream_started = time.perf_counter()
+            file_hashes = dict(extractable)
+            state = None
+            files_done = 0
+            tracker.progress("extraction", 0, len(extractable))
+            segments = self.text_extractor.iter_segments(
+                [file_path for file_path, _ in extractable]
+            )
+            while True:
+                with tracker.track("extraction"):
+                    segment = next(segments, None)
+                if segment is None:
+                    break
+                if segment["last"]:
+                    files_done += 1
+                    tracker.progress("extraction", files_done, len(extractable))
+
+                file_path = segment["file_path"]
+                if state is None or state["file_path"] != file_path:
+                    state = {
+                        "ordinal": len(file_reports),
+                        "file_path": file_path,
+                        "file_ext": os.path.splitext(file_path)[1].lower(),
+                        "chunker": StreamingChunker(self.text_splitter),
+                        "hasher": hashlib.sha256(),
+                        "staging_ids": [],
+                        "total_characters": 0,
+                        "total_tokens": 0,
+                        "has_text": False,
+                        "started": time.perf_counter(),
+                        "cpu_seconds": 0.0,
+                        "tasks": 0,
+                    }
+                    file_reports[file_path] = state
+
+                if segment["error"] is not None:
+                    discard_file(state)
+                    failed.append(
+                        {"file_name": os.path.basename(file_path), "error": segment["error"]}
+                    )
+                    state = None
                     continue
 
-                if not text.strip():
-                    logger.warning(f"No se pudo extraer texto de: {file_path}")
+                text = segment["text"]
+                state["hasher"].update(text.encode())
+                state["total_characters"] += len(text)
+                state["has_text"] = state["has_text"] or bool(text.strip())
+                state["cpu_seconds"] += segment["cpu_seconds"]
+                state["tasks"] += 1
+
+                with tracker.track("chunking"):
+                    chunks = state["chunker"].feed(text)
+                add_chunks(state, chunks)
+
+                # Marca de agua: ventana pendiente + arrastre del chunker + segmento actual
+                memory["high_water_chunks"] = max(memory["high_water_chunks"], len(window))
+                memory["high_water_characters"] = max(
+                    memory["high_water_characters"],
+                    sum(len(doc.page_content) for _, _, doc in window)
+                    + state["chunker"].buffered_characters
+                    + len(text),
+                )
+                del text
+
+                if not segment["last"]:
                     continue
 
-                # Crear chunks del texto
-                chunks = self.text_splitter.split_text(text)
-
-                # Generar ID único para el documento
-                doc_id = self._generate_document_id(file_path, text)
-
-                # Crear documentos LangChain con metadatos
-                for i, chunk in enumerate(chunks):
-                    doc_metadata = {
-                        "source": file_path,
-                        "document_id": doc_id,
-                        "chunk_index": i,
-                        "total_chunks": len(chunks),
-                        "file_type": file_ext,
-                        "processed_at": datetime.now().isoformat(),
-                        "chunk_tokens": len(self.tokenizer.encode(chunk)),
-                    }
+                with tracker.track("chunking"):
+                    chunks = state["chunker"].flush()
+                add_chunks(state, chunks)
+                state["seconds"] = time.perf_counter() - state["started"]
 
-                    if metadata:
-                        doc_metadata.update(metadata)
+                if not state["has_text"]:
+                    logger.warning(f"No se pudo extraer texto de: {file_path}")
+                    discard_file(state)
+                    state = None
+                    continue
 
-                    doc = Document(page_content=chunk, metadata=doc_metadata)
-                    processed_docs.append(doc)
+                content_hash = state["hasher"].hexdigest()
+                doc_id = self._generate_document_id(file_path, content_hash=content_hash)
+                existing_id = self._find_document_by_hash(content_hash)
+                if content_hash in seen_hashes or (existing_id and not force):
+                    discard_file(state)
+                    skipped.append(
+                        {
+                            "file_name": os.path.basename(file_path),
+                            "document_id": existing_id or doc_id,
+                            "reason": "already_indexed",
+                        }
+                    )
+                    logger.info(f"Omitido (contenido ya indexado): {file_path}")
+                    state = None
+                    continue
+                seen_hashes.add(content_hash)
 
-                # Guardar información del documento
-                self.documents_metadata[doc_id] = {
+                total_chunks = len(state["staging_ids"])
+                # Información del documento (se confirma tras indexar)
+                staged_documents[doc_id] = {
                     "file_path": file_path,
                     "file_name": os.path.basename(file_path),
-                    "file_type": file_ext,
-                    "total_chunks": len(chunks),
-                    "total_characters": len(text),
-                    "total_tokens": sum(
-                        len(self.tokenizer.encode(chunk)) for chunk in chunks
-                    ),
+                    "file_type": state["file_ext"],
+                    "content_hash": content_hash,
+                    "file_hash": file_hashes[file_path],
+                    "chunk_ids": [f"{doc_id}:{i}" for i in range(total_chunks)],
+                    "staging_ids": state["staging_ids"],
+                    "total_chunks": total_chunks,
+                    "total_characters": state["total_characters"],
+                    "total_tokens": state["total_tokens"],
                     "processed_at": datetime.now().isoformat(),
                     "metadata": metadata or {},
+                    "replaces": [],
                 }
+                logger.info(f"Procesado: {file_path} -> {total_chunks} chunks")
+                state = None
+
+            flush_window()
+            stream_seconds = time.perf_counter() - stream_started
+            for stage in ("extraction", "chunking", "embedding"):
+                tracker.finish(stage)
+
+            memory["peak_rss_mb"] = peak_rss_mb()
+            extraction_report = {
+                "workers": self.text_extractor.max_workers,
+                "seconds": round(stream_seconds, 4),
+                "files": {
+                    os.path.basename(path): {
+                        "seconds": round(info["seconds"], 4),
+                        "cpu_seconds": round(info["cpu_seconds"], 4),
+                        "tasks": info["tasks"],
+                    }
+                    for path, info in file_reports.items()
+                    if "seconds" in info
+                },
+                "failed": failed,
+            }
 
-                logger.info(f"Procesado: {file_path} -> {len(chunks)} chunks")
-
-            if not processed_docs:
+            if not staged_documents:
+                if skipped:
+                    result = self._ingest_result([], skipped, [], embedding_stats)
+                    result["extraction"] = extraction_report
+                    result["memory"] = memory
+                    result["stages"] = tracker.stages_dict()
+                    return result
                 raise ValueError("No se pudo procesar ningún documento")
 
-            # Crear o actualizar vector store
-            if self.vector_store is None:
-                # Crear nuevo vector store
-                self.vector_store = FAISS.from_documents(
-                    processed_docs, self.embeddings
+            tracker.progress("commit", 0, len(staged_documents))
+            with tracker.track("commit"):
+                replaced = self._commit_documents(
+                    staging, staged_documents, force, replace_document_id
                 )
-                logger.info("Nuevo vector store creado")
-            else:
-                # Agregar documentos al vector store existente
-                new_vector_store = FAISS.from_documents(processed_docs, self.embeddings)
-                self.vector_store.merge_from(new_vector_store)
-                logger.info("Documentos agregados al vector store existente")
-
-            # Guardar vector store
-            self.vector_store.save_local(self.index_path)
+            tracker.progress("commit", len(staged_documents), len(staged_documents))
+            tracker.finish("commit")
 
-            # Guardar metadatos
-            self._save_metadata()
-
-            result = {
-                "status": "success",
-                "documents_processed": len(
-                    [doc_id for doc_id in self.documents_metadata.keys()]
-                ),
-                "total_chunks": len(processed_docs),
-                "total_tokens": sum(
-                    doc["total_tokens"] for doc in self.documents_metadata.values()
-                ),
-                "processed_at": datetime.now().isoformat(),
-            }
+            result = self._ingest_result(
+                list(staged_documents), skipped, replaced, embedding_stats
+            )
+            result["total_chunks"] = sum(
+                info["total_chunks"] for info in staged_documents.values()
+            )
+            result["extraction"] = extraction_report
+            result["memory"] = memory
+            result["stages"] = tracker.stages_dict()
 
             logger.info(f"Procesamiento completado: {result}")
             return result
@@ -258,110 +887,498 @@ class RAGFAISSModel:
             logger.error(f"Error procesando documentos: {str(e)}")
             raise
 
-    def search_documents(self, query: str, k: int = 4) -> List[Document]:
-        """Buscar documentos similares a la consulta"""
-        if self.vector_store is None:
-            raise ValueError(
-                "No hay vector store disponible. Procesa documentos primero."
-            )
+    def _count_tokens(
+        self, chunks: List[Tuple[str, Optional[int]]]
+    ) -> List[Tuple[str, int]]:
+        """Completar con encode_batch los recuentos de tokens que el splitter no dio"""
+        missing = [chunk for chunk, tokens in chunks if tokens is None]
+        if not missing:
+            return chunks
+        counts = iter(len(tokens) for tokens in self.tokenizer.encode_batch(missing))
+        return [
+            (chunk, next(counts) if tokens is None else tokens) for chunk, tokens in chunks
+        ]
+
+    @staticmethod
+    def _merge_embedding_stats(
+        total: Optional[Dict[str, Any]], stats: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Acumular las estadísticas de embeddings de varias ventanas"""
+        if total is None:
+            return dict(stats)
+        merged = dict(total)
+        for key in ("chunks", "batches", "retries", "cache_hits", "embedded", "seconds"):
+            merged[key] = total.get(key, 0) + stats.get(key, 0)
+        merged["seconds"] = round(merged["seconds"], 4)
+        merged["chunks_per_second"] = (
+            round(merged["chunks"] / merged["seconds"], 2) if merged["seconds"] else 0.0
+        )
+        return merged
 
-        try:
-            docs = self.vector_store.similarity_search(query, k=k)
-            logger.info(f"Búsqueda realizada: {len(docs)} documentos encontrados")
-            return docs
-        except Exception as e:
-            logger.error(f"Error en búsqueda: {str(e)}")
-            raise
+    def _commit_documents(
+        self,
+        staging: IncrementalFAISS,
+        staged_documents: Dict[str, Dict[str, Any]],
+        force: bool,
+        replace_document_id: Optional[str] = None,
+    ) -> List[str]:
+        """
+        Aplicar una ingesta al índice y a los metadatos como una única unidad.
 
-    def get_conversational_chain(self) -> Any:
-        """Crear cadena conversacional para Q&A"""
-        prompt_template = """
-        Eres un asistente experto en seguridad química e industrial de BASF.
-        Responde en español de manera clara, precisa y profesional.
+        Los vectores se copian del índice de preparación sin volver a embeber.
+        Los cambios se hacen sobre una copia que se publica al confirmar; si
+        algo falla, el estado en memoria se recarga desde el último guardado
+        confirmado, de modo que índice y metadatos nunca quedan a medias.
+        """
+        with self._write_lock:
+            # Revalidar bajo el lock: otra ingesta concurrente pudo indexar lo mismo
+            for doc_id, info in list(staged_documents.items()):
+                existing_id = self._find_document_by_hash(info["content_hash"])
+                if existing_id and not force:
+                    logger.info(f"Omitido (indexado concurrentemente): {info['file_name']}")
+                    del staged_documents[doc_id]
+                    continue
+                info["replaces"] = [
+                    old_id
+                    for old_id in dict.fromkeys([replace_document_id, existing_id])
+                    if old_id in self.documents_metadata
+                ]
+
+            if not staged_documents:
+                return []
+
+            replaced = []
+            try:
+                with self._write_transaction():
+                    for info in staged_documents.values():
+                        for old_id in info["replaces"]:
+                            self._remove_document_vectors(old_id)
+                            replaced.append(old_id)
+
+                    if self.vector_store is None:
+                        self.vector_store = IncrementalFAISS.empty(
+                            self.embeddings, staging.index.d
+                        )
+                        logger.info("Nuevo vector store creado")
+
+                    for doc_id, info in staged_documents.items():
+                        self.vector_store.merge_from(
+                            staging,
+                            ids=info["staging_ids"],
+                            new_ids=info["chunk_ids"],
+                            metadata_updates={
+                                "document_id": doc_id,
+                                "total_chunks": info["total_chunks"],
+                            },
+                        )
+                        self.documents_metadata[doc_id] = {
+                            key: value
+                            for key, value in info.items()
+                            if key not in ("replaces", "staging_ids")
+                        }
+                        self._dirty_documents.add(doc_id)
+                    logger.info("Documentos agregados al vector store")
+
+                    self._persist()
+            except Exception:
+                logger.error("Fallo al confirmar la ingesta; restaurando último estado guardado")
+                self._load_vector_store()
+                raise
+            finally:
+                self._rebuild_hash_indexes()
+
+            return replaced
+
+    def _ingest_result(
+        self,
+        indexed: List[str],
+        skipped: List[Dict[str, Any]],
+        replaced: List[str],
+        embedding_stats: Optional[Dict[str, Any]],
+    ) -> Dict[str, Any]:
+        """Construir la respuesta de una ingesta"""
+        return {
+            "status": "success",
+            "documents_processed": len(self.documents_metadata),
+            "documents_indexed": indexed,
+            "documents_skipped": skipped,
+            "documents_replaced": replaced,
+            "total_chunks": 0,
+            "total_tokens": sum(
+                doc["total_tokens"] for doc in self.documents_metadata.values()
+            ),
+            "embedding": embedding_stats,
+            "processed_at": datetime.now().isoformat(),
+        }
+
+    def delete_document(self, document_id: str) -> Dict[str, Any]:
+        """Eliminar un documento del índice usando sus chunk IDs (coste O(documento))"""
+        with self._write_lock:
+            if document_id not in self.documents_metadata:
+                raise ValueError(f"Documento no encontrado: {document_id}")
+
+            removed_chunks = len(self._get_chunk_ids(document_id))
+            try:
+                with self._write_transaction():
+                    self._remove_document_vectors(document_id)
+                    self._persist()
+            except Exception:
+                logger.error("Fallo al eliminar el documento; restaurando último estado guardado")
+                self._load_vector_store()
+                raise
+            finally:
+                self._rebuild_hash_indexes()
+
+        logger.info(f"Documento eliminado: {document_id} ({removed_chunks} chunks)")
+        return {
+            "status": "success",
+            "document_id": document_id,
+            "chunks_removed": removed_chunks,
+            "documents_remaining": len(self.documents_metadata),
+            "deleted_at": datetime.now().isoformat(),
+        }
+
+    def replace_document(
+        self,
+        document_id: str,
+        file_path: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        use_cache: bool = True,
+        tracker: Optional[StageTracker] = None,
+    ) -> Dict[str, Any]:
+        """Reemplazar un documento por una nueva versión en una única confirmación"""
+        if document_id not in self.documents_metadata:
+            raise ValueError(f"Documento no encontrado: {document_id}")
+
+        # Sin metadatos nuevos se conservan los del documento original
+        if metadata is None:
+            metadata = self.documents_metadata[document_id].get("metadata") or None
+
+        return self.process_documents(
+            [file_path],
+            metadata,
+            use_cache=use_cache,
+            force=True,
+            replace_document_id=document_id,
+            tracker=tracker,
+        )
 
-        Contexto de documentos técnicos:
-        {context}
+    def corpus_version(self, filters: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Huella de los documentos que cumplen el filtro.
 
-        Pregunta del usuario:
-        {question}
+        Cambia cuando uno de esos documentos se ingiere de nuevo, se reemplaza
+        o se borra, o cuando entra uno nuevo que cumple el filtro; los cambios
+        en el resto del corpus no la alteran.
+        """
+        parsed = parse_filters(filters)
+        with self._write_lock:
+            if parsed is None:
+                document_ids = set(self.documents_metadata)
+            else:
+                document_ids = self._metadata_index.match(parsed)
+            fingerprint = [
+                (doc_id, self.documents_metadata[doc_id].get("processed_at", ""))
+                for doc_id in sorted(document_ids)
+                if doc_id in self.documents_metadata
+            ]
+        return hashlib.sha256(json.dumps(fingerprint).encode("utf-8")).hexdigest()[:16]
+
+    def _embed_query(self, query: str, use_cache: bool = True) -> List[float]:
+        """Calcular el embedding de una consulta, reutilizando las cachés si existen"""
+        return self._embed_queries([query], use_cache=use_cache)[0]
+
+    def _embed_queries(self, queries: List[str], use_cache: bool = True) -> List[List[float]]:
+        """
+        Embeddings de varias consultas: primero las cachés (memoria y SQLite) y
+        las que falten en una única petición por lotes.
+        """
+        vectors: List[Optional[List[float]]] = [None] * len(queries)
+        # Las consultas usan otro task_type que los documentos: espacio de claves propio
+        # (antes las consultas sueltas se embebían como documento: clave nueva)
+        cache_model = f"{self.embedding_model_name}#retrieval_query"
+        if use_cache:
+            for i, query in enumerate(queries):
+                vectors[i] = self.query_embedding_cache.get((self.embedding_model_name, query))
+            if self.embedding_cache is not None:
+                missing = [i for i, vector in enumerate(vectors) if vector is None]
+                if missing:
+                    found = self.embedding_cache.get_many(
+                        cache_model, [queries[i] for i in missing]
+                    )
+                    for position, vector in found.items():
+                        vectors[missing[position]] = vector
+                        self.query_embedding_cache.put(
+                            (self.embedding_model_name, queries[missing[position]]), vector
+                        )
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts = list(dict.fromkeys(queries[i] for i in missing))
+            started = time.perf_counter()
+            embedded = dict(zip(texts, self._embed_query_batch(texts)))
+            cost = (time.perf_counter() - started) / len(texts)
+            for i in missing:
+                vectors[i] = embedded[queries[i]]
+            if use_cache:
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put_many(cache_model, texts, [embedded[t] for t in texts])
+                for text in texts:
+                    self.query_embedding_cache.put(
+                        (self.embedding_model_name, text), embedded[text], cost
+                    )
+        return vectors
+
+    def _embed_query_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embeber consultas por lotes, con el mismo task_type para una o varias"""
+        return embed_queries(self.embeddings, texts, batch_size=QUERY_EMBED_BATCH_SIZE)
+
+    def search_documents(
+        self,
+        query: str,
+        k: int = 4,
+        use_cache: bool = True,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+    ) -> List[Document]:
+        """
+        Buscar documentos similares a la consulta.
 
-        Instrucciones:
-        - Proporciona respuestas precisas basadas únicamente en el contexto proporcionado
-        - Si la información no está en el contexto, indícalo claramente
-        - Incluye datos específicos como números CAS, valores límite, procedimientos de seguridad
-        - Estructura la respuesta de manera clara con viñetas cuando sea apropiado
-        - Si hay información de seguridad crítica, destácala claramente
+        filters restringe la búsqueda a los documentos cuyos metadatos
+        coinciden, p. ej. {"chemical_names": "tolueno", "document_type": "FDS"}.
+        mode elige la recuperación (SEARCH_MODES); por defecto self.search_mode.
+        """
+        return self.search_batch([query], k=k, filters=filters, mode=mode, use_cache=use_cache)[0]
 
-        Respuesta:
+    def search_batch(
+        self,
+        queries: List[str],
+        k: int = 4,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        use_cache: bool = True,
+        query_filters: Optional[List[Optional[Dict[str, Any]]]] = None,
+    ) -> List[List[Document]]:
         """
+        Buscar varias consultas a la vez, devolviendo los resultados en orden.
 
-        # Obtener API key
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+        Las consultas no cacheadas se embeben en una sola petición por lotes y
+        se buscan con una llamada vectorizada al índice por cada filtro
+        distinto. query_filters da un filtro propio a cada consulta (sustituye
+        a filters); cada filtro distinto se resuelve una sola vez.
+        """
+        # Índice y metadatos se leen una sola vez para toda la búsqueda
+        state = self._state
+        if state[0] is None:
+            raise ValueError(
+                "No hay vector store disponible. Procesa documentos primero."
+            )
 
-        model = ChatGoogleGenerativeAI(
-            model=self.chat_model_name,
-            temperature=self.temperature,
-            google_api_key=api_key,
-        )
+        try:
+            mode = mode or self.search_mode
+            if mode not in SEARCH_MODES:
+                raise ValueError(f"mode debe ser uno de {SEARCH_MODES}: {mode}")
+            if query_filters is None:
+                query_filters = [filters] * len(queries)
+            elif len(query_filters) != len(queries):
+                raise ValueError("query_filters debe tener un filtro por consulta")
+            parsed_filters = [parse_filters(query_filter) for query_filter in query_filters]
+            filters_keys = [
+                tuple(
+                    sorted(
+                        (field, tuple(sorted(values)))
+                        for field, values in (parsed or {}).items()
+                    )
+                )
+                for parsed in parsed_filters
+            ]
+
+            # La versión se lee antes de buscar: un resultado calculado mientras
+            # el índice cambia queda bajo la versión antigua y no se reutiliza
+            cache_keys: List[Optional[Tuple[Any, ...]]] = [None] * len(queries)
+            results: List[Optional[List[Document]]] = [None] * len(queries)
+            if use_cache:
+                for i, query in enumerate(queries):
+                    cache_keys[i] = (query, k, mode, filters_keys[i], self._index_version)
+                    results[i] = self.result_cache.get(cache_keys[i])
+            pending = [i for i, docs in enumerate(results) if docs is None]
+
+            if pending:
+                started = time.perf_counter()
+                # Todas las consultas pendientes se embeben en una sola llamada
+                query_vectors = {}
+                if mode != "lexical":
+                    vectors = self._embed_queries(
+                        [queries[i] for i in pending], use_cache=use_cache
+                    )
+                    query_vectors = dict(zip(pending, vectors))
+
+                groups: Dict[Tuple[Any, ...], List[int]] = {}
+                for i in pending:
+                    groups.setdefault(filters_keys[i], []).append(i)
+
+                for positions in groups.values():
+                    parsed = parsed_filters[positions[0]]
+                    document_ids = None
+                    if parsed is not None:
+                        document_ids = self._metadata_index.match(parsed)
+                        logger.info(f"Filtro de metadatos: {len(document_ids)} documentos")
+
+                    group_queries = [queries[i] for i in positions]
+                    group_vectors = [query_vectors.get(i) for i in positions]
+                    if mode == "vector":
+                        found = self._vector_search_batch(
+                            group_vectors, k, document_ids, state
+                        )
+                    elif mode == "lexical":
+                        found = [
+                            self._lexical_search(query, k, document_ids, state)
+                            for query in group_queries
+                        ]
+                    else:
+                        fetch_k = max(k * HYBRID_FETCH_FACTOR, 20)
+                        vector_rankings = self._vector_search_batch(
+                            group_vectors, fetch_k, document_ids, state
+                        )
+                        found = [
+                            self._fuse_rankings(
+                                [
+                                    ranking,
+                                    self._lexical_search(query, fetch_k, document_ids, state),
+                                ],
+                                k,
+                            )
+                            for query, ranking in zip(group_queries, vector_rankings)
+                        ]
+                    for i, docs in zip(positions, found):
+                        results[i] = docs
+
+                cost = (time.perf_counter() - started) / len(pending)
+                for i in pending:
+                    if cache_keys[i] is not None:
+                        self.result_cache.put(cache_keys[i], list(results[i]), cost)
+
+            logger.info(
+                f"Búsqueda {mode} realizada: {len(queries)} consultas, "
+                f"{len(queries) - len(pending)} desde caché"
+            )
+            return [list(docs) for docs in results]
+        except Exception as e:
+            logger.error(f"Error en búsqueda: {str(e)}")
+            raise
 
-        prompt = PromptTemplate(
-            template=prompt_template, input_variables=["context", "question"]
-        )
+    def _vector_search_batch(
+        self,
+        query_vectors: List[List[float]],
+        k: int,
+        document_ids: Optional[set] = None,
+        state: Optional[IndexState] = None,
+    ) -> List[List[Document]]:
+        """Búsqueda por embeddings ya calculados; con document_ids, exacta sobre sus chunks"""
+        state = state or self._state
+        vector_store = state[0]
+        if document_ids is None:
+            rows = vector_store.similarity_search_with_score_by_vectors(query_vectors, k=k)
+        else:
+            chunk_ids = [
+                chunk_id
+                for doc_id in sorted(document_ids)
+                for chunk_id in self._get_chunk_ids(doc_id, state)
+            ]
+            rows = vector_store.similarity_search_with_score_among_batch(
+                query_vectors, chunk_ids, k=k
+            )
+        return [[doc for doc, _ in row] for row in rows]
 
-        chain = load_qa_chain(model, chain_type="stuff", prompt=prompt)
-        return chain
+    def _lexical_search(
+        self,
+        query: str,
+        k: int,
+        document_ids: Optional[set] = None,
+        state: Optional[IndexState] = None,
+    ) -> List[Document]:
+        """Búsqueda BM25 (códigos CAS, frases H, números ONU) sin embeber la consulta"""
+        if self.lexical_index is None:
+            raise ValueError("Búsqueda léxica no disponible: SQLite sin soporte FTS5")
+        docstore = (state or self._state)[0].docstore
+        docs = []
+        for chunk_id, _ in self.lexical_index.search(query, k, document_ids):
+            doc = docstore.search(chunk_id)
+            if isinstance(doc, Document):
+                docs.append(doc)
+        return docs
+
+    def _fuse_rankings(self, rankings: List[List[Document]], k: int) -> List[Document]:
+        """Reciprocal rank fusion de los rankings vectorial y léxico (ver fuse_rankings)"""
+        return fuse_rankings(rankings, k, self.rrf_k)
+
+    def get_conversational_chain(self) -> Any:
+        """Cadena conversacional para Q&A (compartida por todas las preguntas)"""
+        return self.qa_chains.get(self.chat_model_name, self.temperature)
 
-    def answer_question(self, question: str, k: int = 4) -> Dict[str, Any]:
-        """Responder una pregunta usando RAG"""
+    def answer_question(
+        self,
+        question: str,
+        k: int = 4,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        use_cache: bool = True,
+        rerank: Optional[Union[str, bool]] = None,
+    ) -> Dict[str, Any]:
+        """Responder una pregunta usando RAG (opcionalmente filtrando por metadatos)"""
         try:
             if self.vector_store is None:
                 return {
                     "status": "error",
-                    "message": "No hay documentos procesados. Por favor, sube y procesa archivos primero.",
+                    "message": NO_DOCUMENTS_MESSAGE,
                     "answer": "",
                     "sources": [],
                 }
 
-            # Buscar documentos relevantes
-            docs = self.search_documents(question, k=k)
+            # Buscar documentos relevantes (y re-ordenarlos si se pide)
+            docs, rerank_info = self._retrieve_for_answer(
+                question, k, filters, mode, use_cache, rerank
+            )
 
             if not docs:
                 return {
                     "status": "error",
-                    "message": "No se encontraron documentos relevantes para la consulta.",
+                    "message": NO_RESULTS_MESSAGE,
                     "answer": "",
                     "sources": [],
                 }
 
-            # Obtener cadena conversacional
-            chain = self.get_conversational_chain()
-
-            # Generar respuesta
-            response = chain(
-                {"input_documents": docs, "question": question},
-                return_only_outputs=True,
-            )
-
-            # Extraer fuentes
-            sources = []
-            for doc in docs:
-                source_info = {
-                    "source": doc.metadata.get("source", "Desconocido"),
-                    "document_id": doc.metadata.get("document_id", ""),
-                    "chunk_index": doc.metadata.get("chunk_index", 0),
-                    "file_type": doc.metadata.get("file_type", ""),
-                }
-                if source_info not in sources:
-                    sources.append(source_info)
+            # Misma selección de chunks y pregunta parecida: reutilizar la respuesta
+            question_vector, chunk_keys, cached = self._cached_answer(question, docs, use_cache)
+            cache_similarity = None
+            if cached is not None:
+                answer, cache_similarity = cached
+            else:
+                # Generar respuesta con la cadena compartida sobre el contexto recortado
+                started = time.perf_counter()
+                context_docs, context_tokens = self.context_packer.pack(question, docs)
+                answer = self.qa_chains.invoke(
+                    self.chat_model_name, self.temperature, context_docs, question
+                )
+                self._store_answer(
+                    question_vector, chunk_keys, answer, time.perf_counter() - started
+                )
 
             result = {
                 "status": "success",
                 "question": question,
-                "answer": response["output_text"],
-                "sources": sources,
+                "answer": answer,
+                "sources": self._answer_sources(docs),
+                "filters": filters or {},
                 "context_chunks": len(docs),
+                "rerank": rerank_info,
+                "from_cache": cache_similarity is not None,
                 "timestamp": datetime.now().isoformat(),
             }
+            if cache_similarity is None:
+                result["context_tokens"] = context_tokens
+            else:
+                result["cache_similarity"] = round(cache_similarity, 4)
 
             logger.info(f"Pregunta respondida exitosamente")
             return result
@@ -375,19 +1392,171 @@ class RAGFAISSModel:
                 "sources": [],
             }
 
-    def get_stats(self) -> Dict[str, Any]:
-        """Obtener estadísticas del sistema"""
+    def stream_answer(
+        self,
+        question: str,
+        k: int = 4,
+        filters: Optional[Dict[str, Any]] = None,
+        mode: Optional[str] = None,
+        use_cache: bool = True,
+        rerank: Optional[Union[str, bool]] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Responder en streaming como eventos (nombre, datos): "sources" con las
+        fuentes recuperadas, un "token" por fragmento de la respuesta y "done"
+        con el resumen y los tiempos; "error" si algo falla.
+        """
+        started = time.perf_counter()
+
+        def elapsed_ms() -> float:
+            return round((time.perf_counter() - started) * 1000, 2)
+
         try:
-            vector_store_exists = self.vector_store is not None
+            if self.vector_store is None:
+                yield "error", {"status": "error", "message": NO_DOCUMENTS_MESSAGE}
+                return
 
-            total_docs = len(self.documents_metadata)
-            total_chunks = sum(
-                doc["total_chunks"] for doc in self.documents_metadata.values()
+            docs, rerank_info = self._retrieve_for_answer(
+                question, k, filters, mode, use_cache, rerank
             )
-            total_tokens = sum(
-                doc["total_tokens"] for doc in self.documents_metadata.values()
+            if not docs:
+                yield "error", {"status": "error", "message": NO_RESULTS_MESSAGE}
+                return
+
+            timings = {"retrieval_ms": elapsed_ms()}
+            yield "sources", {
+                "question": question,
+                "sources": self._answer_sources(docs),
+                "filters": filters or {},
+                "context_chunks": len(docs),
+                "rerank": rerank_info,
+            }
+
+            question_vector, chunk_keys, cached = self._cached_answer(question, docs, use_cache)
+            summary: Dict[str, Any] = {}
+            if cached is not None:
+                answer, cache_similarity = cached
+                timings["first_token_ms"] = elapsed_ms()
+                yield "token", {"text": answer}
+                summary["cache_similarity"] = round(cache_similarity, 4)
+            else:
+                generation_started = time.perf_counter()
+                context_docs, summary["context_tokens"] = self.context_packer.pack(
+                    question, docs
+                )
+                parts = []
+                for text in self.qa_chains.stream(
+                    self.chat_model_name, self.temperature, context_docs, question
+                ):
+                    if not parts:
+                        timings["first_token_ms"] = elapsed_ms()
+                    parts.append(text)
+                    yield "token", {"text": text}
+                answer = "".join(parts)
+                self._store_answer(
+                    question_vector,
+                    chunk_keys,
+                    answer,
+                    time.perf_counter() - generation_started,
+                )
+
+            timings["total_ms"] = elapsed_ms()
+            yield "done", {
+                "status": "success",
+                "question": question,
+                "answer": answer,
+                "from_cache": cached is not None,
+                **summary,
+                "timings": timings,
+                "timestamp": datetime.now().isoformat(),
+            }
+            logger.info(
+                f"Pregunta respondida en streaming: primer fragmento en "
+                f"{timings.get('first_token_ms')} ms, total {timings['total_ms']} ms"
+            )
+
+        except Exception as e:
+            logger.error(f"Error respondiendo pregunta en streaming: {str(e)}")
+            yield "error", {
+                "status": "error",
+                "message": f"Error procesando la consulta: {str(e)}",
+            }
+
+    def _retrieve_for_answer(
+        self,
+        question: str,
+        k: int,
+        filters: Optional[Dict[str, Any]],
+        mode: Optional[str],
+        use_cache: bool,
+        rerank: Optional[Union[str, bool]],
+    ) -> Tuple[List[Document], Dict[str, Any]]:
+        """Chunks para el contexto: k * fetch_factor candidatos re-ordenados, o los k de la búsqueda"""
+        method = self.reranker.resolve(rerank)
+        candidates = self.search_documents(
+            question,
+            k=self.reranker.fetch_size(k, method),
+            filters=filters,
+            mode=mode,
+            use_cache=use_cache,
+        )
+        return self.reranker.rerank(question, candidates, k, method)
+
+    def _cached_answer(
+        self, question: str, docs: List[Document], use_cache: bool
+    ) -> Tuple[Optional[List[float]], List[Tuple[Any, Any]], Optional[Tuple[str, float]]]:
+        """Embedding de la pregunta, chunks recuperados y respuesta cacheada (si la hay)"""
+        chunk_keys = [
+            (doc.metadata.get("document_id"), doc.metadata.get("chunk_index")) for doc in docs
+        ]
+        if not use_cache or not self.answer_cache.enabled:
+            return None, chunk_keys, None
+        question_vector = self._embed_query(question)
+        return question_vector, chunk_keys, self.answer_cache.get(question_vector, chunk_keys)
+
+    def _store_answer(
+        self,
+        question_vector: Optional[List[float]],
+        chunk_keys: List[Tuple[Any, Any]],
+        answer: str,
+        cost_seconds: float,
+    ):
+        """Guardar la respuesta generada en la caché semántica"""
+        if question_vector is not None:
+            self.answer_cache.put(
+                question_vector,
+                chunk_keys,
+                {document_id for document_id, _ in chunk_keys},
+                answer,
+                cost_seconds,
             )
 
+    @staticmethod
+    def _answer_sources(docs: List[Document]) -> List[Dict[str, Any]]:
+        """Fuentes distintas de los chunks usados en una respuesta"""
+        sources = []
+        for doc in docs:
+            source_info = {
+                "source": doc.metadata.get("source", "Desconocido"),
+                "document_id": doc.metadata.get("document_id", ""),
+                "chunk_index": doc.metadata.get("chunk_index", 0),
+                "file_type": doc.metadata.get("file_type", ""),
+            }
+            if source_info not in sources:
+                sources.append(source_info)
+        return sources
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Obtener estadísticas del sistema"""
+        try:
+            # Un único estado publicado para todas las cifras
+            vector_store, documents_metadata = self._state
+            vector_store_exists = vector_store is not None
+
+            total_docs = len(documents_metadata)
+            total_chunks = sum(doc["total_chunks"] for doc in documents_metadata.values())
+            total_tokens = sum(doc["total_tokens"] for doc in documents_metadata.values())
+
             return {
                 "status": "success",
                 "vector_store_exists": vector_store_exists,
@@ -399,25 +1568,98 @@ class RAGFAISSModel:
                 "index_path": self.index_path,
                 "chunk_size": self.chunk_size,
                 "chunk_overlap": self.chunk_overlap,
-                "documents_metadata": self.documents_metadata,
+                "chunking_mode": self.chunking_mode,
+                "context_token_budget": self.context_packer.token_budget,
+                "embed_batch_size": self.embedding_pipeline.batch_size,
+                "embed_max_workers": self.embedding_pipeline.max_workers,
+                "ingest_window_chunks": self.ingest_window_chunks,
+                "deleted_vectors_pending_compaction": (
+                    vector_store.tombstone_count if vector_store_exists else 0
+                ),
+                "storage": self.segment_store.get_stats(),
+                "metadata_filter_fields": self._metadata_index.get_stats(),
+                "search_mode": self.search_mode,
+                "query_cache": {
+                    "index_version": self._index_version,
+                    "embeddings": self.query_embedding_cache.get_stats(),
+                    "results": self.result_cache.get_stats(),
+                    "answers": self.answer_cache.get_stats(),
+                },
+                "qa_chain": self.qa_chains.get_stats(),
+                "reranker": self.reranker.get_stats(),
+                "lexical_index": (
+                    self.lexical_index.get_stats()
+                    if self.lexical_index
+                    else {"enabled": False}
+                ),
+                "embedding_cache": (
+                    self.embedding_cache.get_stats()
+                    if self.embedding_cache
+                    else {"enabled": False}
+                ),
+                "documents_metadata": self.public_documents_metadata(documents_metadata),
             }
         except Exception as e:
             logger.error(f"Error obteniendo estadísticas: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    def _generate_document_id(self, file_path: str, content: str) -> str:
-        """Generar un ID único para el documento"""
-        content_hash = hashlib.sha256(content.encode()).hexdigest()[:16]
+    def _generate_document_id(
+        self,
+        file_path: str,
+        content: Optional[str] = None,
+        content_hash: Optional[str] = None,
+    ) -> str:
+        """Generar un ID estable para el documento a partir de su contenido"""
+        if content_hash is None:
+            content_hash = hashlib.sha256(content.encode()).hexdigest()
         filename = os.path.basename(file_path)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"{filename}_{timestamp}_{content_hash}"
+        return f"{filename}_{content_hash[:16]}"
 
 
 # Instancia global del modelo RAG FAISS
 def create_rag_faiss_model():
     """Crear instancia del modelo RAG FAISS"""
     try:
-        return RAGFAISSModel()
+        return RAGFAISSModel(
+            embed_batch_size=Config.RAG_EMBED_BATCH_SIZE,
+            embed_max_workers=Config.RAG_EMBED_MAX_WORKERS,
+            embed_max_retries=Config.RAG_EMBED_MAX_RETRIES,
+            use_embedding_cache=Config.RAG_EMBEDDING_CACHE_ENABLED,
+            embedding_cache_path=Config.RAG_EMBEDDING_CACHE_PATH,
+            embedding_cache_max_entries=Config.RAG_EMBEDDING_CACHE_MAX_ENTRIES,
+            extraction_workers=Config.RAG_EXTRACTION_WORKERS or None,
+            pdf_pages_per_task=Config.RAG_PDF_PAGES_PER_TASK,
+            ingest_window_chunks=Config.RAG_INGEST_WINDOW_CHUNKS,
+            chunking_mode=Config.RAG_CHUNKING_MODE,
+            chunk_tokens=Config.RAG_CHUNK_TOKENS,
+            chunk_overlap_tokens=Config.RAG_CHUNK_OVERLAP_TOKENS,
+            compaction_log_entries=Config.RAG_COMPACTION_LOG_ENTRIES,
+            index_type=Config.RAG_INDEX_TYPE,
+            search_mode=Config.RAG_SEARCH_MODE,
+            rrf_k=Config.RAG_RRF_K,
+            query_cache_size=Config.RAG_QUERY_CACHE_SIZE,
+            query_cache_ttl=Config.RAG_QUERY_CACHE_TTL,
+            result_cache_size=Config.RAG_RESULT_CACHE_SIZE,
+            result_cache_ttl=Config.RAG_RESULT_CACHE_TTL,
+            answer_cache_size=Config.RAG_ANSWER_CACHE_SIZE,
+            answer_cache_ttl=Config.RAG_ANSWER_CACHE_TTL,
+            answer_cache_threshold=Config.RAG_ANSWER_CACHE_THRESHOLD,
+            context_token_budget=Config.RAG_CONTEXT_TOKEN_BUDGET,
+            rerank_method=Config.RAG_RERANK_METHOD,
+            rerank_model=Config.RAG_RERANK_MODEL,
+            rerank_fetch_factor=Config.RAG_RERANK_FETCH_FACTOR,
+            rerank_max_candidates=Config.RAG_RERANK_MAX_CANDIDATES,
+            rerank_timeout_ms=Config.RAG_RERANK_TIMEOUT_MS,
+            index_params={
+                "nlist": Config.RAG_IVF_NLIST,
+                "nprobe": Config.RAG_IVF_NPROBE,
+                "hnsw_m": Config.RAG_HNSW_M,
+                "ef_construction": Config.RAG_HNSW_EF_CONSTRUCTION,
+                "ef_search": Config.RAG_HNSW_EF_SEARCH,
+                "pq_m": Config.RAG_PQ_M,
+                "pq_bits": Config.RAG_PQ_BITS,
+            },
+        )
     except Exception as e:
         logger.error(f"Error creando modelo RAG FAISS: {str(e)}")
         raise
@@ -0,0 +1,235 @@
+"""
+Índices aproximados (ANN) de FAISS para el checkpoint base.
+
+La base se busca por defecto de forma exacta (flat), con un coste lineal en el
+número de chunks. Al escribir un checkpoint se puede construir además un
+índice aproximado sobre los mismos vectores y en el mismo orden de posiciones:
+
+- ivf:   IndexIVFFlat, entrenado con k-means (nlist listas, nprobe al buscar)
+- hnsw:  IndexHNSWFlat, grafo navegable sin entrenamiento (efSearch al buscar)
+- ivfpq: IndexIVFPQ, listas IVF con vectores comprimidos por product quantization
+
+El índice se guarda como base-<seq>.faiss y se abre con IO_FLAG_MMAP. Los
+vectores exactos siguen en base-<seq>.npy para reconstruir, compactar y medir
+el recall frente a la búsqueda plana.
+"""
+
+import logging
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+DEFAULT_INDEX_PARAMS: Dict[str, int] = {
+    "nlist": 0,  # 0 = automático (~4·√n)
+    "nprobe": 8,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "pq_m": 16,
+    "pq_bits": 8,
+}
+
+# k-means de FAISS necesita ~39 puntos por centroide para no degradarse
+TRAINING_POINTS_PER_CENTROID = 39
+# Máximo de vectores por centroide usados para entrenar (muestra aleatoria)
+MAX_TRAINING_POINTS_PER_CENTROID = 256
+ADD_BATCH_ROWS = 65536
+
+
+def validate_index_type(index_type: str) -> str:
+    """Comprobar que el tipo de índice es uno de los soportados"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type debe ser uno de {INDEX_TYPES}: {index_type}")
+    return index_type
+
+
+def resolve_params(params: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    """Completar los parámetros indicados con los valores por defecto"""
+    resolved = dict(DEFAULT_INDEX_PARAMS)
+    resolved.update({key: int(value) for key, value in (params or {}).items() if value is not None})
+    return resolved
+
+
+def _nlist_for(count: int, requested: int) -> int:
+    nlist = requested or int(4 * math.sqrt(count))
+    return max(1, min(nlist, count // TRAINING_POINTS_PER_CENTROID))
+
+
+def _pq_m_for(dimension: int, requested: int) -> int:
+    """Mayor número de subcuantizadores <= requested que divide la dimensión"""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def build_ann_index(
+    index_type: str, vectors: np.ndarray, params: Optional[Dict[str, Any]] = None
+) -> Optional[faiss.Index]:
+    """
+    Construir un índice aproximado sobre vectors (que puede estar mapeado).
+
+    Devuelve None para "flat" o si no hay vectores suficientes para entrenar
+    el tipo pedido; en ese caso la base se sigue buscando de forma exacta.
+    """
+    validate_index_type(index_type)
+    if index_type == "flat":
+        return None
+    params = resolve_params(params)
+    count, dimension = vectors.shape
+
+    if index_type == "hnsw":
+        if not count:
+            return None
+        index = faiss.IndexHNSWFlat(dimension, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        nlist = _nlist_for(count, params["nlist"])
+        minimum = nlist * TRAINING_POINTS_PER_CENTROID
+        if index_type == "ivfpq":
+            minimum = max(minimum, (1 << params["pq_bits"]) * TRAINING_POINTS_PER_CENTROID)
+        if count < minimum:
+            logger.info(
+                f"Índice {index_type} omitido: {count} vectores, se necesitan {minimum} "
+                "para entrenar; la base se busca de forma exacta"
+            )
+            return None
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist, faiss.METRIC_L2)
+        else:
+            index = faiss.IndexIVFPQ(
+                quantizer, dimension, nlist, _pq_m_for(dimension, params["pq_m"]), params["pq_bits"]
+            )
+        sample_size = min(count, nlist * MAX_TRAINING_POINTS_PER_CENTROID)
+        sample = np.sort(np.random.default_rng(0).choice(count, sample_size, replace=False))
+        started = time.perf_counter()
+        index.train(np.ascontiguousarray(vectors[sample], dtype=np.float32))
+        logger.info(
+            f"Índice {index_type} entrenado: nlist {nlist}, {sample_size} vectores, "
+            f"{time.perf_counter() - started:.2f}s"
+        )
+
+    for start in range(0, count, ADD_BATCH_ROWS):
+        index.add(np.ascontiguousarray(vectors[start : start + ADD_BATCH_ROWS], dtype=np.float32))
+    set_search_params(index, params)
+    return index
+
+
+def set_search_params(index: faiss.Index, params: Optional[Dict[str, Any]] = None):
+    """Aplicar nprobe / efSearch según el tipo de índice"""
+    params = resolve_params(params)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = max(1, min(params["nprobe"], ivf.nlist))
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+
+
+def index_type_of(index: Optional[faiss.Index]) -> str:
+    """Tipo (de INDEX_TYPES) de un índice construido por build_ann_index"""
+    if index is None:
+        return "flat"
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    return "ivf"
+
+
+def write_ann_index(index: faiss.Index, path: str):
+    faiss.write_index(index, path)
+
+
+def read_ann_index(path: str, params: Optional[Dict[str, Any]] = None) -> faiss.Index:
+    """Abrir un índice aproximado (las listas IVF quedan mapeadas en memoria)"""
+    index = faiss.read_index(path, faiss.IO_FLAG_MMAP)
+    set_search_params(index, params)
+    return index
+
+
+def _percentile_ms(latencies: List[float], q: float) -> float:
+    return round(float(np.percentile(latencies, q)) * 1000, 3)
+
+
+def recall_report(
+    vectors: np.ndarray,
+    index: faiss.Index,
+    k: int = 10,
+    queries: int = 200,
+    sweep: Optional[List[int]] = None,
+    params: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Medir recall@k y latencia por consulta de un índice aproximado frente a la
+    búsqueda exacta sobre los mismos vectores.
+
+    Las consultas son vectores del propio corpus con un poco de ruido. sweep
+    recorre valores de nprobe (IVF) o efSearch (HNSW); sin sweep se usa el
+    valor de params.
+    """
+    params = resolve_params(params)
+    count, dimension = vectors.shape
+    rng = np.random.default_rng(0)
+    picked = np.sort(rng.choice(count, min(queries, count), replace=False))
+    sample = np.ascontiguousarray(vectors[picked], dtype=np.float32)
+    scale = float(np.abs(sample).mean()) or 1.0
+    sample += rng.normal(0, 0.05 * scale, sample.shape).astype(np.float32)
+    k = min(k, count)
+
+    flat = faiss.IndexFlatL2(dimension)
+    for start in range(0, count, ADD_BATCH_ROWS):
+        flat.add(np.ascontiguousarray(vectors[start : start + ADD_BATCH_ROWS], dtype=np.float32))
+
+    def run(search_index):
+        latencies, results = [], []
+        for query in sample:
+            started = time.perf_counter()
+            _, positions = search_index.search(query[None, :], k)
+            latencies.append(time.perf_counter() - started)
+            results.append(positions[0])
+        return latencies, results
+
+    flat_latencies, truth = run(flat)
+    report: Dict[str, Any] = {
+        "vectors": count,
+        "dimension": dimension,
+        "queries": len(sample),
+        "k": k,
+        "index_type": index_type_of(index),
+        "flat": {
+            "p50_ms": _percentile_ms(flat_latencies, 50),
+            "p95_ms": _percentile_ms(flat_latencies, 95),
+        },
+        "results": [],
+    }
+
+    sweep_param = "ef_search" if isinstance(index, faiss.IndexHNSW) else "nprobe"
+    for value in sweep or [params[sweep_param]]:
+        set_search_params(index, dict(params, **{sweep_param: value}))
+        latencies, found = run(index)
+        hits = sum(
+            len(set(expected[expected >= 0]).intersection(got[got >= 0]))
+            for expected, got in zip(truth, found)
+        )
+        report["results"].append(
+            {
+                sweep_param: value,
+                f"recall@{k}": round(hits / (len(sample) * k), 4),
+                "p50_ms": _percentile_ms(latencies, 50),
+                "p95_ms": _percentile_ms(latencies, 95),
+                "speedup_p50": round(
+                    _percentile_ms(flat_latencies, 50) / max(_percentile_ms(latencies, 50), 1e-6), 2
+                ),
+            }
+        )
+    set_search_params(index, params)
+    return report
@@ -0,0 +1,173 @@
+"""
+Caché semántica de respuestas del LLM.
+
+Cada entrada guarda el embedding de la pregunta, los chunks recuperados y la
+respuesta generada. Una pregunta nueva reutiliza la respuesta si recuperó
+exactamente los mismos chunks (mismo contexto para el LLM) y su similitud
+coseno con una pregunta cacheada supera el umbral: "VLA del tolueno" y "valor
+límite tolueno" comparten respuesta sin una segunda llamada al modelo.
+
+Las entradas se agrupan por conjunto de chunks, así que la comparación de
+similitud solo recorre las preguntas con el mismo contexto. Cuando un
+documento cambia (reemplazo o borrado) se descartan las entradas que lo
+usaban; un documento nuevo no invalida nada, porque si entra en el contexto de
+una pregunta el conjunto de chunks ya es distinto.
+"""
+
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, FrozenSet, Hashable, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+ChunkKey = FrozenSet[Hashable]
+
+
+class _Entry:
+    __slots__ = ("vector", "chunks", "documents", "value", "expires_at", "cost_seconds")
+
+    def __init__(self, vector, chunks, documents, value, expires_at, cost_seconds):
+        self.vector = vector
+        self.chunks = chunks
+        self.documents = documents
+        self.value = value
+        self.expires_at = expires_at
+        self.cost_seconds = cost_seconds
+
+
+def _unit(vector: List[float]) -> np.ndarray:
+    array = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(array))
+    return array / norm if norm else array
+
+
+class SemanticAnswerCache:
+    """LRU de respuestas indexado por (chunks recuperados, similitud de la pregunta)"""
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl_seconds: float = 3600.0,
+        similarity_threshold: float = 0.92,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.saved_seconds = 0.0
+        self._ids = itertools.count()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._by_chunks: Dict[ChunkKey, List[int]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(
+        self, question_vector: List[float], chunks: Iterable[Hashable]
+    ) -> Optional[Tuple[Any, float]]:
+        """(respuesta, similitud) de la pregunta cacheada más parecida con los mismos chunks"""
+        if not self.enabled:
+            return None
+        chunk_key = frozenset(chunks)
+        vector = _unit(question_vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_similarity = None, self.similarity_threshold
+            for entry_id in list(self._by_chunks.get(chunk_key, ())):
+                entry = self._entries[entry_id]
+                if entry.expires_at and entry.expires_at < now:
+                    self._remove(entry_id)
+                    self.expirations += 1
+                    continue
+                similarity = float(np.dot(vector, entry.vector))
+                if similarity >= best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None:
+                self.misses += 1
+                return None
+            entry = self._entries[best_id]
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            self.saved_seconds += entry.cost_seconds
+            return entry.value, best_similarity
+
+    def put(
+        self,
+        question_vector: List[float],
+        chunks: Iterable[Hashable],
+        documents: Iterable[str],
+        value: Any,
+        cost_seconds: float = 0.0,
+    ):
+        """Guardar una respuesta con los chunks y documentos de los que depende"""
+        if not self.enabled:
+            return
+        chunk_key = frozenset(chunks)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        entry = _Entry(
+            _unit(question_vector), chunk_key, frozenset(documents), value, expires_at, cost_seconds
+        )
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._by_chunks.setdefault(chunk_key, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate_documents(self, document_ids: Iterable[str]) -> int:
+        """Descartar las respuestas que usaron alguno de los documentos; devuelve cuántas"""
+        changed = set(document_ids)
+        if not changed:
+            return 0
+        with self._lock:
+            stale = [
+                entry_id
+                for entry_id, entry in self._entries.items()
+                if not changed.isdisjoint(entry.documents)
+            ]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        """Vaciar la caché (se conservan los contadores)"""
+        with self._lock:
+            self._entries.clear()
+            self._by_chunks.clear()
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        siblings = self._by_chunks[entry.chunks]
+        siblings.remove(entry_id)
+        if not siblings:
+            del self._by_chunks[entry.chunks]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché"""
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "saved_ms": round(self.saved_seconds * 1000, 2),
+        }
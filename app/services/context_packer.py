@@ -0,0 +1,210 @@
+"""
+Ensamblado del contexto de una respuesta dentro de un presupuesto de tokens.
+
+Con chunks de 10.000 caracteres, pasar los k chunks completos al LLM envía
+sobre todo texto irrelevante. ContextPacker divide cada chunk en frases,
+descarta las repetidas (el solapamiento entre chunks consecutivos duplica
+texto), puntúa cada frase por BM25 frente a los términos de la pregunta y
+rellena el presupuesto: primero la mejor frase de cada chunk, para que ninguna
+fuente recuperada quede fuera, y después el resto por puntuación. Las frases
+elegidas se devuelven en su orden original dentro de cada chunk.
+
+Los tokens de cada frase se estiman a partir del chunk_tokens guardado en la
+ingesta (proporcional a su longitud), sin volver a tokenizar.
+"""
+
+import math
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from app.services.metadata_index import normalize_value
+
+# Fin de frase (también ";") o salto de línea: las fichas de seguridad tienen muchas tablas
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?;])\s+|\s*\n+\s*")
+_TERM = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+# Frases más largas se cortan por espacios (tablas o texto sin puntuación)
+MAX_SENTENCE_CHARS = 600
+# Separador entre frases no contiguas de un mismo chunk
+GAP_MARKER = " […] "
+_BM25_K1 = 1.2
+_BM25_B = 0.75
+
+
+def split_sentences(text: str) -> List[str]:
+    """Frases no vacías del texto, con las muy largas partidas por espacios"""
+    sentences = []
+    for sentence in _SENTENCE_BREAK.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > MAX_SENTENCE_CHARS:
+            cut = sentence.rfind(" ", 0, MAX_SENTENCE_CHARS)
+            cut = cut if cut > 0 else MAX_SENTENCE_CHARS
+            sentences.append(sentence[:cut])
+            sentence = sentence[cut:].strip()
+        if sentence:
+            sentences.append(sentence)
+    return sentences
+
+
+def text_terms(text: str) -> List[str]:
+    """Términos normalizados (sin mayúsculas ni tildes) de un texto"""
+    return _TERM.findall(normalize_value(text))
+
+
+def bm25_scores(query: str, documents_terms: List[List[str]]) -> List[float]:
+    """BM25 de cada documento (lista de términos) frente a la consulta, con IDF sobre ellos"""
+    query_terms = set(text_terms(query))
+    if not documents_terms or not query_terms:
+        return [0.0] * len(documents_terms)
+    document_frequency = dict.fromkeys(query_terms, 0)
+    for terms in documents_terms:
+        for term in query_terms.intersection(terms):
+            document_frequency[term] += 1
+    total = len(documents_terms)
+    average_length = sum(len(terms) for terms in documents_terms) / total or 1.0
+    idf = {
+        term: math.log(1 + (total - df + 0.5) / (df + 0.5))
+        for term, df in document_frequency.items()
+        if df
+    }
+    scores = []
+    for terms in documents_terms:
+        length_norm = _BM25_K1 * (1 - _BM25_B + _BM25_B * len(terms) / average_length)
+        score = 0.0
+        for term, weight in idf.items():
+            frequency = terms.count(term)
+            if frequency:
+                score += weight * frequency * (_BM25_K1 + 1) / (frequency + length_norm)
+        scores.append(score)
+    return scores
+
+
+class _Sentence:
+    __slots__ = ("rank", "position", "text", "tokens", "terms", "score")
+
+    def __init__(self, rank: int, position: int, text: str, tokens: int):
+        self.rank = rank
+        self.position = position
+        self.text = text
+        self.tokens = tokens
+        self.terms = text_terms(text)
+        self.score = 0.0
+
+
+class ContextPacker:
+    """Recorta los chunks recuperados a las frases más relevantes dentro de un presupuesto"""
+
+    def __init__(
+        self,
+        token_budget: int,
+        count_tokens: Optional[Callable[[List[str]], List[int]]] = None,
+    ):
+        self.token_budget = token_budget
+        self.count_tokens = count_tokens
+
+    def _chunk_tokens(self, docs: List[Document]) -> List[int]:
+        """chunk_tokens guardados; los chunks legados sin recuento se tokenizan"""
+        counts = [doc.metadata.get("chunk_tokens") for doc in docs]
+        missing = [doc.page_content for doc, count in zip(docs, counts) if count is None]
+        if missing:
+            if self.count_tokens is not None:
+                measured = iter(self.count_tokens(missing))
+            else:
+                measured = iter(len(text) // 4 for text in missing)
+            counts = [next(measured) if count is None else count for count in counts]
+        return counts
+
+    def pack(self, question: str, docs: List[Document]) -> Tuple[List[Document], Dict[str, int]]:
+        """Documentos recortados para el prompt y recuento de tokens antes/después"""
+        chunk_tokens = self._chunk_tokens(docs)
+        retrieved = sum(chunk_tokens)
+        if self.token_budget <= 0 or retrieved <= self.token_budget:
+            return docs, {
+                "retrieved_tokens": retrieved,
+                "packed_tokens": retrieved,
+                "token_budget": self.token_budget,
+                "duplicates_dropped": 0,
+            }
+
+        candidates: List[_Sentence] = []
+        seen = set()
+        duplicates = 0
+        for rank, (doc, tokens) in enumerate(zip(docs, chunk_tokens)):
+            text = doc.page_content
+            tokens_per_char = tokens / max(1, len(text))
+            for position, sentence in enumerate(split_sentences(text)):
+                key = normalize_value(sentence)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                estimate = max(1, round(len(sentence) * tokens_per_char))
+                candidates.append(_Sentence(rank, position, sentence, estimate))
+
+        self._score(question, candidates)
+        selected = self._select(candidates, len(docs))
+
+        packed_docs = []
+        packed_tokens = 0
+        for rank, doc in enumerate(docs):
+            chosen = sorted(
+                (sentence for sentence in selected if sentence.rank == rank),
+                key=lambda sentence: sentence.position,
+            )
+            if not chosen:
+                continue
+            parts = [chosen[0].text]
+            for previous, sentence in zip(chosen, chosen[1:]):
+                parts.append(" " if sentence.position == previous.position + 1 else GAP_MARKER)
+                parts.append(sentence.text)
+            tokens = sum(sentence.tokens for sentence in chosen)
+            packed_tokens += tokens
+            packed_docs.append(
+                Document(
+                    page_content="".join(parts),
+                    metadata={**doc.metadata, "packed_tokens": tokens},
+                )
+            )
+
+        return packed_docs, {
+            "retrieved_tokens": retrieved,
+            "packed_tokens": packed_tokens,
+            "token_budget": self.token_budget,
+            "duplicates_dropped": duplicates,
+        }
+
+    @staticmethod
+    def _score(question: str, candidates: List[_Sentence]):
+        """BM25 de cada frase frente a los términos de la pregunta (IDF sobre las candidatas)"""
+        scores = bm25_scores(question, [sentence.terms for sentence in candidates])
+        for sentence, score in zip(candidates, scores):
+            sentence.score = score
+
+    def _select(self, candidates: List[_Sentence], chunks: int) -> List[_Sentence]:
+        """La mejor frase de cada chunk y después el resto por puntuación, hasta el presupuesto"""
+        used = 0
+        selected = []
+        chosen = set()
+
+        best: Dict[int, _Sentence] = {}
+        for sentence in candidates:
+            current = best.get(sentence.rank)
+            if current is None or sentence.score > current.score:
+                best[sentence.rank] = sentence
+        for rank in range(chunks):
+            sentence = best.get(rank)
+            if sentence is not None and used + sentence.tokens <= self.token_budget:
+                selected.append(sentence)
+                chosen.add(id(sentence))
+                used += sentence.tokens
+
+        ranked = sorted(
+            (s for s in candidates if s.score > 0 and id(s) not in chosen),
+            key=lambda s: (-s.score, s.rank, s.position),
+        )
+        for sentence in ranked:
+            if used + sentence.tokens <= self.token_budget:
+                selected.append(sentence)
+                used += sentence.tokens
+        return selected
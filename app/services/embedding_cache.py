@@ -0,0 +1,150 @@
+"""
+Caché persistente de embeddings direccionada por contenido.
+
+Cada entrada se indexa por (nombre del modelo de embeddings, SHA-256 del texto),
+de modo que volver a subir el mismo documento no vuelve a pagar el coste de los
+embeddings. Se almacena en SQLite con expulsión LRU acotada por número de entradas.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 del texto de un chunk"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Caché LRU de embeddings en disco (SQLite)"""
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)"
+        )
+        self._conn.commit()
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[int, List[float]]:
+        """Buscar embeddings cacheados; devuelve {posición: vector} para los aciertos"""
+        hashes = [hash_text(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+
+        with self._lock:
+            unique_hashes = list(dict.fromkeys(hashes))
+            # SQLite limita el número de parámetros por consulta
+            for start in range(0, len(unique_hashes), 500):
+                chunk = unique_hashes[start : start + 500]
+                placeholders = ",".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found],
+                )
+                self._conn.commit()
+
+            result = {i: found[h] for i, h in enumerate(hashes) if h in found}
+            self.hits += len(result)
+            self.misses += len(hashes) - len(result)
+
+        return result
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        """Buscar un único embedding cacheado"""
+        return self.get_many(model, [text]).get(0)
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """Guardar embeddings y aplicar la expulsión LRU si se supera el límite"""
+        now = time.time()
+        rows = [
+            (model, hash_text(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def put(self, model: str, text: str, vector: List[float]):
+        """Guardar un único embedding"""
+        self.put_many(model, [text], [vector])
+
+    def _evict(self):
+        """Eliminar las entradas menos usadas recientemente por encima del límite"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE rowid IN ("
+                "SELECT rowid FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+            logger.info(f"Caché de embeddings: {excess} entradas expulsadas (LRU)")
+
+    def clear(self):
+        """Vaciar la caché"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
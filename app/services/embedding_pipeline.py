@@ -0,0 +1,281 @@
+"""
+Etapa de embeddings por lotes y concurrente para la ingesta RAG.
+
+Divide los chunks en lotes de tamaño configurable, los envía a un pool
+acotado de workers, reintenta con backoff exponencial ante errores de
+límite de cuota y reensambla los vectores en el orden original de los chunks.
+
+Si se configura una EmbeddingCache, solo los chunks no cacheados llegan al
+embedder remoto.
+
+Incluye un embedder local determinista (LocalHashEmbeddings) para poder medir
+el throughput de la etapa sin llamar a la API remota.
+"""
+
+import hashlib
+import logging
+import math
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain.schema.embeddings import Embeddings
+
+from app.services.embedding_cache import EmbeddingCache
+
+try:
+    from google.api_core import exceptions as google_exceptions
+except ImportError:  # pragma: no cover - dependencia transitiva de google-generativeai
+    google_exceptions = None
+
+try:
+    import google.generativeai as genai
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+except ImportError:  # pragma: no cover - solo necesario con embeddings de Gemini
+    genai = None
+    GoogleGenerativeAIEmbeddings = None
+
+
+logger = logging.getLogger(__name__)
+
+# Callback de progreso: (chunks_completados, chunks_totales)
+ProgressCallback = Callable[[int, int], None]
+
+RATE_LIMIT_MARKERS = ("429", "resource exhausted", "resource_exhausted", "quota", "rate limit")
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Determinar si una excepción corresponde a un límite de cuota de la API"""
+    if google_exceptions is not None and isinstance(
+        error, (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+    ):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in RATE_LIMIT_MARKERS)
+
+
+def embed_google_queries(
+    model: str,
+    texts: List[str],
+    task_type: str = "retrieval_query",
+    batch_size: int = 100,
+) -> List[List[float]]:
+    """
+    Embeber varias consultas con la API de Gemini en peticiones por lotes.
+
+    En langchain-google-genai 0.0.6 tanto embed_query() como embed_documents()
+    envían el task_type de documento (salvo que se fije task_type en el
+    constructor); genai.embed_content acepta una lista de textos con el de
+    consulta. La API la deja configurada el propio GoogleGenerativeAIEmbeddings
+    al construirse.
+    """
+    if genai is None:
+        raise ImportError("google-generativeai no está instalado")
+    vectors: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        batch = texts[start : start + batch_size]
+        result = genai.embed_content(model=model, content=batch, task_type=task_type)
+        batch_vectors = result["embedding"]
+        if len(batch_vectors) != len(batch):
+            raise ValueError(
+                f"La API devolvió {len(batch_vectors)} vectores para {len(batch)} consultas"
+            )
+        vectors.extend(batch_vectors)
+    return vectors
+
+
+def embed_queries(
+    embeddings: Embeddings, texts: List[str], batch_size: int = 100
+) -> List[List[float]]:
+    """
+    Embeddings de consultas por un único camino, sea cual sea el número de textos.
+
+    Una consulta debe dar el mismo vector sola o dentro de un lote: las cachés
+    de consultas no distinguen cómo se calculó. Con Gemini todas pasan por
+    embed_google_queries con el task_type de consulta; los embedders locales
+    son simétricos (consulta = documento) y usan embed_documents.
+    """
+    if not texts:
+        return []
+    if GoogleGenerativeAIEmbeddings is not None and isinstance(
+        embeddings, GoogleGenerativeAIEmbeddings
+    ):
+        return embed_google_queries(
+            embeddings.model,
+            texts,
+            task_type=embeddings.task_type or "retrieval_query",
+            batch_size=batch_size,
+        )
+    return embeddings.embed_documents(texts)
+
+
+class EmbeddingPipeline:
+    """Pipeline de embeddings por lotes con pool de workers acotado"""
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = 32,
+        max_workers: int = 4,
+        max_retries: int = 5,
+        backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+        cache: Optional[EmbeddingCache] = None,
+        model_name: str = "",
+    ):
+        if batch_size < 1:
+            raise ValueError("batch_size debe ser mayor que 0")
+        if max_workers < 1:
+            raise ValueError("max_workers debe ser mayor que 0")
+
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.cache = cache
+        self.model_name = model_name
+
+    def embed_texts(
+        self,
+        texts: List[str],
+        progress_callback: Optional[ProgressCallback] = None,
+        use_cache: bool = True,
+    ) -> Dict[str, Any]:
+        """Calcular los embeddings de todos los textos preservando su orden"""
+        started = time.perf_counter()
+        total = len(texts)
+        vectors: List[Optional[List[float]]] = [None] * total
+
+        cached = {}
+        if self.cache is not None and use_cache and texts:
+            cached = self.cache.get_many(self.model_name, texts)
+            for position, vector in cached.items():
+                vectors[position] = vector
+
+        # Textos pendientes, sin repetir los idénticos dentro de la misma carga
+        pending_positions: Dict[str, List[int]] = {}
+        for position, text in enumerate(texts):
+            if vectors[position] is None:
+                pending_positions.setdefault(text, []).append(position)
+        pending_texts = list(pending_positions)
+
+        batches = [
+            (start, pending_texts[start : start + self.batch_size])
+            for start in range(0, len(pending_texts), self.batch_size)
+        ]
+
+        completed = total - sum(len(p) for p in pending_positions.values())
+        retries = 0
+        if completed and progress_callback:
+            progress_callback(completed, total)
+
+        if batches:
+            workers = min(self.max_workers, len(batches))
+            with ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix="embedding"
+            ) as executor:
+                futures = {
+                    executor.submit(self._embed_batch, batch): (start, len(batch))
+                    for start, batch in batches
+                }
+                for future in as_completed(futures):
+                    start, size = futures[future]
+                    batch_vectors, batch_retries = future.result()
+                    batch_texts = pending_texts[start : start + size]
+                    for text, vector in zip(batch_texts, batch_vectors):
+                        for position in pending_positions[text]:
+                            vectors[position] = vector
+                        completed += len(pending_positions[text])
+                    retries += batch_retries
+
+                    if self.cache is not None and use_cache:
+                        self.cache.put_many(self.model_name, batch_texts, batch_vectors)
+
+                    logger.info(f"Embeddings: {completed}/{total} chunks completados")
+                    if progress_callback:
+                        progress_callback(completed, total)
+
+        elapsed = time.perf_counter() - started
+        return {
+            "vectors": vectors,
+            "stats": {
+                "chunks": total,
+                "batches": len(batches),
+                "batch_size": self.batch_size,
+                "max_workers": self.max_workers,
+                "retries": retries,
+                "cache_hits": len(cached),
+                "embedded": len(pending_texts),
+                "seconds": round(elapsed, 4),
+                "chunks_per_second": round(total / elapsed, 2) if elapsed > 0 else 0.0,
+            },
+        }
+
+    def _embed_batch(self, batch: List[str]) -> Tuple[List[List[float]], int]:
+        """Embeber un lote con reintentos y backoff exponencial ante límites de cuota"""
+        attempt = 0
+        while True:
+            try:
+                batch_vectors = self.embeddings.embed_documents(batch)
+                if len(batch_vectors) != len(batch):
+                    raise ValueError(
+                        f"El embedder devolvió {len(batch_vectors)} vectores para {len(batch)} textos"
+                    )
+                return batch_vectors, attempt
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                delay = min(
+                    self.max_backoff_seconds, self.backoff_seconds * (2**attempt)
+                )
+                # Jitter para que los workers no reintenten todos a la vez
+                delay *= 0.5 + random.random() / 2
+                attempt += 1
+                logger.warning(
+                    f"Límite de cuota en embeddings, reintento {attempt}/{self.max_retries} en {delay:.2f}s"
+                )
+                time.sleep(delay)
+
+
+class LocalHashEmbeddings(Embeddings):
+    """Embedder local determinista (feature hashing) para pruebas y benchmarks sin conexión"""
+
+    TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+    def __init__(
+        self,
+        dimension: int = 768,
+        latency_seconds: float = 0.0,
+        per_text_latency_seconds: float = 0.0,
+    ):
+        self.dimension = dimension
+        self.latency_seconds = latency_seconds
+        self.per_text_latency_seconds = per_text_latency_seconds
+
+    def _vector(self, text: str) -> List[float]:
+        """Proyectar los tokens del texto en un vector unitario mediante hashing"""
+        values = [0.0] * self.dimension
+        for token in self.TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            values[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in values)) or 1.0
+        return [v / norm for v in values]
+
+    def _simulate_latency(self, count: int):
+        """Simular la latencia de una llamada remota"""
+        delay = self.latency_seconds + self.per_text_latency_seconds * count
+        if delay > 0:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._simulate_latency(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._simulate_latency(1)
+        return self._vector(text)
@@ -0,0 +1,183 @@
+"""
+Caché persistente del enriquecimiento de riesgo por químico.
+
+Cada entrada guarda, para un (químico, país), el contexto recuperado por
+objetivo de la FDS y la entrada de quimicos_datos sintetizada, junto con la
+versión del corpus de ese químico con la que se calcularon. Una tarea que
+repite químicos ya enriquecidos solo paga la recuperación y la síntesis de los
+nuevos.
+
+El nombre del químico (o su CAS) y el país se normalizan como los filtros de
+metadatos (sin mayúsculas ni tildes). La versión la da el cliente vectorial y
+cambia cuando se vuelve a ingerir una FDS del químico: una entrada con otra
+versión se descarta al leerla. Las entradas caducan por TTL y, por encima del
+límite, se expulsan las menos usadas recientemente (LRU). Se almacena en
+SQLite, como la caché de embeddings.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from app.services.metadata_index import normalize_value
+
+
+logger = logging.getLogger(__name__)
+
+
+class EnrichmentCache:
+    """Caché (químico, país, versión del corpus) -> enriquecimiento, en disco (SQLite)"""
+
+    def __init__(self, path: str, max_entries: int = 5000, ttl_seconds: float = 86400.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS enrichment (
+                chemical TEXT NOT NULL,
+                country TEXT NOT NULL,
+                corpus_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (chemical, country)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_enrichment_last_access ON enrichment (last_access)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def _key(chemical: str, country: str):
+        return normalize_value(chemical), normalize_value(country)
+
+    def get(self, chemical: str, country: str, corpus_version: str) -> Optional[Dict[str, Any]]:
+        """Enriquecimiento cacheado, o None si no existe, caducó o cambió el corpus"""
+        key = self._key(chemical, country)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT corpus_version, value, created_at FROM enrichment "
+                "WHERE chemical = ? AND country = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            stored_version, value, created_at = row
+            if stored_version != corpus_version:
+                self.invalidations += 1
+                stale = True
+            elif self.ttl_seconds > 0 and created_at + self.ttl_seconds < now:
+                self.expirations += 1
+                stale = True
+            else:
+                stale = False
+            if stale:
+                self._conn.execute(
+                    "DELETE FROM enrichment WHERE chemical = ? AND country = ?", key
+                )
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE enrichment SET last_access = ? WHERE chemical = ? AND country = ?",
+                (now, *key),
+            )
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(value)
+
+    def put(self, chemical: str, country: str, corpus_version: str, value: Dict[str, Any]):
+        """Guardar el enriquecimiento de un químico (sustituye al de otra versión)"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO enrichment "
+                "(chemical, country, corpus_version, value, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    *self._key(chemical, country),
+                    corpus_version,
+                    json.dumps(value, ensure_ascii=False),
+                    now,
+                    now,
+                ),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def invalidate(self, chemical: str, country: Optional[str] = None) -> int:
+        """Descartar las entradas de un químico (en un país o en todos); devuelve cuántas"""
+        with self._lock:
+            if country is None:
+                cursor = self._conn.execute(
+                    "DELETE FROM enrichment WHERE chemical = ?", (normalize_value(chemical),)
+                )
+            else:
+                cursor = self._conn.execute(
+                    "DELETE FROM enrichment WHERE chemical = ? AND country = ?",
+                    self._key(chemical, country),
+                )
+            self._conn.commit()
+            self.invalidations += cursor.rowcount
+        return cursor.rowcount
+
+    def _evict(self):
+        """Eliminar las entradas menos usadas recientemente por encima del límite"""
+        count = self._conn.execute("SELECT COUNT(*) FROM enrichment").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM enrichment WHERE rowid IN ("
+                "SELECT rowid FROM enrichment ORDER BY last_access ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+            logger.info(f"Caché de enriquecimiento: {excess} entradas expulsadas (LRU)")
+
+    def clear(self):
+        """Vaciar la caché"""
+        with self._lock:
+            self._conn.execute("DELETE FROM enrichment")
+            self._conn.commit()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM enrichment").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "enabled": True,
+            "path": self.path,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,446 @@
+"""
+Vector store FAISS con altas y bajas incrementales.
+
+LangChain reconstruye el mapeo posición -> ID completo en cada delete() y
+calcula la posición de los nuevos vectores con len(index_to_docstore_id),
+por lo que borrar un documento cuesta O(tamaño del corpus). Esta subclase
+marca las posiciones borradas como tombstones (coste proporcional al
+documento), las salta al buscar y compacta el índice físicamente solo cuando
+los huecos superan una fracción del total.
+
+Además lleva un diario de los IDs añadidos y borrados desde la última
+persistencia, para que el almacén de segmentos escriba solo los cambios.
+
+Las búsquedas leen el store sin lock, así que las escrituras no lo modifican:
+se hacen sobre una copia (fork) que se publica al confirmar. La copia comparte
+la base mapeada en memoria, que es de solo lectura, y duplica el resto.
+"""
+
+import logging
+import operator
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain.docstore.in_memory import InMemoryDocstore
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+
+logger = logging.getLogger(__name__)
+
+
+class ForkableDocstore(InMemoryDocstore):
+    """InMemoryDocstore que se puede copiar para una escritura copy-on-write"""
+
+    def fork(self) -> "ForkableDocstore":
+        return ForkableDocstore(dict(self._dict))
+
+
+class IncrementalFAISS(FAISS):
+    """FAISS de LangChain con borrado por tombstones y compactación diferida"""
+
+    # Fracción de posiciones borradas a partir de la cual se compacta el índice
+    COMPACTION_RATIO = 0.25
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        # load_local() reenvía kwargs que el constructor base no acepta
+        kwargs.pop("allow_dangerous_deserialization", None)
+        super().__init__(*args, **kwargs)
+        self._rebuild_lookup()
+        self._added_ids: Dict[str, None] = {}
+        self._deleted_ids: List[str] = []
+
+    @classmethod
+    def from_faiss(cls, store: FAISS) -> "IncrementalFAISS":
+        """Convertir un FAISS de LangChain ya cargado"""
+        if isinstance(store, cls):
+            return store
+        return cls(
+            store.embedding_function,
+            store.index,
+            store.docstore,
+            store.index_to_docstore_id,
+            normalize_L2=store._normalize_L2,
+            distance_strategy=store.distance_strategy,
+        )
+
+    @classmethod
+    def empty(cls, embedding: Embeddings, dimension: int, **kwargs: Any) -> "IncrementalFAISS":
+        """Crear un vector store vacío de la dimensión indicada"""
+        if kwargs.get("distance_strategy") == DistanceStrategy.MAX_INNER_PRODUCT:
+            index = faiss.IndexFlatIP(dimension)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+        return cls(embedding, index, ForkableDocstore(), {}, **kwargs)
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        embedding: Embeddings,
+        metadatas: Optional[Iterable[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "IncrementalFAISS":
+        """Crear el vector store a partir de embeddings ya calculados"""
+        text_embeddings = list(text_embeddings)
+        store = cls.empty(embedding, len(text_embeddings[0][1]), **kwargs)
+        store.add_embeddings(
+            text_embeddings,
+            metadatas=list(metadatas) if metadatas is not None else None,
+            ids=ids,
+        )
+        return store
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> "IncrementalFAISS":
+        embeddings = embedding.embed_documents(texts)
+        return cls.from_embeddings(
+            zip(texts, embeddings), embedding, metadatas=metadatas, ids=ids, **kwargs
+        )
+
+    def fork(self) -> "IncrementalFAISS":
+        """
+        Copia independiente para escribir sin tocar el store que leen las búsquedas.
+
+        Se copian el índice (de un LayeredIndex, solo el delta en memoria), el
+        docstore en memoria, los mapeos de posiciones y el diario de cambios.
+        """
+        if hasattr(self.index, "fork"):
+            index = self.index.fork()
+        else:
+            index = faiss.clone_index(self.index)
+        if hasattr(self.docstore, "fork"):
+            docstore = self.docstore.fork()
+        else:
+            # Docstores cargados con load_local (formato legado)
+            docstore = ForkableDocstore(
+                {
+                    docstore_id: self._document(docstore_id)
+                    for docstore_id in self.index_to_docstore_id.values()
+                }
+            )
+        store = IncrementalFAISS(
+            self.embedding_function,
+            index,
+            docstore,
+            dict(self.index_to_docstore_id),
+            normalize_L2=self._normalize_L2,
+            distance_strategy=self.distance_strategy,
+        )
+        store._added_ids = dict(self._added_ids)
+        store._deleted_ids = list(self._deleted_ids)
+        return store
+
+    def _rebuild_lookup(self):
+        """Reconstruir el mapeo inverso y los tombstones a partir del índice"""
+        self._docstore_id_to_index = {
+            docstore_id: position
+            for position, docstore_id in self.index_to_docstore_id.items()
+        }
+        self._tombstones = set(range(self.index.ntotal)).difference(
+            self.index_to_docstore_id
+        )
+
+    @property
+    def tombstone_count(self) -> int:
+        return len(self._tombstones)
+
+    def contains(self, docstore_id: str) -> bool:
+        """Indicar si un ID del docstore está indexado"""
+        return docstore_id in self._docstore_id_to_index
+
+    def drain_changes(self) -> Tuple[List[str], List[str]]:
+        """Devolver y olvidar los IDs añadidos y borrados desde la última llamada"""
+        added, deleted = list(self._added_ids), self._deleted_ids
+        self._added_ids, self._deleted_ids = {}, []
+        return added, deleted
+
+    def get_vectors(self, ids: List[str]) -> np.ndarray:
+        """Vectores almacenados (ya normalizados) de los IDs indicados"""
+        if not ids:
+            return np.empty((0, self.index.d), dtype=np.float32)
+        positions = np.array(
+            [self._docstore_id_to_index[docstore_id] for docstore_id in ids], dtype=np.int64
+        )
+        return np.asarray(self.index.reconstruct_batch(positions), dtype=np.float32)
+
+    def similarity_search_with_score_among(
+        self,
+        embedding: List[float],
+        ids: Iterable[str],
+        k: int = 4,
+        batch_size: int = 4096,
+    ) -> List[Tuple[Document, float]]:
+        """
+        Búsqueda exacta restringida a los IDs indicados (p. ej. los que cumplen
+        un filtro de metadatos): solo se leen y comparan esos vectores.
+        """
+        return self.similarity_search_with_score_among_batch([embedding], ids, k, batch_size)[0]
+
+    def similarity_search_with_score_among_batch(
+        self,
+        embeddings: List[List[float]],
+        ids: Iterable[str],
+        k: int = 4,
+        batch_size: int = 4096,
+    ) -> List[List[Tuple[Document, float]]]:
+        """Varias consultas restringidas a los mismos IDs: cada bloque de vectores se lee una vez"""
+        queries = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(queries)
+        candidates = [docstore_id for docstore_id in ids if docstore_id in self._docstore_id_to_index]
+        if not candidates or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        inner_product = self.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+        query_norms = (queries * queries).sum(axis=1)[:, None]
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_positions = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(candidates), batch_size):
+            vectors = self.get_vectors(candidates[start : start + batch_size])
+            products = queries @ vectors.T
+            if inner_product:
+                scores = products
+            else:
+                scores = query_norms - 2.0 * products + (vectors * vectors).sum(axis=1)[None, :]
+            positions = np.broadcast_to(
+                np.arange(start, start + len(vectors), dtype=np.int64), scores.shape
+            )
+            merged_scores = np.hstack([best_scores, scores.astype(np.float32)])
+            merged_positions = np.hstack([best_positions, positions])
+            # Menor distancia primero (o mayor producto interno)
+            order = np.argsort(
+                -merged_scores if inner_product else merged_scores, axis=1, kind="stable"
+            )[:, :k]
+            best_scores = np.take_along_axis(merged_scores, order, axis=1)
+            best_positions = np.take_along_axis(merged_positions, order, axis=1)
+
+        return [
+            [
+                (self._document(candidates[position]), float(score))
+                for score, position in zip(row_scores, row_positions)
+            ]
+            for row_scores, row_positions in zip(best_scores, best_positions)
+        ]
+
+    def similarity_search_with_score_by_vectors(
+        self, embeddings: List[List[float]], k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """Varias consultas con una sola llamada vectorizada a index.search"""
+        queries = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(queries)
+        # Pedir tantos extra como tombstones para no quedarnos cortos
+        search_k = min(k + len(self._tombstones), self.index.ntotal)
+        if search_k <= 0 or not len(queries):
+            return [[] for _ in range(len(queries))]
+        scores, indices = self.index.search(queries, search_k)
+
+        results = []
+        for row_scores, row_positions in zip(scores, indices):
+            docs = []
+            for score, position in zip(row_scores, row_positions):
+                docstore_id = self.index_to_docstore_id.get(int(position))
+                if position == -1 or docstore_id is None:
+                    continue
+                docs.append((self._document(docstore_id), float(score)))
+                if len(docs) >= k:
+                    break
+            results.append(docs)
+        return results
+
+    def _document(self, docstore_id: str) -> Document:
+        doc = self.docstore.search(docstore_id)
+        if not isinstance(doc, Document):
+            raise ValueError(f"Could not find document for id {docstore_id}, got {doc}")
+        return doc
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        embeddings = self._embed_documents(texts)
+        return self.add_embeddings(zip(texts, embeddings), metadatas=metadatas, ids=ids)
+
+    def add_embeddings(
+        self,
+        text_embeddings: Iterable[Tuple[str, List[float]]],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        """Añadir vectores; las posiciones nuevas parten de index.ntotal"""
+        texts, embeddings = zip(*text_embeddings)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        if not (len(texts) == len(metadatas) == len(ids)):
+            raise ValueError("texts, metadatas e ids deben tener la misma longitud")
+
+        vectors = np.array(embeddings, dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vectors)
+
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        return self._add_vectors(vectors, documents, list(ids))
+
+    def _add_vectors(
+        self, vectors: np.ndarray, documents: List[Document], ids: List[str]
+    ) -> List[str]:
+        """Añadir vectores ya normalizados junto con sus documentos"""
+        duplicated = [docstore_id for docstore_id in ids if self.contains(docstore_id)]
+        if duplicated:
+            raise ValueError(f"IDs ya existentes en el índice: {duplicated[:5]}")
+
+        start = self.index.ntotal
+        self.index.add(vectors)
+        self.docstore.add(dict(zip(ids, documents)))
+        for offset, docstore_id in enumerate(ids):
+            self.index_to_docstore_id[start + offset] = docstore_id
+            self._docstore_id_to_index[docstore_id] = start + offset
+            self._added_ids[docstore_id] = None
+        return ids
+
+    def merge_from(
+        self,
+        target: "IncrementalFAISS",
+        ids: Optional[List[str]] = None,
+        new_ids: Optional[List[str]] = None,
+        metadata_updates: Optional[Dict[str, Any]] = None,
+        batch_size: int = 1024,
+    ) -> List[str]:
+        """
+        Copiar vectores y documentos de otro store sin volver a embeber.
+
+        Permite renombrar los IDs (new_ids) y completar los metadatos de los
+        documentos copiados; la copia se hace por lotes para acotar la memoria.
+        """
+        ids = list(target.index_to_docstore_id.values()) if ids is None else ids
+        new_ids = ids if new_ids is None else new_ids
+        if len(ids) != len(new_ids):
+            raise ValueError("ids y new_ids deben tener la misma longitud")
+
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start : start + batch_size]
+            vectors = target.get_vectors(batch)
+            documents = []
+            for docstore_id in batch:
+                doc = target.docstore.search(docstore_id)
+                metadata = dict(doc.metadata, **(metadata_updates or {}))
+                documents.append(Document(page_content=doc.page_content, metadata=metadata))
+            self._add_vectors(vectors, documents, new_ids[start : start + batch_size])
+        return list(new_ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Borrar por ID en O(len(ids)); los vectores quedan como tombstones"""
+        if ids is None:
+            raise ValueError("No ids provided to delete.")
+        missing = [docstore_id for docstore_id in ids if not self.contains(docstore_id)]
+        if missing:
+            raise ValueError(f"IDs no encontrados en el índice: {missing[:5]}")
+
+        for docstore_id in ids:
+            position = self._docstore_id_to_index.pop(docstore_id)
+            del self.index_to_docstore_id[position]
+            self._tombstones.add(position)
+            # Un ID añadido y borrado antes de persistir no llega al disco
+            if self._added_ids.pop(docstore_id, False) is False:
+                self._deleted_ids.append(docstore_id)
+        self.docstore.delete(ids)
+
+        if self.index.ntotal and (
+            len(self._tombstones) / self.index.ntotal > self.COMPACTION_RATIO
+        ):
+            self.compact()
+        return True
+
+    def compact(self):
+        """
+        Eliminar físicamente los tombstones y renumerar las posiciones.
+
+        Se compacta una copia del índice y se sustituye al final: el índice
+        anterior puede seguir en uso por una búsqueda sin lock.
+        """
+        # Los índices con base de solo lectura se compactan al escribir un checkpoint
+        if not self._tombstones or not getattr(self.index, "compactable", True):
+            return
+        removed = len(self._tombstones)
+        index = faiss.clone_index(self.index)
+        index.remove_ids(np.array(sorted(self._tombstones), dtype=np.int64))
+        self.index = index
+        surviving = [
+            docstore_id for _, docstore_id in sorted(self.index_to_docstore_id.items())
+        ]
+        self.index_to_docstore_id = dict(enumerate(surviving))
+        self._rebuild_lookup()
+        logger.info(f"Índice FAISS compactado: {removed} vectores eliminados")
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        fetch_k: int = 20,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Búsqueda por vector que ignora las posiciones borradas"""
+        vector = np.array([embedding], dtype=np.float32)
+        if self._normalize_L2:
+            faiss.normalize_L2(vector)
+
+        wanted = k if filter is None else max(fetch_k, k)
+        # Pedir tantos extra como tombstones para no quedarnos cortos
+        search_k = min(wanted + len(self._tombstones), self.index.ntotal)
+        if search_k <= 0:
+            return []
+        scores, indices = self.index.search(vector, search_k)
+
+        if filter is not None:
+            filter = {
+                key: value if isinstance(value, list) else [value]
+                for key, value in filter.items()
+            }
+
+        docs = []
+        for score, position in zip(scores[0], indices[0]):
+            docstore_id = self.index_to_docstore_id.get(int(position))
+            if position == -1 or docstore_id is None:
+                continue
+            doc = self.docstore.search(docstore_id)
+            if not isinstance(doc, Document):
+                raise ValueError(f"Could not find document for id {docstore_id}, got {doc}")
+            if filter is None or all(
+                doc.metadata.get(key) in value for key, value in filter.items()
+            ):
+                docs.append((doc, score))
+            if filter is not None and len(docs) >= k:
+                break
+
+        score_threshold = kwargs.get("score_threshold")
+        if score_threshold is not None:
+            cmp = (
+                operator.ge
+                if self.distance_strategy
+                in (DistanceStrategy.MAX_INNER_PRODUCT, DistanceStrategy.JACCARD)
+                else operator.le
+            )
+            docs = [(doc, score) for doc, score in docs if cmp(score, score_threshold)]
+        return docs[:k]
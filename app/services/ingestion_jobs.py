@@ -0,0 +1,222 @@
+"""
+Cola de trabajos de ingesta en segundo plano.
+
+POST /ingest devuelve un job_id de inmediato y la ingesta corre en un pool de
+hilos de tamaño acotado, para que la indexación no acapare los workers HTTP
+que atienden las consultas. Cada trabajo registra el progreso y el tiempo de
+cada etapa (extracción, troceado, embeddings, confirmación) para consultarlo
+con GET /jobs/<id>.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Etapas de una ingesta, en el orden en que se inician
+INGEST_STAGES = ["extraction", "chunking", "embedding", "commit"]
+
+
+class QueueFullError(Exception):
+    """La cola de ingesta ha alcanzado su límite de trabajos pendientes"""
+
+
+class StageTracker:
+    """Progreso y tiempo acumulado por etapa de una ingesta"""
+
+    def __init__(self, stages: Optional[List[str]] = None):
+        self._stage_lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, Any]] = {
+            name: {"status": "pending", "seconds": 0.0, "done": 0, "total": None}
+            for name in (stages or INGEST_STAGES)
+        }
+
+    def _stage(self, name: str) -> Dict[str, Any]:
+        return self.stages.setdefault(
+            name, {"status": "pending", "seconds": 0.0, "done": 0, "total": None}
+        )
+
+    @contextmanager
+    def track(self, name: str) -> Iterator[None]:
+        """Acumular en la etapa el tiempo del bloque (las etapas pueden solaparse)"""
+        started = time.perf_counter()
+        with self._stage_lock:
+            stage = self._stage(name)
+            if stage["status"] == "pending":
+                stage["status"] = "running"
+        try:
+            yield
+        finally:
+            with self._stage_lock:
+                stage["seconds"] += time.perf_counter() - started
+
+    def progress(self, name: str, done: int, total: Optional[int] = None):
+        """Actualizar el avance de una etapa"""
+        with self._stage_lock:
+            stage = self._stage(name)
+            stage["done"] = done
+            stage["total"] = total
+
+    def finish(self, name: str):
+        """Marcar una etapa como completada"""
+        with self._stage_lock:
+            self._stage(name)["status"] = "completed"
+
+    def stages_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Copia serializable de las etapas"""
+        with self._stage_lock:
+            return {
+                name: dict(stage, seconds=round(stage["seconds"], 4))
+                for name, stage in self.stages.items()
+            }
+
+
+class IngestionJob(StageTracker):
+    """Trabajo de ingesta encolado"""
+
+    def __init__(self, description: Optional[Dict[str, Any]] = None):
+        super().__init__()
+        self.job_id = uuid.uuid4().hex
+        self.description = description or {}
+        self.status = "queued"
+        self.created_at = datetime.now().isoformat()
+        self.started_at: Optional[str] = None
+        self.finished_at: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Estado del trabajo para la API"""
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "description": self.description,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "seconds": self.seconds,
+            "stages": self.stages_dict(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestionJobQueue:
+    """Pool acotado de trabajos de ingesta con registro de los más recientes"""
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 32, max_retained: int = 200):
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max_pending
+        self.max_retained = max_retained
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="rag-ingest"
+        )
+
+    def _pending_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if not job.finished)
+
+    def submit(
+        self,
+        func: Callable[[IngestionJob], Dict[str, Any]],
+        description: Optional[Dict[str, Any]] = None,
+        on_finish: Optional[Callable[[], None]] = None,
+    ) -> IngestionJob:
+        """
+        Encolar func(job) y devolver el trabajo de inmediato.
+
+        on_finish se ejecuta siempre al terminar (p. ej. borrar temporales).
+        Lanza QueueFullError si hay max_pending trabajos sin terminar.
+        """
+        job = IngestionJob(description)
+        with self._lock:
+            if self._pending_count() >= self.max_pending:
+                raise QueueFullError(
+                    f"Cola de ingesta llena ({self.max_pending} trabajos pendientes)"
+                )
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, func, on_finish)
+        logger.info(f"Trabajo de ingesta encolado: {job.job_id}")
+        return job
+
+    def _run(
+        self,
+        job: IngestionJob,
+        func: Callable[[IngestionJob], Dict[str, Any]],
+        on_finish: Optional[Callable[[], None]],
+    ):
+        started = time.perf_counter()
+        job.status = "running"
+        job.started_at = datetime.now().isoformat()
+        try:
+            job.result = func(job)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.error(f"Trabajo de ingesta {job.job_id} fallido: {str(e)}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.seconds = round(time.perf_counter() - started, 4)
+            job.finished_at = datetime.now().isoformat()
+            if on_finish:
+                try:
+                    on_finish()
+                except Exception as e:
+                    logger.warning(f"Error limpiando el trabajo {job.job_id}: {str(e)}")
+
+    def _prune(self):
+        """Olvidar los trabajos terminados más antiguos por encima del límite"""
+        excess = len(self._jobs) - self.max_retained
+        for job_id in list(self._jobs):
+            if excess <= 0:
+                break
+            if self._jobs[job_id].finished:
+                del self._jobs[job_id]
+                excess -= 1
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Buscar un trabajo por ID"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[Dict[str, Any]]:
+        """Resumen de los trabajos registrados, del más reciente al más antiguo"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [
+            {
+                "job_id": job.job_id,
+                "status": job.status,
+                "created_at": job.created_at,
+                "seconds": job.seconds,
+            }
+            for job in reversed(jobs)
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la cola"""
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "max_workers": self.max_workers,
+            "max_pending": self.max_pending,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "succeeded": statuses.count("succeeded"),
+            "failed": statuses.count("failed"),
+        }
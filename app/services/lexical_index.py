@@ -0,0 +1,215 @@
+"""
+Índice léxico BM25 sobre los chunks del vector store.
+
+Las consultas de fichas de seguridad suelen ser códigos exactos (CAS 108-88-3,
+frases H como H331, números ONU) que los embeddings densos recuperan mal. Este
+índice usa SQLite FTS5, que ordena por BM25 y se actualiza de forma
+incremental: cada confirmación del almacén de segmentos aplica aquí los chunks
+añadidos y borrados en una sola transacción y guarda el seq aplicado. Si al
+arrancar el seq no coincide con el del manifiesto (corte entre ambas
+escrituras o índice aún inexistente), se reconstruye desde el vector store.
+
+Los guiones forman parte del token para que un CAS sea un único término; las
+mayúsculas y las tildes se ignoran.
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+
+logger = logging.getLogger(__name__)
+
+_TOKENIZER = "unicode61 remove_diacritics 2 tokenchars '-'"
+# Misma segmentación que el tokenizer de FTS5: letras/dígitos unidos por guiones
+_QUERY_TOKEN = re.compile(r"[^\W_]+(?:-[^\W_]+)*")
+_UN_NUMBER = re.compile(r"^(?:un|onu)(\d{4})$")
+# Términos de consulta como máximo (evita expresiones MATCH desmesuradas)
+MAX_QUERY_TERMS = 32
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """Expresión MATCH de FTS5: OR de los términos de la consulta entrecomillados"""
+    terms = list(dict.fromkeys(token.lower() for token in _QUERY_TOKEN.findall(query)))
+    clauses = []
+    for term in terms[:MAX_QUERY_TERMS]:
+        clauses.append(f'"{term}"')
+        un_number = _UN_NUMBER.match(term)
+        if un_number:
+            # "UN1294" también aparece escrito como "UN 1294"
+            clauses.append(f'"un {un_number.group(1)}"')
+    return " OR ".join(clauses) or None
+
+
+class LexicalIndex:
+    """Índice BM25 (SQLite FTS5) de los chunks, sincronizado por seq de confirmación"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.searches = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lexical_chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                document_id TEXT
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_lexical_chunks_document ON lexical_chunks (document_id)"
+        )
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS lexical_fts USING fts5(text, tokenize=\"{_TOKENIZER}\")"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS lexical_state (key TEXT PRIMARY KEY, value INTEGER)"
+        )
+        self._conn.commit()
+
+    @property
+    def seq(self) -> Optional[int]:
+        """Seq del almacén de segmentos aplicado por última vez (None si nunca)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM lexical_state WHERE key = 'seq'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def _delete(self, chunk_ids: Iterable[str]):
+        for chunk_id in chunk_ids:
+            row = self._conn.execute(
+                "SELECT rowid FROM lexical_chunks WHERE chunk_id = ?", (chunk_id,)
+            ).fetchone()
+            if row:
+                self._conn.execute("DELETE FROM lexical_fts WHERE rowid = ?", row)
+                self._conn.execute("DELETE FROM lexical_chunks WHERE rowid = ?", row)
+
+    def _insert(self, rows: Iterable[Tuple[str, Optional[str], str]]):
+        for chunk_id, document_id, text in rows:
+            cursor = self._conn.execute(
+                "INSERT INTO lexical_chunks (chunk_id, document_id) VALUES (?, ?)",
+                (chunk_id, document_id),
+            )
+            self._conn.execute(
+                "INSERT INTO lexical_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text)
+            )
+
+    def apply(
+        self,
+        added: List[Tuple[str, Optional[str], str]],
+        deleted: List[str],
+        seq: int,
+    ):
+        """Aplicar una confirmación: borrar, añadir (chunk_id, document_id, texto) y fijar seq"""
+        with self._lock:
+            try:
+                # Un ID puede borrarse y volver a añadirse en la misma confirmación
+                self._delete(deleted)
+                self._delete(chunk_id for chunk_id, _, _ in added)
+                self._insert(added)
+                self._set_seq(seq)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+
+    def rebuild(self, rows: Iterable[Tuple[str, Optional[str], str]], seq: int):
+        """Reconstruir el índice completo a partir de todos los chunks vivos"""
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM lexical_chunks")
+                self._conn.execute("DELETE FROM lexical_fts")
+                self._insert(rows)
+                self._set_seq(seq)
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            count = self._conn.execute("SELECT COUNT(*) FROM lexical_chunks").fetchone()[0]
+        logger.info(f"Índice léxico reconstruido: {count} chunks (seq {seq})")
+
+    def _set_seq(self, seq: int):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO lexical_state (key, value) VALUES ('seq', ?)", (seq,)
+        )
+
+    def search(
+        self, query: str, k: int = 4, document_ids: Optional[Set[str]] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Los k chunks con mayor puntuación BM25 como (chunk_id, puntuación).
+
+        document_ids restringe la búsqueda a esos documentos (filtro de metadatos).
+        """
+        expression = _match_expression(query)
+        if expression is None or k <= 0 or document_ids is not None and not document_ids:
+            return []
+
+        sql = (
+            "SELECT c.chunk_id, bm25(lexical_fts) AS score FROM lexical_fts "
+            "JOIN lexical_chunks c ON c.rowid = lexical_fts.rowid "
+            "WHERE lexical_fts MATCH ?"
+        )
+        results: List[Tuple[str, float]] = []
+        with self._lock:
+            self.searches += 1
+            if document_ids is None:
+                rows = self._conn.execute(
+                    f"{sql} ORDER BY score LIMIT ?", (expression, k)
+                ).fetchall()
+                results.extend(rows)
+            else:
+                # SQLite limita el número de parámetros por consulta
+                doc_list = sorted(document_ids)
+                for start in range(0, len(doc_list), 500):
+                    chunk = doc_list[start : start + 500]
+                    placeholders = ",".join("?" for _ in chunk)
+                    rows = self._conn.execute(
+                        f"{sql} AND c.document_id IN ({placeholders}) ORDER BY score LIMIT ?",
+                        (expression, *chunk, k),
+                    ).fetchall()
+                    results.extend(rows)
+        # bm25() de FTS5 es negativo: cuanto menor, más relevante
+        results.sort(key=lambda row: row[1])
+        return [(chunk_id, -score) for chunk_id, score in results[:k]]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del índice léxico"""
+        with self._lock:
+            chunks = self._conn.execute("SELECT COUNT(*) FROM lexical_chunks").fetchone()[0]
+        return {"chunks": chunks, "seq": self.seq, "searches": self.searches}
+
+
+def fuse_rankings(rankings: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """
+    Reciprocal rank fusion: suma de 1 / (rrf_k + posición) en cada ranking.
+
+    Un chunk se identifica por (document_id, chunk_index), de modo que el
+    mismo chunk recuperado por la búsqueda vectorial y por BM25 suma ambas
+    contribuciones; se conserva el primer Document visto.
+    """
+    scores: Dict[Tuple[Any, Any], float] = {}
+    docs: Dict[Tuple[Any, Any], Document] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, start=1):
+            key = (
+                doc.metadata.get("document_id"),
+                doc.metadata.get("chunk_index", doc.page_content),
+            )
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:k]]
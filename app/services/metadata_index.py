@@ -0,0 +1,104 @@
+"""
+Índice invertido de metadatos para filtrar búsquedas.
+
+Mapea (campo, valor normalizado) -> IDs de documento. Los metadatos del
+formulario de ingesta se comparten entre todos los chunks de un documento, así
+que el índice se guarda por documento y se expande a los IDs de chunk al
+buscar: un filtro toca solo los vectores del subconjunto que coincide.
+
+Normalización: sin distinción de mayúsculas ni tildes y con espacios
+colapsados. Los valores con comas ("Mercurio, Hg, CAS:7439-97-6") se indexan
+también por cada elemento, de modo que {"chemical_names": "mercurio"}
+coincide. Dentro de un campo, una lista de valores es un OR; entre campos, AND.
+"""
+
+import re
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Union
+
+# Campos del documento (además de los metadatos del formulario) que se pueden filtrar
+DOCUMENT_FIELDS = ("document_id", "file_name", "file_type")
+
+FilterValue = Union[str, int, float, bool, List[Any]]
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_value(value: Any) -> str:
+    """Forma canónica de un valor de metadatos para compararlo"""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def _index_terms(value: Any) -> Set[str]:
+    values = value if isinstance(value, (list, tuple, set)) else [value]
+    terms = set()
+    for item in values:
+        if item is None:
+            continue
+        terms.add(normalize_value(item))
+        if isinstance(item, str) and "," in item:
+            terms.update(normalize_value(part) for part in item.split(","))
+    terms.discard("")
+    return terms
+
+
+def parse_filters(filters: Optional[Dict[str, FilterValue]]) -> Optional[Dict[str, Set[str]]]:
+    """Validar y normalizar un filtro {campo: valor | [valores]}; None si está vacío"""
+    if not filters:
+        return None
+    if not isinstance(filters, dict):
+        raise ValueError("filters debe ser un objeto {campo: valor}")
+    parsed = {}
+    for field, value in filters.items():
+        values = value if isinstance(value, list) else [value]
+        if not values or any(isinstance(item, (dict, list)) for item in values):
+            raise ValueError(f"Valor de filtro no válido para '{field}'")
+        parsed[str(field)] = {normalize_value(item) for item in values}
+    return parsed
+
+
+class MetadataIndex:
+    """Índice invertido campo -> valor -> documentos"""
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, Set[str]]] = {}
+
+    @classmethod
+    def from_documents(cls, documents_metadata: Dict[str, Dict[str, Any]]) -> "MetadataIndex":
+        """Construir el índice a partir de documents_metadata"""
+        index = cls()
+        for doc_id, info in documents_metadata.items():
+            index.add(doc_id, info)
+        return index
+
+    def add(self, doc_id: str, info: Dict[str, Any]):
+        """Indexar los metadatos de un documento"""
+        fields = dict(info.get("metadata") or {})
+        fields.update({key: info.get(key) for key in DOCUMENT_FIELDS if info.get(key)})
+        fields["document_id"] = doc_id
+        for field, value in fields.items():
+            postings = self._postings.setdefault(field, {})
+            for term in _index_terms(value):
+                postings.setdefault(term, set()).add(doc_id)
+
+    def match(self, filters: Dict[str, Set[str]]) -> Set[str]:
+        """Documentos que cumplen todos los campos del filtro ya normalizado"""
+        matched: Optional[Set[str]] = None
+        # Empezar por el campo más selectivo para intersecar conjuntos pequeños
+        for field, terms in sorted(filters.items(), key=lambda item: self._size(*item)):
+            postings = self._postings.get(field, {})
+            docs = set().union(*(postings.get(term, set()) for term in terms))
+            matched = docs if matched is None else matched & docs
+            if not matched:
+                return set()
+        return matched or set()
+
+    def _size(self, field: str, terms: Iterable[str]) -> int:
+        postings = self._postings.get(field, {})
+        return sum(len(postings.get(term, ())) for term in terms)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Número de valores distintos indexados por campo"""
+        return {field: len(values) for field, values in sorted(self._postings.items())}
@@ -0,0 +1,223 @@
+"""
+Índice y docstore de solo lectura sobre archivos del checkpoint base.
+
+- LayeredIndex: los vectores de la base se leen con np.load(mmap_mode="r") y se
+  buscan por bloques con numpy, o con un índice aproximado (ann_index) si el
+  checkpoint lo incluye; los añadidos posteriores van a un IndexFlatL2 en
+  memoria (delta). Las posiciones de la base van primero y las del delta a
+  continuación, como en un índice FAISS plano.
+- SqliteDocstore: el texto y los metadatos de los chunks de la base viven en
+  un SQLite inmutable que se consulta bajo demanda; los chunks añadidos
+  después se guardan en memoria. La conexión se abre al crear el docstore: un
+  checkpoint posterior puede borrar el archivo mientras alguna búsqueda aún
+  usa el estado anterior, y el descriptor abierto lo sigue leyendo.
+
+Como los archivos son inmutables y se abren en solo lectura, varios procesos
+(workers de gunicorn) comparten la caché de páginas del sistema operativo y el
+arranque no depende del tamaño del corpus.
+"""
+
+import copy
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain.docstore.base import AddableMixin, Docstore
+from langchain.schema import Document
+
+
+# Filas de la base procesadas por bloque en cada búsqueda
+SEARCH_BLOCK_ROWS = 65536
+
+
+class LayeredIndex:
+    """Índice L2 plano: base mapeada en memoria (solo lectura) + delta FAISS"""
+
+    # Las posiciones de la base no se pueden eliminar físicamente; los huecos
+    # se recuperan al escribir el siguiente checkpoint
+    compactable = False
+
+    def __init__(
+        self,
+        base_vectors: np.ndarray,
+        base_norms: np.ndarray,
+        ann: Optional[faiss.Index] = None,
+    ):
+        self.base_vectors = base_vectors
+        self.base_norms = base_norms
+        # Índice aproximado sobre las mismas posiciones de la base (opcional)
+        self.ann = ann
+        self.d = base_vectors.shape[1]
+        self.delta = faiss.IndexFlatL2(self.d)
+
+    @property
+    def base_count(self) -> int:
+        return self.base_vectors.shape[0]
+
+    @property
+    def ntotal(self) -> int:
+        return self.base_count + self.delta.ntotal
+
+    def add(self, vectors: np.ndarray):
+        self.delta.add(vectors)
+
+    def reconstruct(self, position: int) -> np.ndarray:
+        if position < self.base_count:
+            return np.array(self.base_vectors[position], dtype=np.float32)
+        return self.delta.reconstruct(position - self.base_count)
+
+    def reconstruct_batch(self, positions: np.ndarray) -> np.ndarray:
+        positions = np.asarray(positions, dtype=np.int64)
+        vectors = np.empty((len(positions), self.d), dtype=np.float32)
+        in_base = positions < self.base_count
+        if in_base.any():
+            vectors[in_base] = self.base_vectors[positions[in_base]]
+        if not in_base.all():
+            vectors[~in_base] = self.delta.reconstruct_batch(positions[~in_base] - self.base_count)
+        return vectors
+
+    def fork(self) -> "LayeredIndex":
+        """Copia con la misma base (solo lectura, compartida) y un delta propio"""
+        index = LayeredIndex(self.base_vectors, self.base_norms, self.ann)
+        index.delta = faiss.clone_index(self.delta)
+        return index
+
+    def remove_ids(self, ids: np.ndarray):
+        raise RuntimeError("LayeredIndex no admite borrado físico; compactar con un checkpoint")
+
+    def _search_base(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """k vecinos más cercanos en la base, recorriendo el mapa por bloques"""
+        nq = queries.shape[0]
+        best_d = np.empty((nq, 0), dtype=np.float32)
+        best_i = np.empty((nq, 0), dtype=np.int64)
+        query_norms = (queries * queries).sum(axis=1)[:, None]
+
+        for start in range(0, self.base_count, SEARCH_BLOCK_ROWS):
+            block = self.base_vectors[start : start + SEARCH_BLOCK_ROWS]
+            distances = (
+                query_norms
+                - 2.0 * queries @ block.T
+                + self.base_norms[start : start + len(block)][None, :]
+            ).astype(np.float32)
+            positions = np.broadcast_to(
+                np.arange(start, start + len(block), dtype=np.int64), distances.shape
+            )
+            cand_d = np.hstack([best_d, distances])
+            cand_i = np.hstack([best_i, positions])
+            keep = min(k, cand_d.shape[1])
+            top = np.argpartition(cand_d, keep - 1, axis=1)[:, :keep]
+            best_d = np.take_along_axis(cand_d, top, axis=1)
+            best_i = np.take_along_axis(cand_i, top, axis=1)
+        return best_d, best_i
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Misma interfaz que faiss.Index.search (distancias L2 al cuadrado)"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        nq = queries.shape[0]
+        parts_d, parts_i = [], []
+
+        if self.base_count:
+            if self.ann is not None:
+                base_d, base_i = self.ann.search(queries, k)
+            else:
+                base_d, base_i = self._search_base(queries, k)
+            parts_d.append(base_d)
+            parts_i.append(base_i)
+        if self.delta.ntotal:
+            delta_d, delta_i = self.delta.search(queries, min(k, self.delta.ntotal))
+            parts_d.append(delta_d)
+            parts_i.append(np.where(delta_i >= 0, delta_i + self.base_count, -1))
+
+        distances = np.full((nq, k), np.finfo(np.float32).max, dtype=np.float32)
+        positions = np.full((nq, k), -1, dtype=np.int64)
+        if parts_d:
+            cand_d = np.hstack(parts_d)
+            cand_i = np.hstack(parts_i)
+            order = np.argsort(cand_d, axis=1, kind="stable")[:, :k]
+            found = order.shape[1]
+            distances[:, :found] = np.take_along_axis(cand_d, order, axis=1)
+            positions[:, :found] = np.take_along_axis(cand_i, order, axis=1)
+        return distances, positions
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """Docstore perezoso: base en un SQLite inmutable + añadidos en memoria"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._added: Dict[str, Document] = {}
+        self._deleted: set = set()
+        # Conexión de solo lectura compartida entre hilos (el archivo nunca cambia)
+        self._conn = sqlite3.connect(
+            f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self._conn_lock = threading.Lock()
+
+    def fork(self) -> "SqliteDocstore":
+        """Copia con la misma conexión a la base y sus propios añadidos y borrados"""
+        docstore = copy.copy(self)
+        docstore._added = dict(self._added)
+        docstore._deleted = set(self._deleted)
+        return docstore
+
+    @staticmethod
+    def write(path: str, rows: Iterable[Tuple[str, Document]]):
+        """Crear el archivo SQLite de un checkpoint a partir de (id, documento)"""
+        conn = sqlite3.connect(path)
+        try:
+            conn.execute(
+                "CREATE TABLE chunks (id TEXT PRIMARY KEY, position INTEGER NOT NULL, "
+                "text TEXT NOT NULL, metadata TEXT NOT NULL) WITHOUT ROWID"
+            )
+            conn.executemany(
+                "INSERT INTO chunks (id, position, text, metadata) VALUES (?, ?, ?, ?)",
+                (
+                    (docstore_id, position, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False))
+                    for position, (docstore_id, doc) in enumerate(rows)
+                ),
+            )
+            # Índice cubriente: leer los IDs en orden no toca las páginas de texto
+            conn.execute("CREATE INDEX idx_chunks_position ON chunks (position, id)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _query(self, sql: str, params: Tuple = ()) -> List[Tuple]:
+        with self._conn_lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def ids(self) -> List[str]:
+        """IDs de la base en orden de posición"""
+        rows = self._query("SELECT id FROM chunks ORDER BY position")
+        return [row[0] for row in rows]
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        overlapping = [
+            docstore_id
+            for docstore_id in texts
+            if docstore_id in self._added
+            or (docstore_id not in self._deleted and self._in_base(docstore_id))
+        ]
+        if overlapping:
+            raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+        self._added.update(texts)
+
+    def delete(self, ids: List) -> None:
+        for docstore_id in ids:
+            if self._added.pop(docstore_id, None) is None:
+                self._deleted.add(docstore_id)
+
+    def _in_base(self, docstore_id: str) -> bool:
+        return bool(self._query("SELECT 1 FROM chunks WHERE id = ?", (docstore_id,)))
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._added:
+            return self._added[search]
+        if search not in self._deleted:
+            rows = self._query("SELECT text, metadata FROM chunks WHERE id = ?", (search,))
+            if rows:
+                return Document(page_content=rows[0][0], metadata=json.loads(rows[0][1]))
+        return f"ID {search} not found."
@@ -0,0 +1,122 @@
+"""
+Cadena de preguntas y respuestas compartida entre peticiones.
+
+Construir ChatGoogleGenerativeAI llama a genai.configure, que vacía la caché
+global de clientes de google-generativeai: cada pregunta que reconstruía la
+cadena pagaba además un cliente y un canal gRPC nuevos. Aquí la cadena se
+construye una vez por configuración (modelo de chat, temperatura), bajo el
+lock, y todas las peticiones reutilizan el mismo modelo y su cliente, que la
+librería crea en la primera llamada. El cliente gRPC es seguro entre hilos y
+la cadena "stuff" no guarda estado entre llamadas, así que la invocación
+concurrente no necesita lock.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from langchain.chains.question_answering import load_qa_chain
+from langchain.prompts import PromptTemplate
+from langchain.schema import Document
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+
+logger = logging.getLogger(__name__)
+
+QA_PROMPT_TEMPLATE = """
+        Eres un asistente experto en seguridad química e industrial de BASF.
+        Responde en español de manera clara, precisa y profesional.
+
+        Contexto de documentos técnicos:
+        {context}
+
+        Pregunta del usuario:
+        {question}
+
+        Instrucciones:
+        - Proporciona respuestas precisas basadas únicamente en el contexto proporcionado
+        - Si la información no está en el contexto, indícalo claramente
+        - Incluye datos específicos como números CAS, valores límite, procedimientos de seguridad
+        - Estructura la respuesta de manera clara con viñetas cuando sea apropiado
+        - Si hay información de seguridad crítica, destácala claramente
+
+        Respuesta:
+        """
+
+QA_PROMPT = PromptTemplate(template=QA_PROMPT_TEMPLATE, input_variables=["context", "question"])
+
+
+def build_qa_chain(chat_model: str, temperature: float, api_key: Optional[str]) -> Any:
+    """Construir la cadena QA "stuff" sobre el modelo de chat indicado"""
+    model = ChatGoogleGenerativeAI(
+        model=chat_model,
+        temperature=temperature,
+        google_api_key=api_key,
+    )
+    return load_qa_chain(model, chain_type="stuff", prompt=QA_PROMPT)
+
+
+class QAChainProvider:
+    """Cadenas QA construidas una vez por (modelo de chat, temperatura) y reutilizadas"""
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self.builds = 0
+        self.invocations = 0
+        self.build_seconds = 0.0
+        self._chains: Dict[Tuple[str, float], Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, chat_model: str, temperature: float) -> Any:
+        """Cadena para la configuración indicada (se construye en el primer uso)"""
+        key = (chat_model, temperature)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    started = time.perf_counter()
+                    chain = build_qa_chain(chat_model, temperature, self.api_key)
+                    self.build_seconds += time.perf_counter() - started
+                    self.builds += 1
+                    self._chains[key] = chain
+                    logger.info(f"Cadena QA construida para {chat_model} (temperatura {temperature})")
+        return chain
+
+    def invoke(
+        self, chat_model: str, temperature: float, docs: List[Document], question: str
+    ) -> str:
+        """Generar la respuesta a la pregunta con los documentos como contexto"""
+        chain = self.get(chat_model, temperature)
+        with self._lock:
+            self.invocations += 1
+        response = chain(
+            {"input_documents": docs, "question": question},
+            return_only_outputs=True,
+        )
+        return response["output_text"]
+
+    def stream(
+        self, chat_model: str, temperature: float, docs: List[Document], question: str
+    ) -> Iterator[str]:
+        """Fragmentos de la respuesta a medida que el modelo los genera (mismo prompt que invoke)"""
+        chain = self.get(chat_model, temperature)
+        with self._lock:
+            self.invocations += 1
+        # El mismo contexto que arma la cadena "stuff": los chunks separados por una línea
+        context = "\n\n".join(doc.page_content for doc in docs)
+        prompt = QA_PROMPT.format_prompt(context=context, question=question)
+        for chunk in chain.llm_chain.llm.stream(prompt.to_messages()):
+            if chunk.content:
+                yield chunk.content
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de construcción y uso de las cadenas"""
+        with self._lock:
+            return {
+                "chains": len(self._chains),
+                "builds": self.builds,
+                "invocations": self.invocations,
+                "build_ms": round(self.build_seconds * 1000, 2),
+            }
@@ -0,0 +1,91 @@
+"""
+Cachés en memoria para las consultas.
+
+TTLCache es un LRU con caducidad por entrada. Cada entrada guarda lo que costó
+calcularla, de modo que cada acierto suma ese coste al tiempo ahorrado que se
+publica en /stats. Se usa para los embeddings de consulta (evita la llamada a
+la API remota) y para los resultados top-k, cuya clave incluye la versión del
+índice: cualquier confirmación deja obsoletas las entradas anteriores.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """LRU acotado por número de entradas con caducidad (ttl_seconds <= 0: sin caducidad)"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Valor cacheado o None si no existe o ha caducado"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, cost_seconds = entry
+            if expires_at and expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += cost_seconds
+            return value
+
+    def put(self, key: Hashable, value: Any, cost_seconds: float = 0.0):
+        """Guardar un valor junto con el tiempo que costó calcularlo"""
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        with self._lock:
+            self._entries[key] = (value, expires_at, cost_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Vaciar la caché (se conservan los contadores)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas de la caché"""
+        with self._lock:
+            entries = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "saved_ms": round(self.saved_seconds * 1000, 2),
+            "avg_saved_ms_per_hit": (
+                round(self.saved_seconds * 1000 / self.hits, 3) if self.hits else 0.0
+            ),
+        }
@@ -0,0 +1,206 @@
+"""
+Re-ranking de los chunks recuperados antes de pasarlos al LLM.
+
+El orden L2 de FAISS obliga a subir k para tener buen contexto, lo que infla
+el prompt. Con re-ranking se recuperan k * fetch_factor candidatos y solo los
+k mejor puntuados llegan a la cadena:
+
+- "lexical": BM25 del texto completo del chunk frente a la pregunta (empates
+  por el orden de recuperación). Sin dependencias y en milisegundos.
+- "cross-encoder": un cross-encoder de sentence-transformers en CPU puntúa
+  cada par (pregunta, chunk). El modelo se carga en segundo plano al crear el
+  re-ranker.
+
+La latencia está acotada: el cross-encoder corre en un hilo propio y, si no
+termina en timeout_ms (o si el modelo aún no está cargado), la consulta usa el
+orden léxico y se informa "timed_out". Una puntuación que supera el timeout
+sigue ocupando el hilo hasta terminar; mientras tanto las consultas no se
+encolan tras ella, usan BM25 directamente y se informa "busy". Cada llamada
+devuelve el método usado, los candidatos y la latencia.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+
+from app.services.context_packer import bm25_scores, text_terms
+
+try:
+    from sentence_transformers import CrossEncoder
+except ImportError:  # pragma: no cover - dependencia opcional
+    CrossEncoder = None
+
+
+logger = logging.getLogger(__name__)
+
+RERANK_METHODS = ("none", "lexical", "cross-encoder")
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+# Caracteres de cada chunk que ve el cross-encoder (trunca igualmente a max_length tokens)
+CROSS_ENCODER_MAX_CHARS = 2000
+
+
+class Reranker:
+    """Re-ordena candidatos con BM25 o un cross-encoder, con latencia acotada"""
+
+    def __init__(
+        self,
+        method: str = "none",
+        model_name: str = DEFAULT_CROSS_ENCODER,
+        fetch_factor: int = 3,
+        max_candidates: int = 30,
+        timeout_ms: float = 300.0,
+    ):
+        self.method = self.validate_method(method)
+        self.model_name = model_name
+        self.fetch_factor = max(1, fetch_factor)
+        self.max_candidates = max_candidates
+        self.timeout_ms = timeout_ms
+        self.calls = 0
+        self.timeouts = 0
+        self.busy = 0
+        self.total_seconds = 0.0
+        self._model = None
+        self._model_error: Optional[str] = None
+        self._lock = threading.Lock()
+        # Un solo hilo: las puntuaciones del cross-encoder no compiten por la CPU
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Puntuación en curso en ese hilo (None o terminada: el hilo está libre)
+        self._inflight: Optional[Future] = None
+        if self.method == "cross-encoder":
+            self._start_loading()
+
+    @staticmethod
+    def validate_method(method: Optional[str]) -> str:
+        """Comprobar que el método de re-ranking es conocido"""
+        if method not in RERANK_METHODS:
+            raise ValueError(f"rerank debe ser uno de {RERANK_METHODS}: {method}")
+        return method
+
+    def resolve(self, requested: Any) -> str:
+        """Método para una petición: nombre, booleano o None (el configurado)"""
+        if requested is None:
+            return self.method
+        if isinstance(requested, bool):
+            if not requested:
+                return "none"
+            return self.method if self.method != "none" else "lexical"
+        return self.validate_method(requested)
+
+    def fetch_size(self, k: int, method: str) -> int:
+        """Candidatos a recuperar para quedarse con k tras el re-ranking"""
+        if method == "none":
+            return k
+        return max(k, min(k * self.fetch_factor, self.max_candidates))
+
+    def _start_loading(self):
+        with self._lock:
+            if self._executor is not None:
+                return
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        if CrossEncoder is None:
+            self._model_error = "sentence-transformers no está instalado"
+            logger.warning(f"Cross-encoder no disponible ({self._model_error}); se usará BM25")
+            return
+        self._executor.submit(self._load_model)
+
+    def _load_model(self):
+        try:
+            started = time.perf_counter()
+            self._model = CrossEncoder(self.model_name, max_length=512, device="cpu")
+            logger.info(
+                f"Cross-encoder {self.model_name} cargado en "
+                f"{time.perf_counter() - started:.1f}s"
+            )
+        except Exception as e:
+            self._model_error = str(e)
+            logger.error(f"Error cargando el cross-encoder {self.model_name}: {str(e)}")
+
+    def rerank(
+        self, question: str, docs: List[Document], k: int, method: str
+    ) -> Tuple[List[Document], Dict[str, Any]]:
+        """Los k mejores candidatos y un resumen (método, candidatos, latencia)"""
+        if method == "none" or not docs:
+            return docs[:k], {"method": "none"}
+
+        started = time.perf_counter()
+        info: Dict[str, Any] = {
+            "method": method,
+            "candidates": len(docs),
+            "timed_out": False,
+            "busy": False,
+        }
+        order = None
+        if method == "cross-encoder":
+            order = self._cross_encoder_order(question, docs, info)
+        if order is None:
+            order = self._lexical_order(question, docs)
+            info["method"] = "lexical"
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.calls += 1
+            self.timeouts += int(info["timed_out"])
+            self.busy += int(info["busy"])
+            self.total_seconds += elapsed
+        info["kept"] = min(k, len(docs))
+        info["latency_ms"] = round(elapsed * 1000, 2)
+        if method != info["method"]:
+            info["requested"] = method
+        return [docs[i] for i in order[:k]], info
+
+    @staticmethod
+    def _lexical_order(question: str, docs: List[Document]) -> List[int]:
+        scores = bm25_scores(question, [text_terms(doc.page_content) for doc in docs])
+        return sorted(range(len(docs)), key=lambda i: (-scores[i], i))
+
+    def _cross_encoder_order(
+        self, question: str, docs: List[Document], info: Dict[str, Any]
+    ) -> Optional[List[int]]:
+        """Orden del cross-encoder, o None si no está disponible o supera el timeout"""
+        self._start_loading()
+        if self._model is None:
+            if self._model_error is None:
+                # Todavía cargando: la consulta no espera a la carga del modelo
+                info["timed_out"] = True
+            return None
+
+        pairs = [(question, doc.page_content[:CROSS_ENCODER_MAX_CHARS]) for doc in docs]
+        with self._lock:
+            if self._inflight is not None and not self._inflight.done():
+                # El hilo sigue con una puntuación anterior: encolar solo agotaría el timeout
+                info["busy"] = True
+                return None
+            future = self._executor.submit(self._model.predict, pairs, batch_size=16)
+            self._inflight = future
+        try:
+            scores = future.result(timeout=self.timeout_ms / 1000 if self.timeout_ms > 0 else None)
+        except FutureTimeoutError:
+            info["timed_out"] = True
+            logger.warning(
+                f"Re-ranking con cross-encoder superó {self.timeout_ms} ms; se usa BM25"
+            )
+            return None
+        return sorted(range(len(docs)), key=lambda i: (-float(scores[i]), i))
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del re-ranking"""
+        return {
+            "method": self.method,
+            "model": self.model_name if self.method == "cross-encoder" else None,
+            "model_loaded": self._model is not None,
+            "model_error": self._model_error,
+            "fetch_factor": self.fetch_factor,
+            "max_candidates": self.max_candidates,
+            "timeout_ms": self.timeout_ms,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "busy_fallbacks": self.busy,
+            "avg_latency_ms": (
+                round(self.total_seconds * 1000 / self.calls, 3) if self.calls else 0.0
+            ),
+        }
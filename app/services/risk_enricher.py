@@ -5,18 +5,26 @@ Este módulo implementa una estrategia de búsqueda exhaustiva y metódica que:
 1. Define objetivos de datos específicos
 2. Itera por cada químico y cada objetivo
 3. Consolida contexto de alta calidad
-4. Usa LLM una sola vez al final para estructurar
+4. Estructura con el LLM: una llamada por químico y otra legal, concurrentes
+   (o una sola llamada con todo el contexto)
 
 Autor: Sistema UCU Neurons - Módulo RAG Avanzado
 """
 
+import hashlib
 import json
-from typing import Dict, List, Any, Optional
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
 
+from app.config.config import Config
 from app.models.gemini_model import gemini_model
-# TODO: Cuando tu compañero termine el cliente ChromaDB, importar así:
-# from app.services.vector_db_client import vector_db_client
+from app.services.enrichment_cache import EnrichmentCache
+from app.services.metadata_index import normalize_value
+from app.services.vector_db_client import get_vector_db_client
 
 
 class RiskDataEnricher:
@@ -57,18 +65,86 @@ class RiskDataEnricher:
         "evaluacion_riesgo_obligatoria": "evaluación de riesgo obligatoria"
     }
 
-    def __init__(self, model=None, db_client=None):
+    # Resultados de búsqueda fallida: el químico no se guarda en la caché
+    PREFIJOS_FALLO = ("Error en búsqueda", "Sin respuesta de la base vectorial")
+    
+    # Síntesis: una llamada por químico más una legal, o una única llamada
+    MODOS_SINTESIS = ("por_quimico", "unica")
+    
+    # Frases H que elevan el riesgo a ALTO en el resumen de criticidad:
+    # toxicidad aguda cat. 1-3, corrosión, CMR cat. 1 y toxicidad específica
+    # en órganos diana cat. 1
+    FRASES_H_CRITICAS = (
+        "H300", "H301", "H310", "H311", "H330", "H331", "H314",
+        "H340", "H350", "H360", "H370", "H372"
+    )
+
+    def __init__(self, model=None, db_client=None, max_workers: Optional[int] = None,
+                 query_timeout: Optional[float] = None, batch_retrieval: Optional[bool] = None,
+                 cache=None, synthesis_mode: Optional[str] = None):
         """
         Inicializar el enriquecedor.
         
         Args:
             model: Modelo Gemini (por defecto usa gemini_model global)
-            db_client: Cliente de base de datos vectorial (ChromaDB)
+            db_client: Cliente de base de datos vectorial (por defecto el
+                adaptador en proceso sobre el índice FAISS, creado en el
+                primer uso; False usa datos simulados)
+            max_workers: Consultas de recuperación simultáneas
+            query_timeout: Segundos máximos por consulta de recuperación
+            batch_retrieval: Usar db_client.search_batch (una sola búsqueda
+                multi-consulta) cuando el cliente lo ofrezca
+            cache: EnrichmentCache por químico (por defecto la configurada;
+                False la desactiva)
+            synthesis_mode: "por_quimico" (llamadas concurrentes) o "unica"
         """
         self.model = model or gemini_model
-        self.db_client = db_client  # TODO: Conectar cuando esté disponible
+        self._db_client = db_client
+        self.max_workers = max(1, max_workers or Config.RISK_ENRICH_MAX_WORKERS)
+        self.query_timeout = (
+            query_timeout if query_timeout is not None else Config.RISK_ENRICH_QUERY_TIMEOUT
+        )
+        self.batch_retrieval = (
+            batch_retrieval if batch_retrieval is not None else Config.RISK_ENRICH_BATCH_RETRIEVAL
+        )
+        self._cache = cache
+        self.synthesis_mode = synthesis_mode or Config.RISK_ENRICH_SYNTHESIS_MODE
+        if self.synthesis_mode not in self.MODOS_SINTESIS:
+            raise ValueError(
+                f"synthesis_mode debe ser uno de {self.MODOS_SINTESIS}: {self.synthesis_mode}"
+            )
+        self.synthesis_workers = max(1, Config.RISK_ENRICH_SYNTHESIS_WORKERS)
+        self.synthesis_retries = max(0, Config.RISK_ENRICH_SYNTHESIS_RETRIES)
         self.debug_mode = True  # Para logging detallado
     
+    @property
+    def db_client(self):
+        """
+        Cliente vectorial. El adaptador FAISS por defecto se resuelve en el
+        primer uso: la instancia global se crea al importar el módulo y no
+        debe cargar el índice. Si no se puede crear, se usan datos simulados.
+        """
+        if self._db_client is None:
+            self._db_client = get_vector_db_client() or False
+        return self._db_client
+    
+    @db_client.setter
+    def db_client(self, db_client):
+        self._db_client = db_client
+    
+    @property
+    def cache(self) -> Optional[EnrichmentCache]:
+        """Caché por químico; la configurada se abre en el primer uso (None: desactivada)"""
+        if self._cache is None:
+            self._cache = False
+            if Config.RISK_ENRICH_CACHE_ENABLED:
+                self._cache = EnrichmentCache(
+                    Config.RISK_ENRICH_CACHE_PATH,
+                    max_entries=Config.RISK_ENRICH_CACHE_MAX_ENTRIES,
+                    ttl_seconds=Config.RISK_ENRICH_CACHE_TTL
+                )
+        return self._cache or None
+    
     def enrich_task_data(self, task_data: dict) -> dict:
         """
         ORQUESTADOR PRINCIPAL del proceso de enriquecimiento.
@@ -97,16 +173,49 @@ class RiskDataEnricher:
             if self.debug_mode:
                 print(f"🔍 INICIANDO ENRIQUECIMIENTO para {len(quimicos)} químicos: {quimicos}")
             
-            # FASE 1: Recopilación exhaustiva de contexto
-            contexto_consolidado = self._recopilar_contexto_completo(quimicos, pais)
+            # FASE 0: Químicos ya enriquecidos con la versión actual de su corpus
+            versiones, cacheados = self._consultar_cache(quimicos, pais)
+            pendientes = [quimico for quimico in quimicos if quimico not in cacheados]
+            
+            # FASE 1: Recopilación exhaustiva de contexto (solo químicos no cacheados)
+            contexto_consolidado, metricas_recuperacion, secciones = (
+                self._recopilar_contexto_completo(quimicos, pais, pendientes)
+            )
             
             # FASE 2: Síntesis con LLM
-            datos_enriquecidos = self._sintetizar_informacion(
-                contexto_consolidado, 
-                task_data, 
-                quimicos, 
-                pais
+            if self.synthesis_mode == "por_quimico":
+                datos_enriquecidos, metricas_sintesis = self._sintetizar_por_quimico(
+                    secciones, task_data, quimicos, pendientes, pais
+                )
+            else:
+                inicio_sintesis = time.perf_counter()
+                datos_enriquecidos = self._sintetizar_informacion(
+                    contexto_consolidado, 
+                    task_data, 
+                    quimicos, 
+                    pais,
+                    [entrada["datos"] for entrada in cacheados.values()]
+                )
+                metricas_sintesis = {
+                    "modo": "unica",
+                    "llamadas": 1,
+                    "total_ms": round((time.perf_counter() - inicio_sintesis) * 1000, 2)
+                }
+            
+            # FASE 3: Combinar con los químicos cacheados y guardar los nuevos
+            guardados = self._combinar_con_cache(
+                datos_enriquecidos, quimicos, pendientes, pais, versiones, cacheados, secciones
             )
+            if self.synthesis_mode == "por_quimico":
+                datos_enriquecidos["resumen_criticidad"] = self._resumen_criticidad(
+                    datos_enriquecidos["quimicos_datos"]
+                )
+            metricas_recuperacion["cache"] = {
+                "habilitada": self._usa_cache(),
+                "aciertos": list(cacheados),
+                "fallos": pendientes if versiones else [],
+                "guardados": guardados
+            }
             
             return {
                 "status": "success",
@@ -114,6 +223,8 @@ class RiskDataEnricher:
                 "datos_enriquecidos": datos_enriquecidos,
                 "quimicos_procesados": quimicos,
                 "pais": pais,
+                "metricas_recuperacion": metricas_recuperacion,
+                "metricas_sintesis": metricas_sintesis,
                 "timestamp": datetime.now().isoformat(),
                 "debug_contexto_length": len(contexto_consolidado) if self.debug_mode else 0
             }
@@ -125,76 +236,458 @@ class RiskDataEnricher:
                 "timestamp": datetime.now().isoformat()
             }
     
-    def _recopilar_contexto_completo(self, quimicos: List[str], pais: str) -> str:
+    def _recopilar_contexto_completo(self, quimicos: List[str], pais: str,
+                                     quimicos_fds: Optional[List[str]] = None
+                                     ) -> Tuple[str, dict, Dict[str, Dict[str, str]]]:
         """
         FASE 1: Recopilación exhaustiva usando Multi-Consulta Dirigida.
         
-        Para cada químico, busca específicamente cada objetivo de dato.
+        Para cada químico, busca específicamente cada objetivo de dato. Las
+        consultas se ejecutan en paralelo y el contexto se ensambla después en
+        el orden original, así que el resultado no depende de qué consulta
+        termine antes.
+        
+        Args:
+            quimicos: Todos los químicos de la tarea (entran en la búsqueda legal)
+            pais: País de la tarea
+            quimicos_fds: Químicos cuyos objetivos FDS se buscan (por defecto todos)
+        
+        Returns:
+            Tuple[str, dict, dict]: Contexto consolidado, métricas de la
+                recuperación y resultado de cada objetivo por químico (la
+                clave None agrupa los objetivos legales)
+        """
+        quimicos_fds = quimicos if quimicos_fds is None else quimicos_fds
+        consultas = self._planificar_consultas(quimicos_fds, pais)
+        if self.batch_retrieval and hasattr(self.db_client, "search_batch"):
+            resultados, metricas = self._ejecutar_consultas_por_lotes(consultas, quimicos, pais)
+        else:
+            resultados, metricas = self._ejecutar_consultas(consultas, quimicos, pais)
+        
+        secciones: Dict[Optional[str], Dict[str, str]] = {None: {}}
+        for consulta, resultado in zip(consultas, resultados):
+            secciones.setdefault(consulta["quimico"], {})[consulta["campo"]] = resultado
+        contexto = self._ensamblar_contexto(quimicos_fds, pais, secciones)
+        return contexto, metricas, secciones
+    
+    def _usa_cache(self) -> bool:
+        """La caché solo se usa con datos reales de la base vectorial"""
+        return self.cache is not None and bool(self.db_client)
+    
+    def _version_corpus(self, quimico: str) -> Optional[str]:
         """
-        contexto_consolidado = ""
+        Versión de los documentos FDS del químico según el cliente vectorial.
+        
+        Si el cliente no la ofrece, las entradas solo caducan por TTL. None
+        (error al consultarla) hace que el químico no use la caché.
+        """
+        if not hasattr(self.db_client, "corpus_version"):
+            return "sin-version"
+        try:
+            return str(self.db_client.corpus_version(self._filtro_fds(quimico, "FDS")))
+        except Exception as e:
+            if self.debug_mode:
+                print(f"  ⚠️ Sin versión de corpus para '{quimico}': {str(e)}")
+            return None
+    
+    def _consultar_cache(self, quimicos: List[str],
+                         pais: str) -> Tuple[Dict[str, Optional[str]], Dict[str, dict]]:
+        """
+        Buscar en la caché cada químico con la versión actual de su corpus.
         
-        # PASO A: Búsqueda por químico y objetivo de dato FDS
+        Returns:
+            Tuple[dict, dict]: Versión de corpus por químico y entradas cacheadas
+        """
+        if not self._usa_cache():
+            return {}, {}
+        versiones = {}
+        cacheados = {}
+        for quimico in quimicos:
+            versiones[quimico] = self._version_corpus(quimico)
+            if versiones[quimico] is None:
+                continue
+            entrada = self.cache.get(quimico, pais, versiones[quimico])
+            if entrada is not None:
+                cacheados[quimico] = entrada
+        if self.debug_mode and cacheados:
+            print(f"  ♻️ Caché: {len(cacheados)}/{len(quimicos)} químicos ya enriquecidos: "
+                  f"{list(cacheados)}")
+        return versiones, cacheados
+    
+    def _combinar_con_cache(self, datos: dict, quimicos: List[str], pendientes: List[str],
+                            pais: str, versiones: Dict[str, Optional[str]],
+                            cacheados: Dict[str, dict],
+                            secciones: Dict[Optional[str], Dict[str, str]]) -> int:
+        """
+        Completar quimicos_datos con las entradas cacheadas, en el orden de la
+        tarea, y guardar en la caché las entradas recién sintetizadas.
+        
+        Cada entrada sintetizada se asigna a su químico por nombre normalizado
+        (o por posición si el LLM devolvió una por químico) y toma el nombre
+        del químico de la tarea, también las cacheadas: nombre_quimico no
+        depende de lo que devuelva el LLM. No se guardan los químicos con
+        alguna búsqueda fallida ni los que fallaron en la síntesis.
+        
+        Returns:
+            int: Químicos guardados en la caché
+        """
+        if "error" in datos:
+            return 0
+        sintetizados = datos.get("quimicos_datos")
+        if not isinstance(sintetizados, list):
+            sintetizados = []
+        sintetizados = [entrada for entrada in sintetizados if isinstance(entrada, dict)]
+        
+        por_nombre = {
+            normalize_value(entrada.get("nombre_quimico") or ""): entrada
+            for entrada in sintetizados
+        }
+        asignados = {}
+        for posicion, quimico in enumerate(pendientes):
+            entrada = por_nombre.get(normalize_value(quimico))
+            if entrada is None and len(sintetizados) == len(pendientes):
+                entrada = sintetizados[posicion]
+            if entrada is not None:
+                asignados[quimico] = entrada
+        
+        # Entradas que no corresponden a ningún químico pendiente: se conservan al final
+        usados = {id(entrada) for entrada in asignados.values()}
+        sobrantes = [entrada for entrada in sintetizados if id(entrada) not in usados]
+        asignados = {
+            quimico: {**entrada, "nombre_quimico": quimico}
+            for quimico, entrada in asignados.items()
+        }
+        
+        combinados = []
+        for quimico in quimicos:
+            if quimico in cacheados:
+                combinados.append({**cacheados[quimico]["datos"], "nombre_quimico": quimico})
+            elif quimico in asignados:
+                combinados.append(asignados[quimico])
+        combinados.extend(sobrantes)
+        datos["quimicos_datos"] = combinados
+        
+        if not self._usa_cache():
+            return 0
+        guardados = 0
+        for quimico, entrada in asignados.items():
+            secciones_quimico = secciones.get(quimico, {})
+            if "error" in entrada or versiones.get(quimico) is None or any(
+                texto.startswith(self.PREFIJOS_FALLO) for texto in secciones_quimico.values()
+            ):
+                continue
+            self.cache.put(quimico, pais, versiones[quimico], {
+                "quimico": quimico,
+                "contexto": secciones_quimico,
+                "datos": entrada,
+                "enriquecido_en": datetime.now().isoformat()
+            })
+            guardados += 1
+        return guardados
+    
+    def _planificar_consultas(self, quimicos: List[str], pais: str) -> List[dict]:
+        """
+        Lista ordenada de consultas: cada objetivo FDS de cada químico y
+        después cada objetivo legal.
+        """
+        consultas = []
         for quimico in quimicos:
-            contexto_consolidado += f"\n{'='*80}\n"
-            contexto_consolidado += f"INICIO CONTEXTO FDS PARA: {quimico.upper()}\n"
-            contexto_consolidado += f"{'='*80}\n"
-            
             for campo, consulta in self.OBJETIVOS_DATOS_FDS.items():
+                consultas.append({
+                    "tipo": "FDS",
+                    "quimico": quimico,
+                    "campo": campo,
+                    "consulta": consulta
+                })
+        for campo_legal, consulta_legal in self.OBJETIVOS_DATOS_LEGALES.items():
+            consultas.append({
+                "tipo": "legal",
+                "quimico": None,
+                "campo": campo_legal,
+                "consulta": consulta_legal
+            })
+        return consultas
+    
+    def _ejecutar_consulta(self, consulta: dict, quimicos: List[str], pais: str) -> str:
+        """Ejecutar una consulta planificada contra la base vectorial"""
+        if consulta["tipo"] == "legal":
+            return self._buscar_informacion_legal(quimicos, consulta["consulta"], pais)
+        return self._buscar_informacion_especifica(consulta["quimico"], consulta["consulta"], "FDS")
+    
+    def _ejecutar_consultas(self, consultas: List[dict], quimicos: List[str],
+                            pais: str) -> Tuple[List[str], dict]:
+        """
+        Fan-out acotado de las consultas sobre un pool de hilos.
+        
+        Cada consulta tiene su propio timeout, contado desde que empieza a
+        ejecutarse (no desde que entra en la cola). Una consulta que lo supera
+        se da por perdida: su resultado indica el timeout y el hilo termina en
+        segundo plano sin bloquear el enriquecimiento.
+        
+        Returns:
+            Tuple[List[str], dict]: Resultados en el orden de las consultas y métricas
+        """
+        inicio_total = time.perf_counter()
+        resultados: List[Optional[str]] = [None] * len(consultas)
+        inicios: List[Optional[float]] = [None] * len(consultas)
+        latencias: List[Optional[float]] = [None] * len(consultas)
+        estados = ["ok"] * len(consultas)
+        
+        def tarea(indice: int) -> str:
+            inicios[indice] = time.perf_counter()
+            try:
+                return self._ejecutar_consulta(consultas[indice], quimicos, pais)
+            finally:
+                latencias[indice] = time.perf_counter() - inicios[indice]
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="enricher")
+        try:
+            pendientes = {}
+            for indice, consulta in enumerate(consultas):
                 if self.debug_mode:
-                    print(f"  🔎 Buscando '{campo}' para '{quimico}'...")
-                
-                # Simular búsqueda en DB vectorial (cuando esté disponible)
-                contexto_campo = self._buscar_informacion_especifica(
-                    quimico, consulta, "FDS"
-                )
-                
-                contexto_consolidado += f"\n--- {campo.upper().replace('_', ' ')} ---\n"
-                contexto_consolidado += f"Consulta: {consulta}\n"
-                contexto_consolidado += f"Resultado: {contexto_campo}\n"
+                    destino = consulta["quimico"] or pais
+                    print(f"  🔎 Buscando '{consulta['campo']}' para '{destino}'...")
+                pendientes[executor.submit(tarea, indice)] = indice
             
-            contexto_consolidado += f"\n{'='*80}\n"
-            contexto_consolidado += f"FIN CONTEXTO FDS PARA: {quimico.upper()}\n"
-            contexto_consolidado += f"{'='*80}\n"
+            while pendientes:
+                hechas, _ = wait(pendientes, timeout=self._espera_maxima(pendientes, inicios),
+                                 return_when=FIRST_COMPLETED)
+                for futuro in hechas:
+                    indice = pendientes.pop(futuro)
+                    try:
+                        resultados[indice] = futuro.result()
+                    except Exception as e:
+                        estados[indice] = "error"
+                        resultados[indice] = f"Error en búsqueda: {str(e)}"
+                
+                if self.query_timeout and self.query_timeout > 0:
+                    ahora = time.perf_counter()
+                    for futuro, indice in list(pendientes.items()):
+                        inicio = inicios[indice]
+                        if inicio is not None and ahora - inicio > self.query_timeout:
+                            del pendientes[futuro]
+                            estados[indice] = "timeout"
+                            latencias[indice] = ahora - inicio
+                            resultados[indice] = (
+                                f"Sin respuesta de la base vectorial en {self.query_timeout}s"
+                            )
+        finally:
+            # No esperar a las consultas que superaron el timeout
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        total_ms = (time.perf_counter() - inicio_total) * 1000
+        por_consulta = [
+            {
+                "tipo": consulta["tipo"],
+                "quimico": consulta["quimico"],
+                "campo": consulta["campo"],
+                "estado": estado,
+                "latencia_ms": round(latencia * 1000, 2) if latencia is not None else None
+            }
+            for consulta, estado, latencia in zip(consultas, estados, latencias)
+        ]
+        suma_ms = sum(c["latencia_ms"] or 0 for c in por_consulta)
+        metricas = {
+            "modo": "paralelo",
+            "consultas": len(consultas),
+            "workers": self.max_workers,
+            "timeout_consulta_s": self.query_timeout,
+            "total_ms": round(total_ms, 2),
+            "suma_latencias_ms": round(suma_ms, 2),
+            "timeouts": estados.count("timeout"),
+            "errores": estados.count("error"),
+            "por_consulta": por_consulta
+        }
+        if self.debug_mode:
+            print(f"  ⏱️ {len(consultas)} consultas en {total_ms:.0f} ms "
+                  f"(suma secuencial {suma_ms:.0f} ms, {self.max_workers} workers)")
+        return resultados, metricas
+    
+    def _ejecutar_consultas_por_lotes(self, consultas: List[dict], quimicos: List[str],
+                                      pais: str) -> Tuple[List[str], dict]:
+        """
+        Todas las consultas en una sola llamada a db_client.search_batch.
         
-        # PASO B: Búsqueda de información legal específica
-        contexto_consolidado += f"\n{'='*80}\n"
-        contexto_consolidado += f"INICIO CONTEXTO LEGAL PARA: {pais.upper()}\n"
-        contexto_consolidado += f"{'='*80}\n"
+        El cliente embebe todas las consultas en un lote y resuelve cada filtro
+        (químico/tipo de archivo, o país) una sola vez. Los fragmentos que
+        responden a varios objetivos del mismo químico se incluyen completos
+        solo en el primero; los siguientes apuntan a esa sección.
         
-        for campo_legal, consulta_legal in self.OBJETIVOS_DATOS_LEGALES.items():
+        La llamada tiene el mismo timeout que una consulta individual. Si lo
+        supera o falla, se descarta (el hilo termina en segundo plano) y las
+        consultas se repiten con el fan-out en paralelo, que aplica su timeout
+        a cada una. Todas las consultas del lote comparten su latencia.
+        
+        Returns:
+            Tuple[List[str], dict]: Resultados en el orden de las consultas y métricas
+        """
+        inicio = time.perf_counter()
+        peticiones = [self._peticion_busqueda(consulta, quimicos, pais) for consulta in consultas]
+        if self.debug_mode:
+            print(f"  🔎 Búsqueda por lotes: {len(peticiones)} consultas en una llamada...")
+        
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="enricher-lotes")
+        try:
+            futuro = executor.submit(self.db_client.search_batch, peticiones)
+            timeout = self.query_timeout if self.query_timeout and self.query_timeout > 0 else None
+            try:
+                respuestas = futuro.result(timeout=timeout)
+                descarte = None
+            except FutureTimeoutError:
+                descarte = {"motivo": "timeout",
+                            "detalle": f"Sin respuesta de la base vectorial en {self.query_timeout}s"}
+            except Exception as e:
+                descarte = {"motivo": "error", "detalle": str(e)}
+        finally:
+            # No esperar a una búsqueda por lotes que superó el timeout
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        if descarte is None and len(respuestas) != len(consultas):
+            descarte = {"motivo": "error",
+                        "detalle": f"search_batch devolvió {len(respuestas)} resultados "
+                                   f"para {len(consultas)} consultas"}
+        if descarte is not None:
+            descarte["espera_ms"] = round((time.perf_counter() - inicio) * 1000, 2)
             if self.debug_mode:
-                print(f"  ⚖️ Buscando '{campo_legal}' para '{pais}'...")
-            
-            contexto_legal = self._buscar_informacion_legal(
-                quimicos, consulta_legal, pais
-            )
-            
-            contexto_consolidado += f"\n--- {campo_legal.upper().replace('_', ' ')} ---\n"
-            contexto_consolidado += f"Consulta: {consulta_legal}\n"
-            contexto_consolidado += f"Resultado: {contexto_legal}\n"
+                print(f"  ⚠️ Búsqueda por lotes descartada ({descarte['detalle']}); "
+                      f"se repite en paralelo")
+            resultados, metricas = self._ejecutar_consultas(consultas, quimicos, pais)
+            metricas["lotes_descartado"] = descarte
+            return resultados, metricas
+        latencia_ms = round((time.perf_counter() - inicio) * 1000, 2)
         
-        contexto_consolidado += f"\n{'='*80}\n"
-        contexto_consolidado += f"FIN CONTEXTO LEGAL\n"
-        contexto_consolidado += f"{'='*80}\n"
+        resultados = []
+        estados = []
+        vistos: Dict[Tuple[Optional[str], str], str] = {}
+        duplicados = 0
+        for consulta, respuesta in zip(consultas, respuestas):
+            if respuesta.get("status") != "success":
+                estados.append("error")
+                resultados.append(f"Error en búsqueda: {respuesta.get('message', 'desconocido')}")
+                continue
+            estados.append("ok")
+            documentos = respuesta.get("documents") or []
+            if not documentos:
+                resultados.append(self._sin_resultados(consulta, pais))
+                continue
+            ids = respuesta.get("ids") or [None] * len(documentos)
+            partes = []
+            for id_fragmento, texto in zip(ids, documentos):
+                huella = id_fragmento or hashlib.sha1(texto.encode("utf-8")).hexdigest()
+                clave = (consulta["quimico"], huella)
+                if clave in vistos:
+                    duplicados += 1
+                    partes.append(f"[Mismo fragmento que en {vistos[clave]}]")
+                else:
+                    vistos[clave] = consulta["campo"].upper().replace('_', ' ')
+                    partes.append(texto)
+            resultados.append("\n".join(partes))
+        
+        total_ms = (time.perf_counter() - inicio) * 1000
+        if self.debug_mode:
+            print(f"  ⏱️ {len(consultas)} consultas en {total_ms:.0f} ms "
+                  f"({duplicados} fragmentos repetidos entre objetivos)")
+        return resultados, {
+            "modo": "lotes",
+            "consultas": len(consultas),
+            "workers": 1,
+            "timeout_consulta_s": self.query_timeout,
+            "llamadas_busqueda": 1,
+            "total_ms": round(total_ms, 2),
+            "suma_latencias_ms": latencia_ms,
+            "timeouts": 0,
+            "errores": estados.count("error"),
+            "fragmentos_duplicados": duplicados,
+            "por_consulta": [
+                {
+                    "tipo": consulta["tipo"],
+                    "quimico": consulta["quimico"],
+                    "campo": consulta["campo"],
+                    "estado": estado,
+                    "latencia_ms": latencia_ms
+                }
+                for consulta, estado in zip(consultas, estados)
+            ]
+        }
+    
+    def _peticion_busqueda(self, consulta: dict, quimicos: List[str], pais: str) -> dict:
+        """Parámetros de db_client.search para una consulta planificada"""
+        if consulta["tipo"] == "legal":
+            return self._peticion_legal(quimicos, consulta["consulta"], pais)
+        return self._peticion_fds(consulta["quimico"], consulta["consulta"], consulta["tipo"])
+    
+    def _sin_resultados(self, consulta: dict, pais: str) -> str:
+        """Texto de una consulta sin documentos"""
+        if consulta["tipo"] == "legal":
+            return f"No se encontró información legal específica para {pais}"
+        return f"No se encontró información específica en {consulta['tipo']} para {consulta['quimico']}"
+    
+    def _espera_maxima(self, pendientes: dict, inicios: List[Optional[float]]) -> Optional[float]:
+        """Tiempo hasta el próximo timeout de una consulta en curso (None: sin límite)"""
+        if not self.query_timeout or self.query_timeout <= 0:
+            return None
+        ahora = time.perf_counter()
+        restantes = [
+            inicios[indice] + self.query_timeout - ahora
+            for indice in pendientes.values()
+            if inicios[indice] is not None
+        ]
+        # Consultas aún en cola: volver a mirar cuando haya empezado alguna
+        return max(0.0, min(restantes)) if restantes else min(self.query_timeout, 0.05)
+    
+    def _ensamblar_contexto(self, quimicos: List[str], pais: str,
+                            secciones: Dict[Optional[str], Dict[str, str]]) -> str:
+        """Contexto consolidado con las secciones en el orden original de las consultas"""
+        contexto_consolidado = ""
+        
+        # PASO A: Contexto por químico y objetivo de dato FDS
+        for quimico in quimicos:
+            contexto_consolidado += self._contexto_fds(quimico, secciones[quimico])
+        
+        # PASO B: Contexto legal específico
+        contexto_consolidado += self._contexto_legal(pais, secciones[None])
         
         return contexto_consolidado
     
+    def _contexto_fds(self, quimico: str, secciones_quimico: Dict[str, str]) -> str:
+        """Sección del contexto con los objetivos FDS de un químico"""
+        contexto = f"\n{'='*80}\n"
+        contexto += f"INICIO CONTEXTO FDS PARA: {quimico.upper()}\n"
+        contexto += f"{'='*80}\n"
+        
+        for campo, consulta in self.OBJETIVOS_DATOS_FDS.items():
+            contexto += f"\n--- {campo.upper().replace('_', ' ')} ---\n"
+            contexto += f"Consulta: {consulta}\n"
+            contexto += f"Resultado: {secciones_quimico[campo]}\n"
+        
+        contexto += f"\n{'='*80}\n"
+        contexto += f"FIN CONTEXTO FDS PARA: {quimico.upper()}\n"
+        contexto += f"{'='*80}\n"
+        return contexto
+    
+    def _contexto_legal(self, pais: str, secciones_legales: Dict[str, str]) -> str:
+        """Sección del contexto con los objetivos legales del país"""
+        contexto = f"\n{'='*80}\n"
+        contexto += f"INICIO CONTEXTO LEGAL PARA: {pais.upper()}\n"
+        contexto += f"{'='*80}\n"
+        
+        for campo_legal, consulta_legal in self.OBJETIVOS_DATOS_LEGALES.items():
+            contexto += f"\n--- {campo_legal.upper().replace('_', ' ')} ---\n"
+            contexto += f"Consulta: {consulta_legal}\n"
+            contexto += f"Resultado: {secciones_legales[campo_legal]}\n"
+        
+        contexto += f"\n{'='*80}\n"
+        contexto += f"FIN CONTEXTO LEGAL\n"
+        contexto += f"{'='*80}\n"
+        return contexto
+    
     def _buscar_informacion_especifica(self, quimico: str, consulta: str, tipo_doc: str) -> str:
         """
         Búsqueda específica en base de datos vectorial.
-        
-        TODO: Reemplazar con llamada real al vector_db_client cuando esté disponible.
         """
         if self.db_client:
             try:
-                resultados = self.db_client.search(
-                    query=f"{consulta} para {quimico}",
-                    n_results=2,
-                    filter={
-                        "tipo_archivo": tipo_doc,
-                        "quimico": quimico.lower()
-                    }
-                )
+                resultados = self.db_client.search(**self._peticion_fds(quimico, consulta, tipo_doc))
                 
                 if resultados.get("status") == "success" and resultados.get("documents"):
                     return "\n".join(resultados["documents"])
@@ -204,7 +697,7 @@ class RiskDataEnricher:
             except Exception as e:
                 return f"Error en búsqueda: {str(e)}"
         else:
-            # SIMULACIÓN: Respuesta mock mientras se implementa ChromaDB
+            # SIMULACIÓN: Respuesta mock sin cliente vectorial (db_client=False)
             return f"[SIMULADO] Información de {consulta} para {quimico}"
     
     def _buscar_informacion_legal(self, quimicos: List[str], consulta: str, pais: str) -> str:
@@ -213,14 +706,7 @@ class RiskDataEnricher:
         """
         if self.db_client:
             try:
-                resultados = self.db_client.search(
-                    query=f"{consulta} {' '.join(quimicos)} {pais}",
-                    n_results=3,
-                    filter={
-                        "tipo_archivo": "legal",
-                        "pais": pais.lower()
-                    }
-                )
+                resultados = self.db_client.search(**self._peticion_legal(quimicos, consulta, pais))
                 
                 if resultados.get("status") == "success" and resultados.get("documents"):
                     return "\n".join(resultados["documents"])
@@ -233,13 +719,47 @@ class RiskDataEnricher:
             # SIMULACIÓN: Respuesta mock
             return f"[SIMULADO] Información legal de {consulta} para {pais}"
     
-    def _sintetizar_informacion(self, contexto: str, task_data: dict, quimicos: List[str], pais: str) -> dict:
+    @staticmethod
+    def _filtro_fds(quimico: str, tipo_doc: str) -> dict:
+        """Filtro de los documentos de un tipo (FDS) de un químico"""
+        return {
+            "tipo_archivo": tipo_doc,
+            "quimico": quimico.lower()
+        }
+    
+    @classmethod
+    def _peticion_fds(cls, quimico: str, consulta: str, tipo_doc: str) -> dict:
+        """Consulta y filtro de la búsqueda de un objetivo de la FDS de un químico"""
+        return {
+            "query": f"{consulta} para {quimico}",
+            "n_results": 2,
+            "filter": cls._filtro_fds(quimico, tipo_doc)
+        }
+    
+    @staticmethod
+    def _peticion_legal(quimicos: List[str], consulta: str, pais: str) -> dict:
+        """Consulta y filtro de la búsqueda de un objetivo legal"""
+        return {
+            "query": f"{consulta} {' '.join(quimicos)} {pais}",
+            "n_results": 3,
+            "filter": {
+                "tipo_archivo": "legal",
+                "pais": pais.lower()
+            }
+        }
+    
+    def _sintetizar_informacion(self, contexto: str, task_data: dict, quimicos: List[str], pais: str,
+                                datos_cacheados: Optional[List[dict]] = None) -> dict:
         """
         FASE 2: Síntesis final con LLM usando todo el contexto recopilado.
         
         Aquí es donde usamos el LLM UNA SOLA VEZ con contexto de alta calidad.
+        Los químicos cacheados no se vuelven a extraer: sus datos entran en el
+        prompt solo para el resumen de criticidad.
         """
-        synthesis_prompt = self._build_synthesis_prompt(contexto, task_data, quimicos, pais)
+        synthesis_prompt = self._build_synthesis_prompt(
+            contexto, task_data, quimicos, pais, datos_cacheados
+        )
         
         if self.debug_mode:
             print(f"🧠 SÍNTESIS FINAL con LLM...")
@@ -259,9 +779,9 @@ class RiskDataEnricher:
         
         # Parsear JSON estructurado
         try:
-            datos_estructurados = json.loads(synthesis_result["text"])
+            datos_estructurados = self._parsear_json(synthesis_result["text"])
             return datos_estructurados
-        except json.JSONDecodeError as e:
+        except ValueError as e:
             # Fallback: devolver respuesta raw si el JSON no es válido
             return {
                 "error": "JSON inválido del LLM",
@@ -269,7 +789,238 @@ class RiskDataEnricher:
                 "parse_error": str(e)
             }
     
-    def _build_synthesis_prompt(self, context: str, task_data: dict, quimicos: List[str], pais: str) -> str:
+    def _sintetizar_por_quimico(self, secciones: Dict[Optional[str], Dict[str, str]],
+                                task_data: dict, quimicos: List[str], pendientes: List[str],
+                                pais: str) -> Tuple[dict, dict]:
+        """
+        FASE 2 (modo por químico): una llamada al LLM por químico pendiente y
+        otra para el contexto legal, todas concurrentes.
+        
+        Cada prompt lleva solo el contexto de su químico (o el legal), así que
+        una respuesta fallida o con JSON inválido afecta a un único químico y
+        se reintenta por separado en cuanto llega. El tiempo total lo marca la
+        llamada más lenta (con su reintento), no la suma de todas.
+        quimicos_datos sigue el orden de los químicos, no el de llegada.
+        
+        Returns:
+            Tuple[dict, dict]: Datos estructurados y métricas de la síntesis
+        """
+        prompts = {None: self._build_legal_prompt(secciones[None], task_data, quimicos, pais)}
+        for quimico in pendientes:
+            prompts[quimico] = self._build_chemical_prompt(
+                quimico, secciones[quimico], task_data, pais
+            )
+        
+        if self.debug_mode:
+            print(f"🧠 SÍNTESIS POR QUÍMICO con LLM: {len(pendientes)} químicos + contexto legal...")
+        
+        inicio_total = time.perf_counter()
+        respuestas: Dict[Optional[str], dict] = {}
+        intentos = dict.fromkeys(prompts, 0)
+        latencias: List[float] = []
+        
+        def llamada(clave: Optional[str]) -> dict:
+            inicio = time.perf_counter()
+            try:
+                return self._llamar_llm_json(prompts[clave])
+            finally:
+                latencias.append(time.perf_counter() - inicio)
+        
+        workers = min(self.synthesis_workers, len(prompts))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="enricher-llm") as executor:
+            en_curso = {executor.submit(llamada, clave): clave for clave in prompts}
+            while en_curso:
+                hechas, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                for futuro in hechas:
+                    clave = en_curso.pop(futuro)
+                    intentos[clave] += 1
+                    try:
+                        respuesta = futuro.result()
+                    except Exception as e:
+                        respuesta = {"error": "Fallo en síntesis LLM", "details": str(e)}
+                    if "error" in respuesta and intentos[clave] <= self.synthesis_retries:
+                        if self.debug_mode:
+                            print(f"  🔁 Reintentando síntesis de '{clave or 'contexto legal'}': "
+                                  f"{respuesta['error']}")
+                        en_curso[executor.submit(llamada, clave)] = clave
+                    else:
+                        respuestas[clave] = respuesta
+        
+        fallos = [quimico for quimico in pendientes if "error" in respuestas[quimico]]
+        if "error" in respuestas[None]:
+            fallos.append("contexto_legal")
+        datos = {
+            "quimicos_datos": [
+                {**respuestas[quimico], "nombre_quimico": quimico} for quimico in pendientes
+            ],
+            "contexto_legal": {**respuestas[None], "pais": pais}
+        }
+        
+        total_ms = (time.perf_counter() - inicio_total) * 1000
+        if self.debug_mode:
+            print(f"  ⏱️ {sum(intentos.values())} llamadas al LLM en {total_ms:.0f} ms "
+                  f"(suma {sum(latencias) * 1000:.0f} ms, {len(fallos)} fallos)")
+        return datos, {
+            "modo": "por_quimico",
+            "llamadas": sum(intentos.values()),
+            "reintentos": sum(intentos.values()) - len(prompts),
+            "workers": workers,
+            "fallos": fallos,
+            "total_ms": round(total_ms, 2),
+            "llamada_max_ms": round(max(latencias) * 1000, 2),
+            "suma_llamadas_ms": round(sum(latencias) * 1000, 2)
+        }
+    
+    def _llamar_llm_json(self, prompt: str) -> dict:
+        """Llamada al LLM que debe devolver un objeto JSON (con clave error si falla)"""
+        resultado = self.model.generate_text(prompt=prompt, temperature=0.1)
+        if resultado["status"] == "error":
+            return {"error": "Fallo en síntesis LLM", "details": resultado["message"]}
+        try:
+            return self._parsear_json(resultado["text"])
+        except ValueError as e:
+            return {
+                "error": "JSON inválido del LLM",
+                "raw_response": resultado["text"],
+                "parse_error": str(e)
+            }
+    
+    @staticmethod
+    def _parsear_json(texto: str) -> dict:
+        """Objeto JSON de la respuesta del LLM, aceptando un bloque ```json```"""
+        texto = texto.strip()
+        if texto.startswith("```"):
+            texto = re.sub(r"^```[a-zA-Z]*\s*|\s*```$", "", texto)
+        datos = json.loads(texto)
+        if not isinstance(datos, dict):
+            raise ValueError("La respuesta no es un objeto JSON")
+        return datos
+    
+    def _resumen_criticidad(self, quimicos_datos: List[dict]) -> dict:
+        """
+        Resumen de criticidad a partir de las frases H extraídas (modo por químico).
+        
+        ALTO si algún químico tiene una frase H crítica, MEDIO si solo tiene
+        otras frases H y BAJO si no tiene ninguna. Las medidas críticas son la
+        protección y la ventilación indicadas para los químicos de mayor nivel.
+        """
+        orden = ["BAJO", "MEDIO", "ALTO"]
+        # _combinar_con_cache pone el nombre a las entradas de la tarea; las
+        # sobrantes del LLM pueden no traerlo
+        nombres = [
+            datos.get("nombre_quimico") or f"quimico_{posicion + 1}"
+            for posicion, datos in enumerate(quimicos_datos)
+        ]
+        niveles = {}
+        sin_datos = []
+        for nombre, datos in zip(nombres, quimicos_datos):
+            if "error" in datos:
+                sin_datos.append(nombre)
+                continue
+            frases = datos.get("frases_h") or []
+            frases = frases if isinstance(frases, list) else [frases]
+            codigos = set(re.findall(r"\bH\d{3}", " ".join(map(str, frases)).upper()))
+            if codigos.intersection(self.FRASES_H_CRITICAS):
+                niveles[nombre] = "ALTO"
+            else:
+                niveles[nombre] = "MEDIO" if codigos else "BAJO"
+        
+        nivel_general = max(niveles.values(), key=orden.index, default="BAJO")
+        mas_peligrosos = [
+            nombre for nombre, nivel in niveles.items()
+            if nivel == nivel_general and nivel != "BAJO"
+        ]
+        medidas = []
+        for nombre, datos in zip(nombres, quimicos_datos):
+            if nombre not in mas_peligrosos:
+                continue
+            for campo in ("epp_respiratoria", "ventilacion_requerida", "epp_manos", "epp_ocular"):
+                if isinstance(datos.get(campo), str) and datos[campo].strip():
+                    medidas.append(f"{nombre}: {datos[campo].strip()}")
+        
+        resumen = {
+            "nivel_riesgo_general": nivel_general,
+            "quimicos_mas_peligrosos": mas_peligrosos,
+            "medidas_criticas_inmediatas": list(dict.fromkeys(medidas))
+        }
+        if sin_datos:
+            resumen["quimicos_sin_datos"] = sin_datos
+        return resumen
+    
+    def _build_chemical_prompt(self, quimico: str, secciones_quimico: Dict[str, str],
+                               task_data: dict, pais: str) -> str:
+        """Prompt de síntesis de un único químico con el contexto de su FDS"""
+        return f"""# ROL Y MISIÓN
+Eres un Higienista Industrial experto especializado en evaluación de riesgos químicos.
+Tu única misión es extraer datos técnicos precisos de la documentación y estructurarlos en JSON.
+
+# TAREA ORIGINAL
+Químico: {quimico}
+País: {pais}
+Actividad: {task_data.get('datos_tarea', {}).get('actividad_realizada', 'No especificada')}
+
+# DOCUMENTACIÓN DE REFERENCIA
+{self._contexto_fds(quimico, secciones_quimico)}
+
+# INSTRUCCIONES CRÍTICAS
+1. Analiza exhaustivamente la documentación de {quimico}
+2. Si un dato no se encuentra, usa explícitamente `null`
+3. Prioriza datos numéricos exactos sobre rangos o descripciones vagas
+4. DEVUELVE ÚNICAMENTE el objeto JSON, sin explicaciones adicionales
+
+# FORMATO JSON REQUERIDO (ESTRICTO)
+{{
+    "nombre_quimico": "{quimico}",
+    "vla_mg_m3": number_or_null,
+    "vla_ppm": number_or_null,
+    "presion_vapor_hpa": number_or_null,
+    "punto_ebullicion_c": number_or_null,
+    "punto_fusion_c": number_or_null,
+    "densidad_relativa": number_or_null,
+    "frases_h": ["H200", "H300"] or null,
+    "frases_p": ["P200", "P300"] or null,
+    "epp_manos": "string_or_null",
+    "epp_respiratoria": "string_or_null",
+    "epp_ocular": "string_or_null",
+    "ventilacion_requerida": "string_or_null",
+    "incompatibilidades": ["sustancia1", "sustancia2"] or null,
+    "productos_descomposicion": ["producto1", "producto2"] or null,
+    "condiciones_almacenamiento": "string_or_null"
+}}"""
+    
+    def _build_legal_prompt(self, secciones_legales: Dict[str, str], task_data: dict,
+                            quimicos: List[str], pais: str) -> str:
+        """Prompt de síntesis del contexto legal del país"""
+        return f"""# ROL Y MISIÓN
+Eres un Higienista Industrial experto en la normativa de prevención de riesgos químicos.
+Tu única misión es extraer los requisitos legales de la documentación y estructurarlos en JSON.
+
+# TAREA ORIGINAL
+Químicos involucrados: {', '.join(quimicos)}
+País: {pais}
+Actividad: {task_data.get('datos_tarea', {}).get('actividad_realizada', 'No especificada')}
+
+# DOCUMENTACIÓN DE REFERENCIA
+{self._contexto_legal(pais, secciones_legales)}
+
+# INSTRUCCIONES CRÍTICAS
+1. Resume cada requisito legal aplicable a la tarea según la documentación
+2. Si un requisito no se encuentra, usa explícitamente `null`
+3. DEVUELVE ÚNICAMENTE el objeto JSON, sin explicaciones adicionales
+
+# FORMATO JSON REQUERIDO (ESTRICTO)
+{{
+    "pais": "{pais}",
+    "limites_exposicion_ocupacional": "string_or_null",
+    "requisitos_ventilacion": "string_or_null",
+    "obligaciones_epp": "string_or_null",
+    "restricciones_almacenamiento": "string_or_null",
+    "requisitos_notificacion": "string_or_null",
+    "evaluacion_riesgo_obligatoria": "string_or_null"
+}}"""
+    
+    def _build_synthesis_prompt(self, context: str, task_data: dict, quimicos: List[str], pais: str,
+                                datos_cacheados: Optional[List[dict]] = None) -> str:
         """
         Construir el prompt final de síntesis.
         
@@ -280,6 +1031,14 @@ class RiskDataEnricher:
         campos_fds = list(self.OBJETIVOS_DATOS_FDS.keys())
         campos_legales = list(self.OBJETIVOS_DATOS_LEGALES.keys())
         
+        datos_previos = ""
+        if datos_cacheados:
+            datos_previos = f"""
+# DATOS YA ESTRUCTURADOS EN CONSULTAS ANTERIORES
+Estos químicos ya están extraídos: NO los incluyas en "quimicos_datos", pero tenlos en cuenta en "resumen_criticidad".
+{json.dumps(datos_cacheados, ensure_ascii=False, indent=2)}
+"""
+        
         return f"""# ROL Y MISIÓN
 Eres un Higienista Industrial experto especializado en evaluación de riesgos químicos.
 Tu única misión es extraer datos técnicos precisos de la documentación consolidada y estructurarlos en JSON.
@@ -291,7 +1050,7 @@ Actividad: {task_data.get('datos_tarea', {}).get('actividad_realizada', 'No espe
 
 # DOCUMENTACIÓN CONSOLIDADA DE REFERENCIA
 {context}
-
+{datos_previos}
 # INSTRUCCIONES CRÍTICAS
 1. Analiza exhaustivamente la documentación consolidada
 2. Extrae TODOS los datos técnicos disponibles para cada químico
@@ -345,6 +1104,8 @@ Actividad: {task_data.get('datos_tarea', {}).get('actividad_realizada', 'No espe
             "version": "2.0 - Multi-Consulta Dirigida",
             "model_available": self.model.is_available(),
             "db_client_available": bool(self.db_client),
+            "cache": self.cache.get_stats() if self.cache else {"enabled": False},
+            "synthesis_mode": self.synthesis_mode,
             "objetivos_fds": len(self.OBJETIVOS_DATOS_FDS),
             "objetivos_legales": len(self.OBJETIVOS_DATOS_LEGALES),
             "debug_mode": self.debug_mode,
@@ -0,0 +1,469 @@
+"""
+Persistencia incremental del índice FAISS por segmentos y log de confirmaciones.
+
+En lugar de reescribir el índice completo (save_local) y todos los metadatos en
+cada ingesta, cada confirmación escribe solo lo que cambió:
+
+- seg-<seq>.npy / seg-<seq>.jsonl: vectores y chunks añadidos en la confirmación
+- commit-<seq>.json: IDs borrados, segmento añadido y metadatos de documentos
+  modificados (null = documento eliminado)
+
+El checkpoint base guarda los vectores y sus normas en .npy, que se abren
+mapeados en memoria (solo lectura), y los chunks en un SQLite que se consulta
+bajo demanda (ver mmap_store). Solo el log posterior a la base se carga en RAM.
+Según index_type, el checkpoint incluye además un índice aproximado
+base-<seq>.faiss (IVF, HNSW o IVF-PQ, ver ann_index).
+
+MANIFEST.json enumera el checkpoint base y las confirmaciones posteriores, y es
+el único punto de verdad: se escribe en un temporal, se sincroniza y se
+renombra de forma atómica. Cualquier archivo que no figure en el manifiesto es
+un resto de una escritura interrumpida y se elimina al arrancar. La
+compactación reescribe el estado vivo como un nuevo checkpoint base
+(base-<seq>.*) y descarta el log que ya cubre.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain.schema.embeddings import Embeddings
+
+from app.services.ann_index import (
+    build_ann_index,
+    read_ann_index,
+    resolve_params,
+    validate_index_type,
+    write_ann_index,
+)
+from app.services.incremental_faiss import IncrementalFAISS
+from app.services.mmap_store import LayeredIndex, SqliteDocstore
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "MANIFEST.json"
+FORMAT_VERSION = 1
+
+# Archivos del formato save_local de LangChain que sustituye este almacén
+LEGACY_FILES = ("index.faiss", "index.pkl", "documents_metadata.json")
+
+_MANAGED_FILE = re.compile(r"^(seg|base|commit)-\d{8}(\.|-)")
+
+
+class SegmentStore:
+    """Almacén en disco de un IncrementalFAISS: checkpoint base + log de segmentos"""
+
+    def __init__(
+        self,
+        directory: str,
+        compaction_log_entries: int = 16,
+        index_type: str = "flat",
+        index_params: Optional[Dict[str, Any]] = None,
+    ):
+        self.directory = directory
+        self.compaction_log_entries = max(1, compaction_log_entries)
+        # Tipo de índice de los próximos checkpoints; al cargar manda el del manifiesto
+        self.index_type = validate_index_type(index_type)
+        self.index_params = resolve_params(index_params)
+        self.compactions = 0
+        self.last_compaction_at: Optional[str] = None
+        self._lock = threading.Lock()
+        self.manifest = self._read_manifest()
+
+    # ------------------------------------------------------------------
+    # Utilidades de archivo
+    # ------------------------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_file(self, name: str, write: Callable[[Any], None]):
+        """Escribir un archivo completo de forma atómica (temporal + fsync + rename)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(name)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _write_json(self, name: str, data: Any):
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._write_file(name, lambda f: f.write(payload))
+
+    def _read_json(self, name: str) -> Any:
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _fsync_directory(self):
+        """Sincronizar el directorio para que los renombrados sobrevivan a un corte"""
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+        except OSError:  # Windows no permite abrir directorios
+            return
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _write_chunks(self, name: str, ids: List[str], documents: List[Document]):
+        """Guardar los chunks de un segmento como JSON Lines"""
+
+        def write(f):
+            for docstore_id, doc in zip(ids, documents):
+                line = {"id": docstore_id, "text": doc.page_content, "metadata": doc.metadata}
+                f.write(json.dumps(line, ensure_ascii=False).encode("utf-8") + b"\n")
+
+        self._write_file(name, write)
+
+    def _read_chunks(self, name: str) -> Tuple[List[str], List[Document]]:
+        ids, documents = [], []
+        with open(self._path(name), "r", encoding="utf-8") as f:
+            for line in f:
+                item = json.loads(line)
+                ids.append(item["id"])
+                documents.append(Document(page_content=item["text"], metadata=item["metadata"]))
+        return ids, documents
+
+    def _write_vectors(self, name: str, vectors: np.ndarray):
+        self._write_file(name, lambda f: np.save(f, np.ascontiguousarray(vectors, dtype=np.float32)))
+
+    def _replace_synced(self, tmp_path: str, path: str):
+        """Sincronizar un archivo temporal ya escrito y moverlo a su nombre final"""
+        with open(tmp_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    # ------------------------------------------------------------------
+    # Manifiesto
+    # ------------------------------------------------------------------
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self._path(MANIFEST_FILE)):
+            return None
+        manifest = self._read_json(MANIFEST_FILE)
+        if manifest.get("format") != FORMAT_VERSION:
+            raise ValueError(f"Formato de índice no soportado: {manifest.get('format')}")
+        return manifest
+
+    def _install_manifest(self, manifest: Dict[str, Any]):
+        """Confirmar un nuevo manifiesto (punto de commit atómico)"""
+        manifest["updated_at"] = datetime.now().isoformat()
+        self._write_json(MANIFEST_FILE, manifest)
+        self._fsync_directory()
+        self.manifest = manifest
+
+    def _referenced_files(self, manifest: Optional[Dict[str, Any]]) -> set:
+        if not manifest:
+            return set()
+        files = {MANIFEST_FILE}
+        base = manifest.get("base")
+        if base:
+            files.update(
+                base[key]
+                for key in ("vectors", "norms", "chunks", "documents", "ann")
+                if base.get(key)
+            )
+        for item in manifest["log"]:
+            files.add(item["file"])
+            if item.get("segment"):
+                files.update((f"{item['segment']}.npy", f"{item['segment']}.jsonl"))
+        return files
+
+    def _remove_unreferenced(self):
+        """Borrar temporales, segmentos huérfanos y archivos del formato legado"""
+        if not os.path.isdir(self.directory):
+            return
+        referenced = self._referenced_files(self.manifest)
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name in referenced:
+                continue
+            if name.endswith(".tmp") or _MANAGED_FILE.match(name) or (
+                self.manifest and name in LEGACY_FILES
+            ):
+                try:
+                    os.remove(self._path(name))
+                    removed += 1
+                except OSError:
+                    # En Windows un archivo aún mapeado no se puede borrar; se
+                    # reintenta en el siguiente arranque
+                    logger.warning(f"No se pudo eliminar {name}")
+        if removed:
+            logger.info(f"Almacén de segmentos: {removed} archivos no confirmados eliminados")
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def exists(self) -> bool:
+        """Indicar si hay un índice confirmado en formato de segmentos"""
+        return self.manifest is not None
+
+    @property
+    def seq(self) -> int:
+        return self.manifest["seq"] if self.manifest else 0
+
+    def needs_compaction(self) -> bool:
+        """Indicar si el log ha crecido lo bastante como para compactarlo"""
+        return bool(self.manifest) and len(self.manifest["log"]) >= self.compaction_log_entries
+
+    def recover(self):
+        """Volver al último estado consistente: el que describe el manifiesto"""
+        with self._lock:
+            self.manifest = self._read_manifest()
+            self._remove_unreferenced()
+
+    def load(self, embeddings: Embeddings) -> Tuple[Optional[IncrementalFAISS], Dict[str, Any]]:
+        """Reconstruir el vector store y los metadatos aplicando el log sobre la base"""
+        with self._lock:
+            manifest = self._read_manifest()
+            self.manifest = manifest
+            if not manifest or manifest.get("dimension") is None:
+                return None, {}
+
+            documents_metadata: Dict[str, Any] = {}
+            base = manifest.get("base")
+            if base and base["chunks"].endswith(".sqlite3"):
+                store = self._open_base(embeddings, base)
+            else:
+                store = IncrementalFAISS.empty(embeddings, manifest["dimension"])
+                if base:
+                    # Checkpoints anteriores al formato mapeado: chunks en JSON Lines
+                    ids, documents = self._read_chunks(base["chunks"])
+                    if ids:
+                        store._add_vectors(np.load(self._path(base["vectors"])), documents, ids)
+            if base:
+                documents_metadata = self._read_json(base["documents"])
+
+            for item in manifest["log"]:
+                entry = self._read_json(item["file"])
+                deleted = [
+                    docstore_id for docstore_id in entry["deleted_ids"] if store.contains(docstore_id)
+                ]
+                if deleted:
+                    store.delete(deleted)
+                if entry.get("segment"):
+                    ids, documents = self._read_chunks(f"{entry['segment']}.jsonl")
+                    vectors = np.load(self._path(f"{entry['segment']}.npy"))
+                    store._add_vectors(vectors, documents, ids)
+                for doc_id, info in entry["documents"].items():
+                    if info is None:
+                        documents_metadata.pop(doc_id, None)
+                    else:
+                        documents_metadata[doc_id] = info
+
+            store.compact()
+            store.drain_changes()
+            logger.info(
+                f"Índice cargado desde segmentos: seq {manifest['seq']}, "
+                f"{len(manifest['log'])} confirmaciones sobre la base"
+            )
+            return store, documents_metadata
+
+    def _open_base(self, embeddings: Embeddings, base: Dict[str, Any]) -> IncrementalFAISS:
+        """Abrir la base mapeada en memoria con su docstore SQLite perezoso"""
+        if base["count"]:
+            vectors = np.load(self._path(base["vectors"]), mmap_mode="r")
+            norms = np.load(self._path(base["norms"]), mmap_mode="r")
+        else:
+            vectors = np.empty((0, base["dimension"]), dtype=np.float32)
+            norms = np.empty((0,), dtype=np.float32)
+        ann = None
+        if base.get("ann"):
+            ann = read_ann_index(self._path(base["ann"]), self.index_params)
+        docstore = SqliteDocstore(self._path(base["chunks"]))
+        return IncrementalFAISS(
+            embeddings,
+            LayeredIndex(vectors, norms, ann),
+            docstore,
+            dict(enumerate(docstore.ids())),
+        )
+
+    def commit(
+        self,
+        store: IncrementalFAISS,
+        added_ids: List[str],
+        deleted_ids: List[str],
+        documents: Dict[str, Optional[Dict[str, Any]]],
+    ) -> int:
+        """
+        Persistir una confirmación: segmento con los vectores nuevos, registro
+        de borrados y metadatos modificados, y manifiesto actualizado.
+        """
+        with self._lock:
+            manifest = self.manifest or {"format": FORMAT_VERSION, "seq": 0, "base": None, "log": []}
+            seq = manifest["seq"] + 1
+            entry = {
+                "seq": seq,
+                "segment": None,
+                "deleted_ids": deleted_ids,
+                "documents": documents,
+                "committed_at": datetime.now().isoformat(),
+            }
+
+            if added_ids:
+                segment = f"seg-{seq:08d}"
+                self._write_vectors(f"{segment}.npy", store.get_vectors(added_ids))
+                self._write_chunks(
+                    f"{segment}.jsonl",
+                    added_ids,
+                    [store.docstore.search(docstore_id) for docstore_id in added_ids],
+                )
+                entry["segment"] = segment
+                entry["count"] = len(added_ids)
+
+            commit_file = f"commit-{seq:08d}.json"
+            self._write_json(commit_file, entry)
+
+            log_item = {"seq": seq, "file": commit_file, "segment": entry["segment"]}
+            self._install_manifest(
+                dict(
+                    manifest,
+                    seq=seq,
+                    dimension=store.index.d,
+                    log=manifest["log"] + [log_item],
+                )
+            )
+            return seq
+
+    def write_checkpoint(
+        self,
+        seq: int,
+        ids: List[str],
+        get_vectors: Callable[[List[str]], np.ndarray],
+        get_document: Callable[[str], Document],
+        documents_metadata: Dict[str, Any],
+        dimension: int,
+        batch_size: int = 4096,
+    ) -> Dict[str, Any]:
+        """
+        Escribir los archivos de un checkpoint base sin confirmarlo todavía.
+
+        Los vectores se vuelcan por lotes a un .npy mapeado, de modo que la
+        memoria usada no depende del tamaño del corpus. Si index_type no es
+        "flat", se construye después el índice aproximado sobre ese archivo.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = f"base-{seq:08d}"
+        count = len(ids)
+
+        if count:
+            vectors_tmp = self._path(f"{prefix}.npy.tmp")
+            norms_tmp = self._path(f"{prefix}-norms.npy.tmp")
+            vectors_out = np.lib.format.open_memmap(
+                vectors_tmp, mode="w+", dtype=np.float32, shape=(count, dimension)
+            )
+            norms_out = np.lib.format.open_memmap(
+                norms_tmp, mode="w+", dtype=np.float32, shape=(count,)
+            )
+            for start in range(0, count, batch_size):
+                batch = get_vectors(ids[start : start + batch_size])
+                vectors_out[start : start + len(batch)] = batch
+                norms_out[start : start + len(batch)] = (batch * batch).sum(axis=1)
+            vectors_out.flush()
+            norms_out.flush()
+            del vectors_out, norms_out
+            self._replace_synced(vectors_tmp, self._path(f"{prefix}.npy"))
+            self._replace_synced(norms_tmp, self._path(f"{prefix}-norms.npy"))
+        else:
+            self._write_vectors(f"{prefix}.npy", np.empty((0, dimension), dtype=np.float32))
+            self._write_vectors(f"{prefix}-norms.npy", np.empty((0,), dtype=np.float32))
+
+        chunks_tmp = self._path(f"{prefix}.sqlite3.tmp")
+        if os.path.exists(chunks_tmp):
+            os.remove(chunks_tmp)
+        SqliteDocstore.write(chunks_tmp, ((i, get_document(i)) for i in ids))
+        self._replace_synced(chunks_tmp, self._path(f"{prefix}.sqlite3"))
+
+        ann_file = None
+        if count and self.index_type != "flat":
+            started = time.perf_counter()
+            ann = build_ann_index(
+                self.index_type,
+                np.load(self._path(f"{prefix}.npy"), mmap_mode="r"),
+                self.index_params,
+            )
+            if ann is not None:
+                ann_file = f"{prefix}.faiss"
+                ann_tmp = self._path(f"{ann_file}.tmp")
+                write_ann_index(ann, ann_tmp)
+                self._replace_synced(ann_tmp, self._path(ann_file))
+                logger.info(
+                    f"Índice {self.index_type} del checkpoint {seq} construido en "
+                    f"{time.perf_counter() - started:.2f}s"
+                )
+
+        self._write_json(f"{prefix}-documents.json", documents_metadata)
+        return {
+            "seq": seq,
+            "vectors": f"{prefix}.npy",
+            "norms": f"{prefix}-norms.npy",
+            "chunks": f"{prefix}.sqlite3",
+            "documents": f"{prefix}-documents.json",
+            "ann": ann_file,
+            "index_type": self.index_type if ann_file else "flat",
+            "count": count,
+            "dimension": dimension,
+        }
+
+    def install_checkpoint(self, base: Dict[str, Any]):
+        """
+        Confirmar un checkpoint: sustituye a la base anterior y a las
+        confirmaciones que ya incluye; las posteriores se conservan.
+        """
+        with self._lock:
+            manifest = self.manifest or {"format": FORMAT_VERSION, "seq": base["seq"], "log": []}
+            self._install_manifest(
+                dict(
+                    manifest,
+                    seq=max(manifest["seq"], base["seq"]),
+                    dimension=base["dimension"],
+                    base=base,
+                    log=[item for item in manifest["log"] if item["seq"] > base["seq"]],
+                )
+            )
+            self._remove_unreferenced()
+            self.compactions += 1
+            self.last_compaction_at = datetime.now().isoformat()
+
+    def checkpoint(
+        self, store: IncrementalFAISS, documents_metadata: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Escribir y confirmar el estado vivo de store como nuevo checkpoint base"""
+        ids = [docstore_id for _, docstore_id in sorted(store.index_to_docstore_id.items())]
+        base = self.write_checkpoint(
+            self.seq,
+            ids,
+            store.get_vectors,
+            store.docstore.search,
+            documents_metadata,
+            store.index.d,
+        )
+        self.install_checkpoint(base)
+        return base
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estadísticas del almacén"""
+        manifest = self.manifest or {}
+        base = manifest.get("base") or {}
+        return {
+            "format": "segments",
+            "seq": manifest.get("seq", 0),
+            "base_chunks": base.get("count", 0),
+            "base_index_type": base.get("index_type", "flat"),
+            "index_type": self.index_type,
+            "index_params": self.index_params,
+            "log_entries": len(manifest.get("log", [])),
+            "compaction_log_entries": self.compaction_log_entries,
+            "compactions": self.compactions,
+            "last_compaction_at": self.last_compaction_at,
+        }
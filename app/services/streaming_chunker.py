@@ -0,0 +1,67 @@
+"""
+Chunker incremental para la ingesta en streaming.
+
+Recibe el texto página a página y emite los chunks completos en cuanto están
+disponibles. El último chunk de cada tramo se retiene como arrastre (carry)
+y se antepone al siguiente, de modo que el solapamiento entre chunks se
+mantiene a través de los saltos de página y la memoria retenida queda
+acotada por chunk_size + tamaño de página.
+
+Los chunks se devuelven como (texto, tokens); los tokens solo se conocen si el
+splitter los calcula al trocear (modo por tokens) y si no valen None.
+"""
+
+import sys
+from typing import List, Optional, Tuple
+
+from langchain.text_splitter import TextSplitter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Pico de memoria residente del proceso en MB (None si no está disponible)"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo reporta en KB y macOS en bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+class StreamingChunker:
+    """Divide un flujo de texto en chunks con solapamiento arrastrado entre páginas"""
+
+    def __init__(self, text_splitter: TextSplitter):
+        self.text_splitter = text_splitter
+        self._carry: Tuple[str, Optional[int]] = ("", None)
+
+    @property
+    def buffered_characters(self) -> int:
+        return len(self._carry[0])
+
+    def _split(self, text: str) -> List[Tuple[str, Optional[int]]]:
+        split_with_counts = getattr(self.text_splitter, "split_text_with_counts", None)
+        if split_with_counts is not None:
+            return split_with_counts(text)
+        return [(chunk, None) for chunk in self.text_splitter.split_text(text)]
+
+    def feed(self, text: str) -> List[Tuple[str, Optional[int]]]:
+        """Añadir texto y devolver los chunks que ya no pueden cambiar"""
+        if not text:
+            return []
+        chunks = self._split(self._carry[0] + text)
+        if not chunks:
+            self._carry = ("", None)
+            return []
+        # El último chunk puede continuar en la página siguiente
+        self._carry = chunks[-1]
+        return chunks[:-1]
+
+    def flush(self) -> List[Tuple[str, Optional[int]]]:
+        """Emitir lo que quede retenido al terminar el documento"""
+        carry, self._carry = self._carry, ("", None)
+        return [carry] if carry[0].strip() else []
@@ -0,0 +1,214 @@
+"""
+Extracción de texto en paralelo (multiproceso) para la ingesta RAG.
+
+La extracción de PDF es CPU-bound, así que se reparte en un pool de procesos:
+cada archivo es una tarea y los PDF grandes se dividen además en rangos de
+páginas que se extraen en paralelo. Los rangos se entregan en orden como un
+flujo de segmentos con un número acotado de tareas en vuelo, para que la
+ingesta pueda trocear y embeber sin tener el documento completo en memoria.
+
+Las funciones de extracción son de nivel de módulo para poder enviarse a los
+procesos del pool.
+"""
+
+import atexit
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from PyPDF2 import PdfReader
+from docx import Document as DocxDocument
+
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = {".pdf", ".docx", ".txt", ".md"}
+
+
+def extract_pdf_pages(pdf_path: str, start: int = 0, end: Optional[int] = None) -> Tuple[str, float]:
+    """Extraer el texto de un rango de páginas de un PDF"""
+    started = time.perf_counter()
+    with open(pdf_path, "rb") as file:
+        pdf_reader = PdfReader(file)
+        pages = pdf_reader.pages[start:end]
+        text = "".join(page.extract_text() for page in pages)
+    return text, time.perf_counter() - started
+
+
+def extract_docx(docx_path: str) -> Tuple[str, float]:
+    """Extraer el texto de un archivo DOCX"""
+    started = time.perf_counter()
+    doc = DocxDocument(docx_path)
+    text = "".join(paragraph.text + "\n" for paragraph in doc.paragraphs)
+    return text, time.perf_counter() - started
+
+
+def extract_txt(txt_path: str) -> Tuple[str, float]:
+    """Leer un archivo de texto"""
+    started = time.perf_counter()
+    with open(txt_path, "r", encoding="utf-8") as file:
+        text = file.read()
+    return text, time.perf_counter() - started
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 de los bytes de un archivo, leído por bloques"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    """Número de páginas de un PDF"""
+    with open(pdf_path, "rb") as file:
+        return len(PdfReader(file).pages)
+
+
+class ParallelTextExtractor:
+    """Extractor de texto multiproceso con paralelismo por página para PDF grandes"""
+
+    def __init__(self, max_workers: Optional[int] = None, pages_per_task: int = 16):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.pages_per_task = max(1, pages_per_task)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Crear el pool de procesos de forma perezosa y reutilizarlo"""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def _reset_executor(self):
+        """Descartar un pool roto para que la próxima llamada cree uno nuevo"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def shutdown(self):
+        """Cerrar el pool de procesos"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _plan_tasks(self, file_path: str, file_ext: str) -> List[Tuple[Any, tuple]]:
+        """Dividir un archivo en tareas de extracción (rangos de páginas para PDF)"""
+        if file_ext == ".pdf":
+            total_pages = count_pdf_pages(file_path)
+            if total_pages <= self.pages_per_task:
+                return [(extract_pdf_pages, (file_path, 0, total_pages))]
+            return [
+                (extract_pdf_pages, (file_path, start, start + self.pages_per_task))
+                for start in range(0, total_pages, self.pages_per_task)
+            ]
+        if file_ext == ".docx":
+            return [(extract_docx, (file_path,))]
+        return [(extract_txt, (file_path,))]
+
+    def _iter_tasks(self, file_paths: List[str]) -> Iterator[Tuple[str, Any, tuple, bool]]:
+        """Planificar las tareas archivo a archivo, sin materializar la lista completa"""
+        for file_path in file_paths:
+            file_ext = os.path.splitext(file_path)[1].lower()
+            try:
+                tasks = self._plan_tasks(file_path, file_ext)
+            except Exception as e:
+                logger.error(f"Error preparando la extracción de {file_path}: {str(e)}")
+                yield file_path, None, (str(e),), True
+                continue
+            for position, (func, args) in enumerate(tasks):
+                yield file_path, func, args, position == len(tasks) - 1
+
+    def iter_segments(
+        self, file_paths: List[str], prefetch: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Extraer el texto de varios archivos como un flujo ordenado de segmentos.
+
+        Cada segmento es un rango de páginas (o el archivo completo si no es PDF):
+        {"file_path", "text", "cpu_seconds", "last", "error"}. Como mucho hay
+        `prefetch` tareas en vuelo, de modo que la memoria retenida no depende
+        del tamaño de los archivos. Tras un segmento con error no se emiten más
+        segmentos de ese archivo.
+        """
+        prefetch = max(1, prefetch or self.max_workers * 2)
+        tasks = self._iter_tasks(file_paths)
+        pending: Deque[Tuple[str, Any, tuple, bool, Optional[Future]]] = deque()
+        failed_files = set()
+        retried = False
+
+        def submit(task):
+            file_path, func, args, last = task
+            future = self._get_executor().submit(func, *args) if func else None
+            pending.append((file_path, func, args, last, future))
+
+        while True:
+            while len(pending) < prefetch:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                if task[0] not in failed_files:
+                    submit(task)
+            if not pending:
+                return
+
+            file_path, func, args, last, future = pending.popleft()
+            if file_path in failed_files:
+                if future is not None:
+                    future.cancel()
+                continue
+            if future is None:
+                failed_files.add(file_path)
+                yield self._segment(file_path, last=True, error=args[0])
+                continue
+
+            try:
+                text, cpu_seconds = future.result()
+            except BrokenProcessPool:
+                if retried:
+                    raise
+                # Un proceso murió: recrear el pool y reenviar lo pendiente una vez
+                logger.warning("Pool de extracción roto; se recrea y se reintenta")
+                retried = True
+                self._reset_executor()
+                requeue = [(file_path, func, args, last)] + [
+                    item[:4] for item in pending
+                ]
+                pending.clear()
+                for task in requeue:
+                    submit(task)
+                continue
+            except Exception as e:
+                logger.error(f"Error extrayendo texto de {file_path}: {str(e)}")
+                failed_files.add(file_path)
+                yield self._segment(file_path, last=True, error=str(e))
+                continue
+
+            yield self._segment(file_path, text=text, cpu_seconds=cpu_seconds, last=last)
+
+    @staticmethod
+    def _segment(
+        file_path: str,
+        text: Optional[str] = None,
+        cpu_seconds: float = 0.0,
+        last: bool = False,
+        error: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "file_path": file_path,
+            "text": text,
+            "cpu_seconds": cpu_seconds,
+            "last": last,
+            "error": error,
+        }
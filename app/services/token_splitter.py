@@ -0,0 +1,79 @@
+"""
+Troceado de texto por presupuesto de tokens.
+
+El texto se divide en piezas (líneas y frases, conservando el separador), se
+tokenizan todas con una sola llamada a encode_batch de tiktoken y se agrupan
+de forma voraz hasta chunk_size tokens, arrastrando al chunk siguiente las
+piezas finales que quepan en chunk_overlap. El recuento de tokens de cada
+chunk sale de la misma pasada, así que no hace falta volver a tokenizarlo.
+"""
+
+import re
+from collections import deque
+from typing import Any, List, Tuple
+
+from langchain.text_splitter import TextSplitter
+
+
+# Cortes preferidos: fin de párrafo/línea, fin de frase y, en última instancia, palabra
+_PIECE_PATTERN = re.compile(r"(?<=\n)|(?<=[.!?;:] )")
+_WORD_PATTERN = re.compile(r"(?<= )")
+
+
+class TokenTextSplitter(TextSplitter):
+    """Splitter cuyo chunk_size y chunk_overlap se miden en tokens de tiktoken"""
+
+    def __init__(self, encoding: Any, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._encoding = encoding
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.split_text_with_counts(text)]
+
+    def split_text_with_counts(self, text: str) -> List[Tuple[str, int]]:
+        """Dividir el texto y devolver (chunk, tokens) para cada chunk"""
+        pieces = self._measure([piece for piece in _PIECE_PATTERN.split(text) if piece])
+
+        chunks = []
+        current: deque = deque()
+        current_tokens = 0
+        for piece, tokens in pieces:
+            if current and current_tokens + tokens > self._chunk_size:
+                self._emit(chunks, current)
+                # Conservar como solapamiento las piezas finales que quepan
+                while current and (
+                    current_tokens > self._chunk_overlap
+                    or current_tokens + tokens > self._chunk_size
+                ):
+                    current_tokens -= current.popleft()[1]
+            current.append((piece, tokens))
+            current_tokens += tokens
+        self._emit(chunks, current)
+        return chunks
+
+    def _measure(self, pieces: List[str]) -> List[Tuple[str, int]]:
+        """Tokenizar las piezas por lotes y partir las que exceden el presupuesto"""
+        if not pieces:
+            return []
+        encoded = self._encoding.encode_batch(pieces)
+        measured = []
+        for piece, tokens in zip(pieces, encoded):
+            if len(tokens) <= self._chunk_size:
+                measured.append((piece, len(tokens)))
+                continue
+            words = [word for word in _WORD_PATTERN.split(piece) if word]
+            if len(words) > 1:
+                measured.extend(self._measure(words))
+                continue
+            # Una sola "palabra" más larga que el presupuesto: cortar por tokens
+            for start in range(0, len(tokens), self._chunk_size):
+                window = tokens[start : start + self._chunk_size]
+                measured.append((self._encoding.decode(window), len(window)))
+        return measured
+
+    def _emit(self, chunks: List[Tuple[str, int]], current: deque):
+        text = "".join(piece for piece, _ in current)
+        if self._strip_whitespace:
+            text = text.strip()
+        if text:
+            chunks.append((text, sum(tokens for _, tokens in current)))
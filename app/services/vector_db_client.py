@@ -0,0 +1,148 @@
+"""
+Cliente vectorial en proceso para el enriquecimiento de riesgo (Paso 2).
+
+RiskDataEnricher habla con un cliente de estilo ChromaDB: search(query,
+n_results, filter) y search_batch(peticiones), con filtros por "quimico",
+"tipo_archivo" y "pais". Este adaptador los resuelve directamente sobre el
+RAGFAISSModel del proceso, sin pasar por HTTP ni serializar a JSON: los
+filtros se traducen a los metadatos de ingesta y se resuelven con el índice
+de metadatos del modelo, y las búsquedas por lotes embeben todas las consultas
+en una sola llamada.
+
+Correspondencia de filtros:
+- quimico -> chemical_names ("Tolueno, CAS:108-88-3" coincide con "tolueno" y
+  con "cas:108-88-3")
+- tipo_archivo -> document_type, con sinónimos ("FDS" incluye "SDS"; "legal"
+  incluye ley, normativa, reglamento y decreto)
+- pais -> country (los documentos legales se etiquetan con su país al ingerirlos)
+"""
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from langchain.schema import Document
+
+if TYPE_CHECKING:  # pragma: no cover - importar el módulo crea el modelo global
+    from app.models.rag_faiss_model import RAGFAISSModel
+
+
+logger = logging.getLogger(__name__)
+
+# Campo del filtro del enriquecedor -> campo de metadatos de la ingesta
+FILTER_FIELDS = {
+    "quimico": "chemical_names",
+    "tipo_archivo": "document_type",
+    "pais": "country",
+}
+
+# Valores de document_type que cuentan para cada tipo_archivo
+DOCUMENT_TYPE_ALIASES = {
+    "fds": ["FDS", "SDS"],
+    "legal": ["legal", "ley", "normativa", "reglamento", "decreto"],
+}
+
+
+class FAISSVectorClient:
+    """search / search_batch / corpus_version del enriquecedor sobre RAGFAISSModel"""
+
+    def __init__(self, model: "RAGFAISSModel", mode: Optional[str] = None):
+        self.model = model
+        self.mode = mode
+
+    @staticmethod
+    def translate_filter(filter: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Filtro del enriquecedor expresado con los campos de metadatos de la ingesta"""
+        if not filter:
+            return None
+        translated = {}
+        for field, value in filter.items():
+            if field == "tipo_archivo":
+                values = value if isinstance(value, list) else [value]
+                value = [
+                    alias
+                    for item in values
+                    for alias in DOCUMENT_TYPE_ALIASES.get(str(item).lower(), [item])
+                ]
+            translated[FILTER_FIELDS.get(field, field)] = value
+        return translated
+
+    @staticmethod
+    def _format(docs: List[Document]) -> Dict[str, Any]:
+        return {
+            "status": "success",
+            "documents": [doc.page_content for doc in docs],
+            "ids": [
+                f"{doc.metadata.get('document_id', '')}:{doc.metadata.get('chunk_index', 0)}"
+                for doc in docs
+            ],
+            "metadatas": [doc.metadata for doc in docs],
+        }
+
+    def search(
+        self, query: str, n_results: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """Una consulta; devuelve {status, documents, ids, metadatas}"""
+        return self.search_batch([{"query": query, "n_results": n_results, "filter": filter}])[0]
+
+    def search_batch(self, peticiones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Varias consultas en una sola búsqueda del modelo.
+
+        Se recupera el mayor n_results pedido y cada consulta se recorta al
+        suyo, de modo que las consultas FDS y legales comparten el lote de
+        embeddings.
+        """
+        if not peticiones:
+            return []
+        if self.model.vector_store is None:
+            # Índice vacío: no hay documentos que devolver, no es un error
+            return [self._format([]) for _ in peticiones]
+
+        try:
+            k = max(int(peticion.get("n_results", 4)) for peticion in peticiones)
+            batches = self.model.search_batch(
+                [peticion["query"] for peticion in peticiones],
+                k=k,
+                mode=self.mode,
+                query_filters=[
+                    self.translate_filter(peticion.get("filter")) for peticion in peticiones
+                ],
+            )
+        except Exception as e:
+            logger.error(f"Error en la búsqueda del enriquecimiento: {str(e)}")
+            return [{"status": "error", "message": str(e)} for _ in peticiones]
+
+        return [
+            self._format(docs[: int(peticion.get("n_results", 4))])
+            for peticion, docs in zip(peticiones, batches)
+        ]
+
+    def corpus_version(self, filter: Optional[Dict[str, Any]] = None) -> str:
+        """Versión de los documentos que cumplen el filtro (cambia al reingerirlos)"""
+        return self.model.corpus_version(self.translate_filter(filter))
+
+
+_client: Optional[FAISSVectorClient] = None
+_client_lock = threading.Lock()
+
+
+def get_vector_db_client() -> Optional[FAISSVectorClient]:
+    """
+    Cliente sobre el modelo RAG FAISS global, creado en la primera llamada.
+
+    Importar app.models.rag_faiss_model crea el modelo (abre el índice y
+    configura los embeddings), así que se hace aquí y no al importar este
+    módulo. Devuelve None si el modelo no se puede crear.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                try:
+                    from app.models.rag_faiss_model import rag_faiss_model
+                except Exception as e:
+                    logger.error(f"Índice FAISS no disponible para el enriquecimiento: {str(e)}")
+                    return None
+                _client = FAISSVectorClient(rag_faiss_model)
+    return _client
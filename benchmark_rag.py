@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Benchmarks offline del pipeline RAG FAISS
+Usa un embedder local con latencia simulada, sin llamar a la API de Google
+
+Ejemplo:
+    python benchmark_rag.py embeddings --chunks 500 --workers 8
+    python benchmark_rag.py ann --index-type hnsw --vectors 50000 --sweep 16,64,256
+    python benchmark_rag.py search-batch --queries 90
+    python benchmark_rag.py qa-chain --questions 50
+    python benchmark_rag.py context --budget 4000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import tiktoken
+from langchain.schema import Document
+
+from app.services.ann_index import INDEX_TYPES, build_ann_index, recall_report
+from app.services.context_packer import ContextPacker
+from app.services.embedding_pipeline import EmbeddingPipeline, LocalHashEmbeddings
+from app.services.incremental_faiss import IncrementalFAISS
+from app.services.qa_chain import QAChainProvider, build_qa_chain
+
+
+def benchmark_embeddings(args):
+    """Comparar el throughput del embedding serial frente al pipeline por lotes"""
+    embedder = LocalHashEmbeddings(
+        dimension=args.dimension,
+        latency_seconds=args.latency,
+        per_text_latency_seconds=args.per_text_latency,
+    )
+    texts = [
+        f"Chunk de prueba {i}: ficha de datos de seguridad, sección {i % 16}"
+        for i in range(args.chunks)
+    ]
+
+    results = {}
+    for label, batch_size, workers in [
+        ("serial", len(texts), 1),
+        ("pipeline", args.batch_size, args.workers),
+    ]:
+        pipeline = EmbeddingPipeline(
+            embedder, batch_size=max(batch_size, 1), max_workers=workers
+        )
+        results[label] = pipeline.embed_texts(texts)["stats"]
+
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+def benchmark_ann(args):
+    """Recall@k y latencia de un índice aproximado frente al flat, con vectores sintéticos"""
+    rng = np.random.default_rng(0)
+    # Vectores agrupados en torno a centros, más parecidos a embeddings reales que el ruido uniforme
+    centers = rng.normal(size=(max(args.vectors // 100, 1), args.dimension))
+    vectors = (
+        centers[rng.integers(0, len(centers), args.vectors)]
+        + 0.3 * rng.normal(size=(args.vectors, args.dimension))
+    ).astype(np.float32)
+    params = {"nlist": args.nlist, "pq_m": args.pq_m}
+    index = build_ann_index(args.index_type, vectors, params)
+    if index is None:
+        print(json.dumps({"error": f"{args.index_type} no aplicable a {args.vectors} vectores"}))
+        return
+    report = recall_report(
+        vectors, index, k=args.k, queries=args.queries, sweep=args.sweep, params=params
+    )
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+def benchmark_search_batch(args):
+    """Comparar N búsquedas individuales frente a una búsqueda por lotes"""
+    embedder = LocalHashEmbeddings(
+        dimension=args.dimension,
+        latency_seconds=args.latency,
+        per_text_latency_seconds=args.per_text_latency,
+    )
+    texts = [f"Ficha de seguridad {i}: sustancia {i % 97}, sección {i % 16}" for i in range(args.chunks)]
+    store = IncrementalFAISS.from_embeddings(
+        list(zip(texts, LocalHashEmbeddings(dimension=args.dimension).embed_documents(texts))),
+        embedder,
+    )
+    queries = [f"sustancia {i % 97} sección {i % 16}" for i in range(args.queries)]
+
+    started = time.perf_counter()
+    for query in queries:
+        store.similarity_search_by_vector(embedder.embed_query(query), k=args.k)
+    sequential = time.perf_counter() - started
+
+    started = time.perf_counter()
+    store.similarity_search_with_score_by_vectors(embedder.embed_documents(queries), k=args.k)
+    batched = time.perf_counter() - started
+
+    print(
+        json.dumps(
+            {
+                "queries": len(queries),
+                "sequential_seconds": round(sequential, 4),
+                "batch_seconds": round(batched, 4),
+                "speedup": round(sequential / batched, 2) if batched else None,
+            },
+            indent=2,
+        )
+    )
+
+
+def benchmark_qa_chain(args):
+    """Coste por pregunta de reconstruir la cadena QA frente a reutilizarla (sin red)"""
+    api_key = "benchmark-key"
+
+    started = time.perf_counter()
+    for _ in range(args.questions):
+        build_qa_chain(args.chat_model, 0.3, api_key)
+    rebuilt = time.perf_counter() - started
+
+    provider = QAChainProvider(api_key)
+    started = time.perf_counter()
+    for _ in range(args.questions):
+        provider.get(args.chat_model, 0.3)
+    reused = time.perf_counter() - started
+
+    print(
+        json.dumps(
+            {
+                "questions": args.questions,
+                "rebuild_ms_per_question": round(rebuilt * 1000 / args.questions, 3),
+                "reuse_ms_per_question": round(reused * 1000 / args.questions, 3),
+                "chain_builds": provider.builds,
+            },
+            indent=2,
+        )
+    )
+
+
+def benchmark_context(args):
+    """Tokens de contexto con los chunks completos frente al ensamblado con presupuesto"""
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+    chemicals = ["tolueno", "metanol", "mercurio", "amoníaco", "ácido nítrico", "pentanol"]
+    templates = [
+        "El {c} debe almacenarse en recipientes cerrados, lejos de fuentes de ignición.",
+        "Valor límite de exposición profesional del {c}: {n} ppm (VLA-ED).",
+        "En caso de contacto con los ojos, lavar con abundante agua durante {n} minutos.",
+        "Equipo de protección individual: guantes de nitrilo y gafas con protección lateral.",
+        "Sección {n}: información toxicológica del {c} según el reglamento CLP.",
+        "Eliminar el contenido y el recipiente conforme a la normativa local.",
+    ]
+    sentences = [
+        templates[i % len(templates)].format(c=chemicals[i % len(chemicals)], n=10 + i)
+        for i in range(2000)
+    ]
+    text = " ".join(sentences)
+    step = args.chunk_chars - args.overlap_chars
+    docs = []
+    for rank in range(args.k):
+        chunk = text[rank * step : rank * step + args.chunk_chars]
+        docs.append(
+            Document(
+                page_content=chunk,
+                metadata={"document_id": f"doc{rank}", "chunk_tokens": len(tokenizer.encode(chunk))},
+            )
+        )
+
+    question = "¿Cuál es el valor límite de exposición del tolueno?"
+    packer = ContextPacker(args.budget)
+    started = time.perf_counter()
+    packed, stats = packer.pack(question, docs)
+    elapsed = time.perf_counter() - started
+    packed_tokens = sum(len(tokenizer.encode(doc.page_content)) for doc in packed)
+
+    print(
+        json.dumps(
+            {
+                **stats,
+                "packed_tokens_measured": packed_tokens,
+                "reduction": round(1 - packed_tokens / stats["retrieved_tokens"], 3),
+                "sources_retrieved": len(docs),
+                "sources_in_context": len(packed),
+                "pack_ms": round(elapsed * 1000, 2),
+            },
+            indent=2,
+        )
+    )
+
+
+def main():
+    """Punto de entrada de los benchmarks"""
+    parser = argparse.ArgumentParser(description="Benchmarks del pipeline RAG FAISS")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embeddings_parser = subparsers.add_parser(
+        "embeddings", help="Throughput de la etapa de embeddings"
+    )
+    embeddings_parser.add_argument("--chunks", type=int, default=1000)
+    embeddings_parser.add_argument("--batch-size", type=int, default=32)
+    embeddings_parser.add_argument("--workers", type=int, default=4)
+    embeddings_parser.add_argument("--dimension", type=int, default=768)
+    embeddings_parser.add_argument(
+        "--latency", type=float, default=0.1, help="Latencia fija por llamada (s)"
+    )
+    embeddings_parser.add_argument(
+        "--per-text-latency", type=float, default=0.01, help="Latencia por texto (s)"
+    )
+    embeddings_parser.set_defaults(func=benchmark_embeddings)
+
+    ann_parser = subparsers.add_parser(
+        "ann", help="Recall@k y latencia de índices IVF/HNSW/IVF-PQ frente al flat"
+    )
+    ann_parser.add_argument(
+        "--index-type", choices=[t for t in INDEX_TYPES if t != "flat"], default="ivf"
+    )
+    ann_parser.add_argument("--vectors", type=int, default=20000)
+    ann_parser.add_argument("--dimension", type=int, default=768)
+    ann_parser.add_argument("--nlist", type=int, default=0, help="0 = automático")
+    ann_parser.add_argument("--pq-m", type=int, default=16)
+    ann_parser.add_argument("--k", type=int, default=10)
+    ann_parser.add_argument("--queries", type=int, default=200)
+    ann_parser.add_argument(
+        "--sweep",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[1, 4, 16, 64],
+        help="Valores de nprobe (IVF) o efSearch (HNSW)",
+    )
+    ann_parser.set_defaults(func=benchmark_ann)
+
+    batch_parser = subparsers.add_parser(
+        "search-batch", help="Búsquedas individuales frente a search_batch"
+    )
+    batch_parser.add_argument("--queries", type=int, default=90)
+    batch_parser.add_argument("--chunks", type=int, default=5000)
+    batch_parser.add_argument("--k", type=int, default=4)
+    batch_parser.add_argument("--dimension", type=int, default=768)
+    batch_parser.add_argument(
+        "--latency", type=float, default=0.1, help="Latencia fija por llamada (s)"
+    )
+    batch_parser.add_argument(
+        "--per-text-latency", type=float, default=0.001, help="Latencia por texto (s)"
+    )
+    batch_parser.set_defaults(func=benchmark_search_batch)
+
+    qa_parser = subparsers.add_parser(
+        "qa-chain", help="Reconstruir la cadena QA por pregunta frente a reutilizarla"
+    )
+    qa_parser.add_argument("--questions", type=int, default=50)
+    qa_parser.add_argument("--chat-model", default="gemini-2.0-flash")
+    qa_parser.set_defaults(func=benchmark_qa_chain)
+
+    context_parser = subparsers.add_parser(
+        "context", help="Tokens de contexto: chunks completos frente a presupuesto"
+    )
+    context_parser.add_argument("--budget", type=int, default=4000)
+    context_parser.add_argument("--k", type=int, default=4)
+    context_parser.add_argument("--chunk-chars", type=int, default=10000)
+    context_parser.add_argument("--overlap-chars", type=int, default=1000)
+    context_parser.set_defaults(func=benchmark_context)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
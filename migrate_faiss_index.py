@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Reconstruir el checkpoint base de un faiss_index con otro tipo de índice
+(flat, ivf, hnsw o ivfpq) e informar del recall@k y la latencia frente a la
+búsqueda exacta.
+
+Ejecutar con el servidor detenido: el proceso que sirve consultas mantiene su
+propia copia del manifiesto y no ve el nuevo checkpoint hasta reiniciarse.
+
+Ejemplo:
+    python migrate_faiss_index.py --index-type ivf --nprobe 16 --sweep 1,4,16,64
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+from app.config.config import Config
+from app.services.ann_index import INDEX_TYPES, read_ann_index, recall_report
+from app.services.embedding_pipeline import LocalHashEmbeddings
+from app.services.segment_store import LEGACY_FILES, SegmentStore
+
+
+def parse_sweep(value: str):
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main():
+    """Punto de entrada de la migración"""
+    parser = argparse.ArgumentParser(description="Reconstruir el índice FAISS con otro tipo")
+    parser.add_argument("--index-path", default="faiss_index")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=Config.RAG_INDEX_TYPE)
+    parser.add_argument("--nlist", type=int, default=Config.RAG_IVF_NLIST)
+    parser.add_argument("--nprobe", type=int, default=Config.RAG_IVF_NPROBE)
+    parser.add_argument("--hnsw-m", type=int, default=Config.RAG_HNSW_M)
+    parser.add_argument("--ef-construction", type=int, default=Config.RAG_HNSW_EF_CONSTRUCTION)
+    parser.add_argument("--ef-search", type=int, default=Config.RAG_HNSW_EF_SEARCH)
+    parser.add_argument("--pq-m", type=int, default=Config.RAG_PQ_M)
+    parser.add_argument("--pq-bits", type=int, default=Config.RAG_PQ_BITS)
+    parser.add_argument("--k", type=int, default=10, help="k del recall@k")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument(
+        "--sweep", type=parse_sweep, default=None, help="Valores de nprobe/efSearch a medir"
+    )
+    parser.add_argument("--no-report", action="store_true")
+    args = parser.parse_args()
+
+    params = {
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "pq_m": args.pq_m,
+        "pq_bits": args.pq_bits,
+    }
+    segments = SegmentStore(args.index_path, index_type=args.index_type, index_params=params)
+    segments.recover()
+    if not segments.exists():
+        if os.path.exists(os.path.join(args.index_path, LEGACY_FILES[0])):
+            sys.exit(
+                "El índice está en el formato legado: arranque la aplicación una vez "
+                "para migrarlo al formato de segmentos"
+            )
+        sys.exit(f"No hay un índice confirmado en {args.index_path}")
+
+    # Las consultas no se embeben: cualquier Embeddings sirve para abrir el store
+    store, documents_metadata = segments.load(LocalHashEmbeddings())
+    if store is None:
+        sys.exit("El índice está vacío")
+
+    base = segments.checkpoint(store, documents_metadata)
+    summary = {
+        "index_path": args.index_path,
+        "seq": base["seq"],
+        "chunks": base["count"],
+        "requested_index_type": args.index_type,
+        "index_type": base["index_type"],
+    }
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+
+    if base["ann"] and not args.no_report:
+        vectors = np.load(os.path.join(args.index_path, base["vectors"]), mmap_mode="r")
+        ann = read_ann_index(os.path.join(args.index_path, base["ann"]), params)
+        report = recall_report(
+            vectors, ann, k=args.k, queries=args.queries, sweep=args.sweep, params=params
+        )
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import pytest
+
+from app.services.embedding_pipeline import LocalHashEmbeddings
+from app.services.incremental_faiss import IncrementalFAISS
+
+
+DIMENSION = 16
+
+
+@pytest.fixture
+def embeddings():
+    return LocalHashEmbeddings(dimension=DIMENSION)
+
+
+@pytest.fixture
+def make_store(embeddings):
+    """Crear un IncrementalFAISS con un chunk por texto e IDs <prefijo>-<n>"""
+
+    def make(texts, prefix="chunk", document_id="doc"):
+        store = IncrementalFAISS.empty(embeddings, DIMENSION)
+        store.add_texts(
+            texts,
+            metadatas=[
+                {"document_id": document_id, "chunk_index": i} for i in range(len(texts))
+            ],
+            ids=[f"{prefix}-{i}" for i in range(len(texts))],
+        )
+        return store
+
+    return make
+
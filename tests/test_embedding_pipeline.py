@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+
+from app.services import embedding_pipeline
+from app.services.embedding_cache import EmbeddingCache
+from app.services.embedding_pipeline import (
+    EmbeddingPipeline,
+    LocalHashEmbeddings,
+    embed_queries,
+    is_rate_limit_error,
+)
+
+
+class RecordingEmbeddings(LocalHashEmbeddings):
+    """LocalHashEmbeddings que registra los lotes y falla por cuota las primeras veces"""
+
+    def __init__(self, rate_limit_failures=0):
+        super().__init__(dimension=8)
+        self.batches = []
+        self.rate_limit_failures = rate_limit_failures
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            if self.rate_limit_failures:
+                self.rate_limit_failures -= 1
+                raise RuntimeError("429 Resource exhausted")
+            self.batches.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_vectors_keep_the_order_of_the_texts():
+    embeddings = RecordingEmbeddings()
+    texts = [f"chunk {i}" for i in range(10)]
+
+    result = EmbeddingPipeline(embeddings, batch_size=3, max_workers=4).embed_texts(texts)
+
+    assert result["vectors"] == LocalHashEmbeddings(dimension=8).embed_documents(texts)
+    assert sorted(len(batch) for batch in embeddings.batches) == [1, 3, 3, 3]
+    assert result["stats"]["batches"] == 4
+
+
+def test_identical_texts_are_embedded_once():
+    embeddings = RecordingEmbeddings()
+
+    result = EmbeddingPipeline(embeddings, batch_size=10).embed_texts(["a", "b", "a"])
+
+    assert embeddings.batches == [["a", "b"]]
+    assert result["vectors"][0] == result["vectors"][2]
+    assert result["stats"]["embedded"] == 2
+
+
+def test_rate_limit_errors_are_retried_with_backoff():
+    embeddings = RecordingEmbeddings(rate_limit_failures=2)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=5, backoff_seconds=0.001)
+
+    result = pipeline.embed_texts(["a", "b"])
+
+    assert result["stats"]["retries"] == 2
+    assert all(vector is not None for vector in result["vectors"])
+
+
+def test_other_errors_are_not_retried():
+    class FailingEmbeddings(LocalHashEmbeddings):
+        def embed_documents(self, texts):
+            raise ValueError("texto no válido")
+
+    with pytest.raises(ValueError):
+        EmbeddingPipeline(FailingEmbeddings(), backoff_seconds=0.001).embed_texts(["a"])
+
+
+def test_cached_texts_skip_the_embedder(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    first = RecordingEmbeddings()
+    EmbeddingPipeline(first, cache=cache, model_name="m").embed_texts(["a", "b"])
+
+    second = RecordingEmbeddings()
+    result = EmbeddingPipeline(second, cache=cache, model_name="m").embed_texts(["a", "b", "c"])
+
+    assert second.batches == [["c"]]
+    assert result["stats"]["cache_hits"] == 2
+
+
+def test_progress_callback_reaches_the_total():
+    progress = []
+
+    EmbeddingPipeline(RecordingEmbeddings(), batch_size=2).embed_texts(
+        ["a", "b", "c"], progress_callback=lambda done, total: progress.append((done, total))
+    )
+
+    assert progress[-1] == (3, 3)
+
+
+def test_rate_limit_detection_by_message():
+    assert is_rate_limit_error(RuntimeError("429 Too Many Requests"))
+    assert is_rate_limit_error(RuntimeError("Quota exceeded"))
+    assert not is_rate_limit_error(ValueError("texto no válido"))
+
+
+class FakeGenai:
+    """genai.embed_content que devuelve un vector distinto por texto y task_type"""
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_content(self, model, content, task_type):
+        self.calls.append((len(content), task_type))
+        return {"embedding": [[float(len(text)), float(len(task_type))] for text in content]}
+
+
+@pytest.fixture
+def fake_genai(monkeypatch):
+    fake = FakeGenai()
+    monkeypatch.setattr(embedding_pipeline, "genai", fake)
+    return fake
+
+
+def test_query_vector_does_not_depend_on_the_batch_size(fake_genai):
+    embeddings = GoogleGenerativeAIEmbeddings(
+        model="models/embedding-001", google_api_key="test"
+    )
+
+    alone = embed_queries(embeddings, ["tolueno"])
+    batched = embed_queries(embeddings, ["acetona", "tolueno", "xileno"], batch_size=2)
+
+    assert alone[0] == batched[1]
+    assert fake_genai.calls == [
+        (1, "retrieval_query"),
+        (2, "retrieval_query"),
+        (1, "retrieval_query"),
+    ]
+
+
+def test_local_embedder_queries_match_in_and_out_of_a_batch():
+    embeddings = LocalHashEmbeddings(dimension=8)
+
+    assert embed_queries(embeddings, ["tolueno"])[0] == embed_queries(
+        embeddings, ["acetona", "tolueno"]
+    )[1]
+    assert embed_queries(embeddings, []) == []
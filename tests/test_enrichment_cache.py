@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+from app.services.enrichment_cache import EnrichmentCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = EnrichmentCache(str(tmp_path / "enrichment.sqlite3"), max_entries=3)
+    yield cache
+    cache._conn.close()
+
+
+def test_get_returns_value_for_same_corpus_version(cache):
+    cache.put("Tolueno", "Uruguay", "v1", {"nombre_quimico": "Tolueno"})
+
+    assert cache.get("tolueno", "uruguay", "v1") == {"nombre_quimico": "Tolueno"}
+    assert cache.get("Etanol", "Uruguay", "v1") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_keys_ignore_case_and_accents(cache):
+    cache.put("Ácido Sulfúrico", "Perú", "v1", {"fds": 1})
+
+    assert cache.get("acido  sulfurico", "PERU", "v1") == {"fds": 1}
+
+
+def test_new_corpus_version_invalidates_the_entry(cache):
+    cache.put("Tolueno", "Uruguay", "v1", {"fds": 1})
+
+    assert cache.get("Tolueno", "Uruguay", "v2") is None
+    # La entrada obsoleta se borra: ni la versión antigua la recupera
+    assert cache.get("Tolueno", "Uruguay", "v1") is None
+    assert cache.invalidations == 1
+    assert cache.get_stats()["entries"] == 0
+
+
+def test_put_replaces_an_older_version(cache):
+    cache.put("Tolueno", "Uruguay", "v1", {"fds": 1})
+    cache.put("Tolueno", "Uruguay", "v2", {"fds": 2})
+
+    assert cache.get("Tolueno", "Uruguay", "v2") == {"fds": 2}
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = EnrichmentCache(str(tmp_path / "ttl.sqlite3"), ttl_seconds=0.05)
+    cache.put("Tolueno", "Uruguay", "v1", {"fds": 1})
+
+    time.sleep(0.1)
+
+    assert cache.get("Tolueno", "Uruguay", "v1") is None
+    assert cache.expirations == 1
+    cache._conn.close()
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    for chemical in ("A", "B", "C"):
+        cache.put(chemical, "Uruguay", "v1", {"quimico": chemical})
+        time.sleep(0.01)
+    assert cache.get("A", "Uruguay", "v1") is not None
+    time.sleep(0.01)
+
+    cache.put("D", "Uruguay", "v1", {"quimico": "D"})
+
+    assert cache.get("B", "Uruguay", "v1") is None
+    assert all(cache.get(chemical, "Uruguay", "v1") for chemical in ("A", "C", "D"))
+    assert cache.evictions == 1
+
+
+def test_invalidate_by_chemical_and_country(cache):
+    cache.put("Tolueno", "Uruguay", "v1", {"fds": 1})
+    cache.put("Tolueno", "Chile", "v1", {"fds": 1})
+    cache.put("Etanol", "Chile", "v1", {"fds": 1})
+
+    assert cache.invalidate("tolueno", "chile") == 1
+    assert cache.get("Tolueno", "Uruguay", "v1") is not None
+    assert cache.invalidate("Tolueno") == 1
+    assert cache.get_stats()["entries"] == 1
+
+
+def test_entries_persist_across_instances(tmp_path):
+    path = str(tmp_path / "persist.sqlite3")
+    first = EnrichmentCache(path)
+    first.put("Tolueno", "Uruguay", "v1", {"fds": 1})
+    first._conn.close()
+
+    second = EnrichmentCache(path)
+    assert second.get("Tolueno", "Uruguay", "v1") == {"fds": 1}
+    second._conn.close()
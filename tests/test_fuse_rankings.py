@@ -0,0 +1,43 @@
+from langchain.schema import Document
+
+from app.services.lexical_index import fuse_rankings
+
+
+def chunk(document_id, chunk_index, text="texto"):
+    return Document(
+        page_content=text, metadata={"document_id": document_id, "chunk_index": chunk_index}
+    )
+
+
+def test_chunks_in_both_rankings_rise_to_the_top():
+    vector = [chunk("a", 0), chunk("b", 0), chunk("c", 0)]
+    lexical = [chunk("c", 0), chunk("d", 0), chunk("b", 0)]
+
+    fused = fuse_rankings([vector, lexical], k=4, rrf_k=60)
+
+    assert [doc.metadata["document_id"] for doc in fused] == ["c", "b", "a", "d"]
+
+
+def test_scores_follow_reciprocal_rank_formula():
+    # c: 1/(1+3) + 1/(1+1) = 0.75 supera a a: 1/(1+1) = 0.5
+    fused = fuse_rankings(
+        [[chunk("a", 0), chunk("b", 0), chunk("c", 0)], [chunk("c", 0)]], k=1, rrf_k=1
+    )
+
+    assert fused[0].metadata["document_id"] == "c"
+
+
+def test_chunks_are_identified_by_document_and_chunk_index():
+    first = chunk("a", 0, "vectorial")
+    fused = fuse_rankings([[first, chunk("a", 1)], [chunk("a", 0, "léxico")]], k=5)
+
+    assert len(fused) == 2
+    # Se conserva el primer Document visto del chunk repetido
+    assert fused[0] is first
+
+
+def test_result_is_truncated_to_k():
+    ranking = [chunk("a", i) for i in range(10)]
+
+    assert len(fuse_rankings([ranking], k=3)) == 3
+    assert fuse_rankings([], k=3) == []
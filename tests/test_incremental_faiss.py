@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+
+def test_delete_leaves_tombstones_and_skips_them_in_search(make_store, embeddings):
+    store = make_store([f"tolueno frase {i}" for i in range(8)])
+
+    store.delete(["chunk-3"])
+
+    assert store.tombstone_count == 1
+    assert store.index.ntotal == 8
+    assert not store.contains("chunk-3")
+    query = embeddings.embed_query("tolueno frase 3")
+    found = store.similarity_search_with_score_by_vector(query, k=8)
+    assert len(found) == 7
+    assert all(doc.metadata["chunk_index"] != 3 for doc, _ in found)
+
+
+def test_delete_compacts_past_the_tombstone_ratio(make_store):
+    store = make_store([f"texto {i}" for i in range(8)])
+
+    store.delete(["chunk-0", "chunk-1", "chunk-2"])
+
+    assert store.tombstone_count == 0
+    assert store.index.ntotal == 5
+    assert sorted(store.index_to_docstore_id) == list(range(5))
+    assert all(store.contains(f"chunk-{i}") for i in range(3, 8))
+
+
+def test_compaction_replaces_the_index_instead_of_modifying_it(make_store):
+    store = make_store([f"texto {i}" for i in range(8)])
+    previous = store.index
+
+    store.delete(["chunk-0", "chunk-1", "chunk-2"])
+
+    assert store.index is not previous
+    assert previous.ntotal == 8
+
+
+def test_delete_unknown_id_raises(make_store):
+    store = make_store(["texto"])
+
+    with pytest.raises(ValueError):
+        store.delete(["no-existe"])
+
+
+def test_merge_from_copies_vectors_renames_ids_and_updates_metadata(make_store):
+    staging = make_store(["acetona", "benceno"], prefix="staging")
+    store = make_store(["tolueno"])
+
+    merged = store.merge_from(
+        staging,
+        ids=["staging-0", "staging-1"],
+        new_ids=["doc2-0", "doc2-1"],
+        metadata_updates={"document_id": "doc2", "total_chunks": 2},
+    )
+
+    assert merged == ["doc2-0", "doc2-1"]
+    np.testing.assert_allclose(
+        store.get_vectors(merged), staging.get_vectors(["staging-0", "staging-1"])
+    )
+    copied = store.docstore.search("doc2-1")
+    assert copied.page_content == "benceno"
+    assert copied.metadata == {"document_id": "doc2", "chunk_index": 1, "total_chunks": 2}
+    # Los metadatos del store de origen no se modifican
+    assert staging.docstore.search("staging-1").metadata["document_id"] == "doc"
+
+
+def test_merge_from_rejects_existing_ids(make_store):
+    staging = make_store(["acetona"])
+    store = make_store(["tolueno"])
+
+    with pytest.raises(ValueError):
+        store.merge_from(staging)
+
+
+def test_drain_changes_reports_only_persistable_changes(make_store):
+    store = make_store(["a", "b", "c"])
+    assert store.drain_changes() == (["chunk-0", "chunk-1", "chunk-2"], [])
+
+    store.add_texts(["d"], ids=["chunk-3"])
+    store.delete(["chunk-3", "chunk-0"])
+
+    # chunk-3 se añadió y borró antes de persistir: no llega al disco
+    assert store.drain_changes() == ([], ["chunk-0"])
+    assert store.drain_changes() == ([], [])
+
+
+def test_search_among_restricts_to_the_given_chunks(make_store, embeddings):
+    store = make_store(["tolueno", "acetona", "benceno", "xileno"])
+    query = embeddings.embed_query("tolueno")
+
+    found = store.similarity_search_with_score_among(query, ["chunk-1", "chunk-3"], k=4)
+
+    assert {doc.page_content for doc, _ in found} == {"acetona", "xileno"}
+    assert store.similarity_search_with_score_among(query, ["no-existe"], k=4) == []
+
+
+def test_fork_isolates_writes_from_the_original(make_store):
+    store = make_store(["tolueno", "acetona", "benceno", "xileno"])
+    store.drain_changes()
+
+    fork = store.fork()
+    fork.delete(["chunk-0", "chunk-1"])
+    fork.add_texts(["etanol"], ids=["chunk-4"])
+
+    assert [store.contains(f"chunk-{i}") for i in range(5)] == [True] * 4 + [False]
+    assert store.index.ntotal == 4
+    assert store.docstore.search("chunk-0").page_content == "tolueno"
+    assert store.drain_changes() == ([], [])
+    assert fork.drain_changes() == (["chunk-4"], ["chunk-0", "chunk-1"])
+    assert sorted(fork.index_to_docstore_id.values()) == ["chunk-2", "chunk-3", "chunk-4"]
@@ -0,0 +1,70 @@
+import pytest
+
+from app.services.metadata_index import MetadataIndex, normalize_value, parse_filters
+
+
+DOCUMENTS = {
+    "fds_tolueno": {
+        "file_name": "tolueno.pdf",
+        "metadata": {"chemical_names": "Tolueno, CAS:108-88-3", "document_type": "FDS"},
+    },
+    "fds_mercurio": {
+        "file_name": "mercurio.pdf",
+        "metadata": {"chemical_names": "Mercurio, Hg", "document_type": "SDS"},
+    },
+    "ley_uy": {
+        "file_name": "decreto.pdf",
+        "metadata": {"document_type": "legal", "country": "Uruguay"},
+    },
+}
+
+
+def test_normalize_value_ignores_case_accents_and_spacing():
+    assert normalize_value("  Ácido   SULFÚRICO ") == "acido sulfurico"
+    assert normalize_value(108) == "108"
+
+
+def test_parse_filters_normalizes_values_into_sets():
+    assert parse_filters({"chemical_names": ["Tolueno", "ETANOL"], "pais": "Perú"}) == {
+        "chemical_names": {"tolueno", "etanol"},
+        "pais": {"peru"},
+    }
+    assert parse_filters({}) is None
+    assert parse_filters(None) is None
+
+
+@pytest.mark.parametrize(
+    "filters", [["tolueno"], {"chemical_names": []}, {"chemical_names": [{"a": 1}]}]
+)
+def test_parse_filters_rejects_invalid_values(filters):
+    with pytest.raises(ValueError):
+        parse_filters(filters)
+
+
+def test_comma_separated_values_match_each_element():
+    index = MetadataIndex.from_documents(DOCUMENTS)
+
+    assert index.match(parse_filters({"chemical_names": "tolueno"})) == {"fds_tolueno"}
+    assert index.match(parse_filters({"chemical_names": "cas:108-88-3"})) == {"fds_tolueno"}
+    assert index.match(parse_filters({"chemical_names": "Mercurio, Hg"})) == {"fds_mercurio"}
+
+
+def test_values_are_or_within_a_field_and_and_across_fields():
+    index = MetadataIndex.from_documents(DOCUMENTS)
+
+    assert index.match(parse_filters({"document_type": ["fds", "sds"]})) == {
+        "fds_tolueno",
+        "fds_mercurio",
+    }
+    assert index.match(
+        parse_filters({"document_type": ["FDS", "SDS"], "chemical_names": "hg"})
+    ) == {"fds_mercurio"}
+    assert index.match(parse_filters({"document_type": "legal", "country": "chile"})) == set()
+
+
+def test_document_fields_are_filterable():
+    index = MetadataIndex.from_documents(DOCUMENTS)
+
+    assert index.match(parse_filters({"file_name": "DECRETO.pdf"})) == {"ley_uy"}
+    assert index.match(parse_filters({"document_id": "fds_tolueno"})) == {"fds_tolueno"}
+    assert index.get_stats()["document_type"] == 3
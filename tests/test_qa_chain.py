@@ -0,0 +1,49 @@
+from typing import List
+
+from langchain.chat_models.fake import FakeListChatModel
+from langchain.schema import Document
+
+from app.services import qa_chain
+from app.services.qa_chain import QAChainProvider
+
+
+class RecordingChatModel(FakeListChatModel):
+    """Modelo de chat falso que guarda el prompt recibido en cada llamada"""
+
+    prompts: List[str] = []
+
+    def _call(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._call(messages, *args, **kwargs)
+
+    def _stream(self, messages, *args, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._stream(messages, *args, **kwargs)
+
+
+def make_provider(monkeypatch):
+    model = RecordingChatModel(responses=["Usar guantes de nitrilo."])
+    monkeypatch.setattr(qa_chain, "ChatGoogleGenerativeAI", lambda **kwargs: model)
+    return QAChainProvider(api_key="test"), model
+
+
+def test_stream_sends_the_same_prompt_as_invoke(monkeypatch):
+    provider, model = make_provider(monkeypatch)
+    docs = [Document(page_content="Tolueno: CAS 108-88-3"), Document(page_content="EPI: guantes")]
+
+    answer = provider.invoke("gemini-pro", 0.2, docs, "¿Qué guantes?")
+    streamed = "".join(provider.stream("gemini-pro", 0.2, docs, "¿Qué guantes?"))
+
+    assert streamed == answer
+    assert model.prompts[0] == model.prompts[1]
+    assert "Tolueno: CAS 108-88-3\n\nEPI: guantes" in model.prompts[1]
+
+
+def test_chain_is_built_once_per_configuration(monkeypatch):
+    provider, _ = make_provider(monkeypatch)
+
+    first = provider.get("gemini-pro", 0.2)
+
+    assert provider.get("gemini-pro", 0.2) is first
+    assert provider.get("gemini-pro", 0.5) is not first
+    assert provider.get_stats()["chains"] == provider.get_stats()["builds"] == 2
@@ -0,0 +1,65 @@
+import time
+
+from app.services.query_cache import TTLCache
+
+
+def test_get_after_put_counts_hits_and_saved_time():
+    cache = TTLCache(max_entries=4, ttl_seconds=60)
+    cache.put("tolueno", [0.1, 0.2], cost_seconds=0.5)
+
+    assert cache.get("tolueno") == [0.1, 0.2]
+    assert cache.get("etanol") is None
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+    assert stats["saved_ms"] == 500.0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.evictions == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = TTLCache(max_entries=2, ttl_seconds=0.05)
+    cache.put("a", 1)
+
+    time.sleep(0.1)
+
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+
+def test_non_positive_ttl_never_expires():
+    cache = TTLCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", 1)
+
+    assert cache.get("a") == 1
+
+
+def test_zero_entries_disables_the_cache():
+    cache = TTLCache(max_entries=0)
+    cache.put("a", 1)
+
+    assert not cache.enabled
+    assert cache.get("a") is None
+    assert cache.get_stats()["misses"] == 0
+
+
+def test_clear_keeps_counters():
+    cache = TTLCache(max_entries=2)
+    cache.put("a", 1)
+    cache.get("a")
+
+    cache.clear()
+
+    assert cache.get("a") is None
+    assert cache.get_stats()["entries"] == 0
+    assert cache.hits == 1
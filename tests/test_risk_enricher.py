@@ -0,0 +1,72 @@
+import pytest
+
+# risk_enricher importa el cliente global de Gemini (Pillow y google-genai)
+pytest.importorskip("PIL")
+pytest.importorskip("google.genai")
+
+from app.services.risk_enricher import RiskDataEnricher  # noqa: E402
+
+
+@pytest.fixture
+def enricher():
+    return RiskDataEnricher(model=object(), db_client=False, cache=False)
+
+
+def test_critical_h_phrase_marks_the_chemical_as_high_risk(enricher):
+    resumen = enricher._resumen_criticidad(
+        [
+            {
+                "nombre_quimico": "Metanol",
+                "frases_h": ["H225", "H301 + H311 + H331", "H370"],
+                "epp_respiratoria": "Filtro AX",
+                "epp_manos": "Guantes de butilo",
+            },
+            {
+                "nombre_quimico": "Acetona",
+                "frases_h": ["H225", "H319"],
+                "epp_manos": "Guantes de butilo",
+            },
+        ]
+    )
+
+    assert resumen == {
+        "nivel_riesgo_general": "ALTO",
+        "quimicos_mas_peligrosos": ["Metanol"],
+        "medidas_criticas_inmediatas": [
+            "Metanol: Filtro AX",
+            "Metanol: Guantes de butilo",
+        ],
+    }
+
+
+def test_only_non_critical_phrases_give_medium_risk(enricher):
+    resumen = enricher._resumen_criticidad(
+        [
+            {
+                "nombre_quimico": "Acetona",
+                "frases_h": "H225, H319",
+                "ventilacion_requerida": " Extracción localizada ",
+            },
+            {"nombre_quimico": "Agua", "frases_h": []},
+        ]
+    )
+
+    assert resumen["nivel_riesgo_general"] == "MEDIO"
+    assert resumen["quimicos_mas_peligrosos"] == ["Acetona"]
+    assert resumen["medidas_criticas_inmediatas"] == ["Acetona: Extracción localizada"]
+
+
+def test_failed_chemicals_are_reported_without_data(enricher):
+    resumen = enricher._resumen_criticidad(
+        [
+            {"nombre_quimico": "Agua", "frases_h": []},
+            {"nombre_quimico": "Tolueno", "error": "Respuesta no válida del LLM"},
+        ]
+    )
+
+    assert resumen == {
+        "nivel_riesgo_general": "BAJO",
+        "quimicos_mas_peligrosos": [],
+        "medidas_criticas_inmediatas": [],
+        "quimicos_sin_datos": ["Tolueno"],
+    }
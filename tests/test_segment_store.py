@@ -0,0 +1,199 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from app.services.segment_store import MANIFEST_FILE, SegmentStore
+
+
+def commit_changes(segments, store, documents):
+    added, deleted = store.drain_changes()
+    return segments.commit(store, added, deleted, documents)
+
+
+def chunk_texts(store):
+    return sorted(
+        store.docstore.search(docstore_id).page_content
+        for docstore_id in store.index_to_docstore_id.values()
+    )
+
+
+def test_commit_and_load_round_trip(tmp_path, make_store, embeddings):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona"])
+
+    seq = commit_changes(segments, store, {"doc": {"file_name": "tolueno.pdf"}})
+
+    assert seq == 1
+    assert sorted(os.listdir(tmp_path)) == [
+        MANIFEST_FILE,
+        "commit-00000001.json",
+        "seg-00000001.jsonl",
+        "seg-00000001.npy",
+    ]
+    loaded, documents = SegmentStore(str(tmp_path)).load(embeddings)
+    assert documents == {"doc": {"file_name": "tolueno.pdf"}}
+    assert chunk_texts(loaded) == ["acetona", "tolueno"]
+    np.testing.assert_allclose(
+        loaded.get_vectors(["chunk-0", "chunk-1"]), store.get_vectors(["chunk-0", "chunk-1"])
+    )
+    assert loaded.drain_changes() == ([], [])
+
+
+def test_log_replays_deletions_and_removed_documents(tmp_path, make_store, embeddings):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona", "benceno"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 3}})
+
+    store.delete(["chunk-1"])
+    store.add_texts(["xileno"], metadatas=[{"document_id": "doc2"}], ids=["doc2-0"])
+    commit_changes(segments, store, {"doc": None, "doc2": {"total_chunks": 1}})
+
+    loaded, documents = SegmentStore(str(tmp_path)).load(embeddings)
+    assert documents == {"doc2": {"total_chunks": 1}}
+    assert chunk_texts(loaded) == ["benceno", "tolueno", "xileno"]
+    assert not loaded.contains("chunk-1")
+    # Al cargar se compactan los tombstones del log
+    assert loaded.tombstone_count == 0
+
+
+def test_recover_discards_files_not_in_the_manifest(tmp_path, make_store, embeddings):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 1}})
+
+    # Restos de una confirmación interrumpida antes de instalar el manifiesto
+    for name in ("seg-00000002.npy", "seg-00000002.jsonl", "commit-00000002.json"):
+        (tmp_path / name).write_bytes(b"incompleto")
+    (tmp_path / f"{MANIFEST_FILE}.tmp").write_text("{")
+    (tmp_path / "notas.txt").write_text("no gestionado")
+
+    reopened = SegmentStore(str(tmp_path))
+    reopened.recover()
+
+    assert sorted(os.listdir(tmp_path)) == [
+        MANIFEST_FILE,
+        "commit-00000001.json",
+        "notas.txt",
+        "seg-00000001.jsonl",
+        "seg-00000001.npy",
+    ]
+    assert reopened.seq == 1
+    loaded, documents = reopened.load(embeddings)
+    assert chunk_texts(loaded) == ["tolueno"]
+    assert documents == {"doc": {"total_chunks": 1}}
+
+
+def test_recover_removes_legacy_files_once_migrated(tmp_path, make_store):
+    segments = SegmentStore(str(tmp_path))
+    commit_changes(segments, make_store(["tolueno"]), {})
+    (tmp_path / "index.faiss").write_bytes(b"legado")
+
+    segments.recover()
+
+    assert not (tmp_path / "index.faiss").exists()
+
+
+def test_empty_directory_has_nothing_to_load(tmp_path, embeddings):
+    segments = SegmentStore(str(tmp_path / "nuevo"))
+
+    segments.recover()
+
+    assert not segments.exists()
+    assert segments.load(embeddings) == (None, {})
+
+
+def test_checkpoint_replaces_the_log(tmp_path, make_store, embeddings):
+    segments = SegmentStore(str(tmp_path), compaction_log_entries=2)
+    store = make_store(["tolueno", "acetona", "benceno"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 3}})
+    store.delete(["chunk-0"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 2}})
+    assert segments.needs_compaction()
+
+    base = segments.checkpoint(store, {"doc": {"total_chunks": 2}})
+
+    assert base["seq"] == 2 and base["count"] == 2
+    assert segments.manifest["log"] == []
+    assert not segments.needs_compaction()
+    assert not any(name.startswith(("seg-", "commit-")) for name in os.listdir(tmp_path))
+
+    loaded, documents = SegmentStore(str(tmp_path)).load(embeddings)
+    assert chunk_texts(loaded) == ["acetona", "benceno"]
+    assert documents == {"doc": {"total_chunks": 2}}
+
+
+def test_checkpoint_base_is_memory_mapped_with_a_sqlite_docstore(tmp_path, make_store, embeddings):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 2}})
+
+    base = segments.checkpoint(store, {"doc": {"total_chunks": 2}})
+
+    with open(tmp_path / MANIFEST_FILE, encoding="utf-8") as f:
+        assert json.load(f)["base"]["chunks"] == base["chunks"] == "base-00000001.sqlite3"
+    loaded, _ = SegmentStore(str(tmp_path)).load(embeddings)
+    assert isinstance(loaded.index.base_vectors, np.memmap)
+    assert loaded.docstore.search("chunk-1").page_content == "acetona"
+
+
+def test_commits_after_a_checkpoint_are_replayed_over_the_base(
+    tmp_path, make_store, embeddings
+):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona"])
+    commit_changes(segments, store, {"doc": {"total_chunks": 2}})
+    segments.checkpoint(store, {"doc": {"total_chunks": 2}})
+    store, _ = SegmentStore(str(tmp_path)).load(embeddings)
+
+    store.delete(["chunk-0"])
+    store.add_texts(["xileno"], ids=["doc2-0"])
+    commit_changes(segments, store, {"doc2": {"total_chunks": 1}})
+
+    loaded, documents = SegmentStore(str(tmp_path)).load(embeddings)
+    assert chunk_texts(loaded) == ["acetona", "xileno"]
+    assert set(documents) == {"doc", "doc2"}
+    # Los borrados sobre la base mapeada quedan como tombstones hasta el próximo checkpoint
+    assert loaded.tombstone_count == 1
+
+
+def test_fork_of_a_mapped_store_shares_the_base_and_copies_the_delta(
+    tmp_path, make_store, embeddings
+):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona"])
+    commit_changes(segments, store, {})
+    segments.checkpoint(store, {})
+    loaded, _ = SegmentStore(str(tmp_path)).load(embeddings)
+
+    fork = loaded.fork()
+    fork.add_texts(["xileno"], ids=["chunk-2"])
+    fork.delete(["chunk-0"])
+
+    assert fork.index.base_vectors is loaded.index.base_vectors
+    assert loaded.index.delta.ntotal == 0
+    assert chunk_texts(loaded) == ["acetona", "tolueno"]
+    assert chunk_texts(fork) == ["acetona", "xileno"]
+
+
+def test_old_snapshot_still_reads_its_base_after_the_next_checkpoint(
+    tmp_path, make_store, embeddings
+):
+    segments = SegmentStore(str(tmp_path))
+    store = make_store(["tolueno", "acetona"])
+    commit_changes(segments, store, {})
+    segments.checkpoint(store, {})
+    old, _ = segments.load(embeddings)
+
+    fresh = old.fork()
+    fresh.add_texts(["xileno"], ids=["chunk-2"])
+    commit_changes(segments, fresh, {})
+    segments.checkpoint(fresh, {})
+    assert "base-00000001.sqlite3" not in os.listdir(tmp_path)
+
+    found = []
+    reader = threading.Thread(target=lambda: found.append(old.docstore.search("chunk-1")))
+    reader.start()
+    reader.join()
+    assert found[0].page_content == "acetona"
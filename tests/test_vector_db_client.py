@@ -0,0 +1,23 @@
+from app.services.vector_db_client import FAISSVectorClient
+
+
+def test_translate_filter_maps_enricher_fields_and_type_aliases():
+    translated = FAISSVectorClient.translate_filter(
+        {"quimico": "Tolueno", "tipo_archivo": "FDS", "pais": "Uruguay"}
+    )
+
+    assert translated == {
+        "chemical_names": "Tolueno",
+        "document_type": ["FDS", "SDS"],
+        "country": "Uruguay",
+    }
+
+
+def test_translate_filter_keeps_unknown_fields_and_types():
+    assert FAISSVectorClient.translate_filter(
+        {"tipo_archivo": ["legal", "manual"], "file_name": "x.pdf"}
+    ) == {
+        "document_type": ["legal", "ley", "normativa", "reglamento", "decreto", "manual"],
+        "file_name": "x.pdf",
+    }
+    assert FAISSVectorClient.translate_filter(None) is None
@@ -25,6 +25,34 @@ errores=0
 # Directorio de PDFs
 pdf_dir="docs_rag"
 
+# Trabajos de ingesta encolados ("job_id|archivo")
+jobs=()
+
+# Esperar a que termine un trabajo de ingesta y mostrar su resultado
+wait_for_job() {
+    local job_id="$1"
+    local filename="$2"
+
+    while true; do
+        job=$(curl -s "http://localhost:5001/api/rag-faiss/jobs/$job_id")
+        status=$(echo "$job" | python3 -c 'import json, sys; print(json.load(sys.stdin)["job"]["status"])' 2>/dev/null)
+        case "$status" in
+            succeeded)
+                exitosos=$((exitosos + 1))
+                summary=$(echo "$job" | python3 -c 'import json, sys; r = json.load(sys.stdin)["job"]["result"]; print(r["total_chunks"], "chunks,", r["total_tokens"], "tokens")')
+                echo "   ✅ $filename: $summary"
+                return
+                ;;
+            failed|"")
+                errores=$((errores + 1))
+                echo "   ❌ $filename: $job"
+                return
+                ;;
+        esac
+        sleep 2
+    done
+}
+
 # Función para subir un documento con metadatos
 upload_document() {
     local file_path="$1"
@@ -71,15 +99,13 @@ upload_document() {
         cmd="$cmd -F \"expiry_date=$expiry_date\""
     fi
 
-    # Ejecutar comando
+    # Ejecutar comando: la ingesta se encola y devuelve un job_id al instante
     response=$(eval $cmd)
+    job_id=$(echo "$response" | python3 -c 'import json, sys; print(json.load(sys.stdin).get("job_id", ""))' 2>/dev/null)
 
-    # Verificar si fue exitoso
-    if echo "$response" | grep -q '"status": "success"'; then
-        exitosos=$((exitosos + 1))
-        chunks=$(echo "$response" | grep -o '"total_chunks": [0-9]*' | grep -o '[0-9]*' | head -1)
-        tokens=$(echo "$response" | grep -o '"total_tokens": [0-9]*' | grep -o '[0-9]*' | head -1)
-        echo "   ✅ Éxito: $chunks chunks, $tokens tokens"
+    if [ -n "$job_id" ]; then
+        jobs+=("$job_id|$filename")
+        echo "   ⏳ Encolado: trabajo $job_id"
     else
         errores=$((errores + 1))
         echo "   ❌ Error: $response"
@@ -372,6 +398,13 @@ upload_document \
     "Instalación Industrial" \
     "Por determinar"
 
+# Esperar a que la cola procese todos los trabajos
+echo "⏳ Esperando a que terminen ${#jobs[@]} trabajos de ingesta..."
+for entry in "${jobs[@]}"; do
+    wait_for_job "${entry%%|*}" "${entry#*|}"
+done
+echo ""
+
 # Resumen final
 echo "========================================================================"
 echo "📊 RESUMEN DE INGESTA DE DOCUMENTOS:"